@@ -1,7 +1,17 @@
 from flask import Flask
 from flask_jwt_extended import JWTManager
-from .database import init_db
+from .database import init_db, connect, connection_pragmas, get_shard_router
+from .sharding import init_shards
+from .group_commit import init_group_commit
+from .replicas import init_replicas
 from .routes import bp as routes_bp
+from .rollup import rollup_cli
+from .cache import create_response_cache
+from .recurrence import RecurrenceScheduler
+from .hashing import init_hashing
+from .instrumentation import init_instrumentation
+from .metrics import init_metrics
+from .serialization import init_serialization
 from config import DevelopmentConfig, TestingConfig, ProductionConfig
 import os
 
@@ -24,7 +34,30 @@ def create_app(config_class=None):
 
     with app.app_context():
         init_db(app)
+    init_shards(app)
+    init_group_commit(app)
+    init_replicas(app)
+
+    app.extensions['response_cache'] = create_response_cache(app.config)
+    init_hashing(app)
+    init_serialization(app)
+    init_instrumentation(app)
+
+    if app.config['RECURRENCE_SCHEDULER_ENABLED'] and app.config['RECURRENCE_MODE'] == 'materialized':
+        router = get_shard_router(app)
+        if router is None:
+            connectors = [lambda: connect(app.config['DATABASE_URL'], connection_pragmas(app.config))]
+        else:
+            connectors = [lambda index=index: router.connect(index) for index in range(len(router))]
+        # One scheduler per database holding expenses.
+        schedulers = [RecurrenceScheduler(connector, app.config['RECURRENCE_INTERVAL'], app.config['RECURRENCE_BATCH_SIZE'])
+                      for connector in connectors]
+        for scheduler in schedulers:
+            scheduler.start()
+        app.extensions['recurrence_schedulers'] = schedulers
 
     app.register_blueprint(routes_bp)
+    init_metrics(app)
+    app.cli.add_command(rollup_cli)
 
     return app
\ No newline at end of file
@@ -0,0 +1,154 @@
+import asyncio
+import io
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+class DatabaseExecutor:
+    """
+    The fixed set of threads AsgiApp runs requests on.
+
+    This is a thread-offload wrapper, not asynchronous database access: SQLite
+    has no non-blocking API, so each request runs the ordinary synchronous
+    Flask app, and its get_db() calls, on one of these threads while the event
+    loop only awaits the result.  Size it like DATABASE_POOL_SIZE: more threads
+    than connections would just wait on the pool.
+    """
+    def __init__(self, app, workers):
+        self.app = app
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='db')
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
+
+class AsgiApp:
+    """
+    Serves the Flask app over ASGI.
+
+    The event loop accepts and parses every connection, and each request runs the
+    ordinary WSGI app on the DatabaseExecutor's threads.  Thousands of open
+    connections then cost a coroutine each instead of a thread each, and at most
+    `workers` requests use SQLite at a time; the rest queue without holding a
+    pooled connection or timing out on it.  Response bodies are sent chunk by
+    chunk, so streamed NDJSON exports stay streamed.  Request bodies are read in
+    full before Flask sees them, so one over ASGI_MAX_BODY bytes is answered
+    with 413 as soon as its size is known.
+    """
+    def __init__(self, app, executor=None):
+        self.app = app
+        self.executor = executor or DatabaseExecutor(app, app.config['ASGI_WORKERS'])
+        self.max_body = app.config['ASGI_MAX_BODY']
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        declared = dict(scope.get('headers', [])).get(b'content-length', b'')
+        if declared.isdigit() and int(declared) > self.max_body:
+            await self._too_large(send)
+            return
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            # Chunked uploads declare no length, so the running total is checked as well.
+            if len(body) > self.max_body:
+                await self._too_large(send)
+                return
+            if not message.get('more_body'):
+                break
+
+        loop = asyncio.get_running_loop()
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        await loop.run_in_executor(self.executor.pool, self._run_wsgi, wsgi_environ(scope, bytes(body)), send_from_thread)
+
+    async def _too_large(self, send):
+        body = json.dumps({'error': f'Request body larger than {self.max_body} bytes'}).encode()
+        await send({'type': 'http.response.start', 'status': 413,
+                    'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                                (b'connection', b'close')]})
+        await send({'type': 'http.response.body', 'body': body, 'more_body': False})
+
+    def _run_wsgi(self, environ, send):
+        status_headers = []
+
+        def start_response(status, headers, exc_info=None):
+            status_headers[:] = [status, headers]
+
+        def start():
+            status, headers = status_headers
+            send({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                  'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]})
+
+        result = self.app.wsgi_app(environ, start_response)
+        started = False
+        try:
+            for chunk in result:
+                if not chunk:
+                    continue
+                if not started:
+                    start()
+                    started = True
+                send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        if not started:
+            start()
+        send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+def wsgi_environ(scope, body):
+    """Builds a PEP 3333 environ from an ASGI HTTP scope and the request body."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            environ[name] = value
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    # The body is already read in full, so its length is known even for chunked uploads.
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+def create_asgi_app(config_class=None):
+    """Creates the Flask app and wraps it for an ASGI server such as uvicorn."""
+    from . import create_app
+    return AsgiApp(create_app(config_class))
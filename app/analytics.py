@@ -0,0 +1,249 @@
+"""
+Spending statistics for /reports: per-category percentiles, a trailing moving
+average of daily spending and outlier detection.
+
+A user's expenses are read straight off the cursor as (id, date_epoch,
+category, amount_cents) tuples and turned into columns: NumPy arrays when
+NumPy is installed, array.array otherwise.  With NumPy every statistic is a
+handful of whole-array operations (one sort per statistic, bincounts,
+cumulative sums); the array.array fallback computes the same numbers with
+plain loops, which is slower but still avoids building a model object per
+row.  Moving averages start from the expense_daily_totals rollup, so they
+read one row per day instead of one per expense.
+"""
+import math
+from array import array
+from datetime import datetime, timezone
+from operator import itemgetter
+
+from .models import Expense, DAY_SECONDS
+from .utils import to_epoch
+
+try:
+    import numpy
+except ImportError:  # optional: pip install numpy
+    numpy = None
+
+# Modified z-score (Iglewicz and Hoaglin): 0.6745 * (x - median) / MAD, where MAD is
+# the median absolute deviation.  Scores above 3.5 are the usual outlier cut-off.
+MAD_SCALE = 0.6745
+DEFAULT_ANOMALY_THRESHOLD = 3.5
+
+class Columns:
+    """
+    A user's expenses as parallel columns, oldest first.
+
+    Attributes:
+        ids: Expense ids (None for computed recurring occurrences), a list.
+        epochs: date_epoch per expense.
+        codes: Index into categories per expense.
+        cents: amount_cents per expense.
+        categories: Sorted category names.
+    """
+    __slots__ = ('ids', 'epochs', 'codes', 'cents', 'categories')
+
+    def __init__(self, rows):
+        # One pass per column: zip(*rows) would be several times slower on a million rows.
+        self.ids = list(map(itemgetter(0), rows))
+        self.categories = sorted(set(map(itemgetter(2), rows)))
+        code = {name: i for i, name in enumerate(self.categories)}.__getitem__
+        self.epochs = _int_column(map(itemgetter(1), rows), len(rows))
+        self.codes = _int_column(map(code, map(itemgetter(2), rows)), len(rows))
+        self.cents = _int_column(map(itemgetter(3), rows), len(rows))
+
+    def __len__(self):
+        return len(self.ids)
+
+def _int_column(values, count):
+    if numpy is not None:
+        return numpy.fromiter(values, dtype=numpy.int64, count=count)
+    return array('q', values)
+
+def load_columns(user_id, start_date=None, end_date=None, expand_recurring=False, now=None):
+    return Columns(Expense.amount_rows(user_id, start_date, end_date, expand_recurring, now))
+
+def _group_quantiles(values, codes, groups, qs):
+    # The qs-quantiles (linear interpolation, like numpy.quantile's default) of the
+    # integers values within each group, as one sequence per q.  Every group must be
+    # non-empty.  With NumPy, (code, value) pairs are packed into one int64 key so a
+    # single plain sort orders every group at once.
+    if numpy is not None:
+        values = numpy.asarray(values, dtype=numpy.int64)
+        smallest = int(values.min())
+        span = int(values.max()) - smallest + 1
+        keys = numpy.sort(codes * span + (values - smallest))
+        ordered = (keys % span + smallest).astype(numpy.float64)
+        counts = numpy.bincount(codes, minlength=groups)
+        starts = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+        result = []
+        for q in qs:
+            position = starts + q * (counts - 1)
+            low = numpy.floor(position).astype(numpy.int64)
+            high = numpy.minimum(low + 1, starts + counts - 1)
+            result.append(ordered[low] + (ordered[high] - ordered[low]) * (position - low))
+        return result
+    members = [[] for _ in range(groups)]
+    for code, value in zip(codes, values):
+        members[code].append(value)
+    for group in members:
+        group.sort()
+    result = []
+    for q in qs:
+        quantiles = []
+        for group in members:
+            position = q * (len(group) - 1)
+            low = math.floor(position)
+            high = min(low + 1, len(group) - 1)
+            quantiles.append(group[low] + (group[high] - group[low]) * (position - low))
+        result.append(quantiles)
+    return result
+
+def percentiles(columns):
+    """
+    Count, median and 90th percentile of the amounts in each category.
+
+    Returns:
+        {category: {'count': n, 'median': amount, 'p90': amount}}.
+    """
+    groups = len(columns.categories)
+    if not groups:
+        return {}
+    medians, p90s = _group_quantiles(columns.cents, columns.codes, groups, (0.5, 0.9))
+    if numpy is not None:
+        counts = numpy.bincount(columns.codes, minlength=groups).tolist()
+    else:
+        counts = [0] * groups
+        for code in columns.codes:
+            counts[code] += 1
+    return {category: {'count': counts[i], 'median': _amount(medians[i]), 'p90': _amount(p90s[i])}
+            for i, category in enumerate(columns.categories)}
+
+def moving_average(epochs, cents, first_day, days, window):
+    """
+    Daily spending and its trailing moving average.
+
+    Args:
+        epochs: Times of the amounts, covering at least the window - 1 days
+            before first_day so the first averages are over full windows.
+        cents: The amounts, per expense or already summed per day.
+        first_day: The UTC epoch of midnight of the first day to report.
+        days: The number of days to report.
+        window: The moving-average window in days, including the day itself.
+
+    Returns:
+        A list of (epoch of the day, total, average), one per day.
+    """
+    origin = first_day - (window - 1) * DAY_SECONDS
+    length = days + window - 1
+    if numpy is not None:
+        index = (numpy.asarray(epochs, dtype=numpy.int64) - origin) // DAY_SECONDS
+        inside = (index >= 0) & (index < length)
+        totals = numpy.bincount(index[inside], weights=numpy.asarray(cents, dtype=numpy.float64)[inside], minlength=length)
+        running = numpy.concatenate(([0.0], numpy.cumsum(totals)))
+        averages = (running[window:] - running[:-window]) / window
+        totals = totals[window - 1:]
+        return [(first_day + i * DAY_SECONDS, _amount(totals[i]), _amount(averages[i])) for i in range(days)]
+    totals = [0] * length
+    for epoch, amount in zip(epochs, cents):
+        i = (epoch - origin) // DAY_SECONDS
+        if 0 <= i < length:
+            totals[i] += amount
+    series = []
+    running = sum(totals[:window - 1])
+    for i in range(days):
+        running += totals[i + window - 1]
+        series.append((first_day + i * DAY_SECONDS, _amount(totals[i + window - 1]), _amount(running / window)))
+        running -= totals[i]
+    return series
+
+def daily_moving_average(user_id, start_date=None, end_date=None, window=30, max_days=None, expand_recurring=False, now=None):
+    """
+    The moving_average series for the UTC days from start_date's to end_date's.
+
+    Each day counts whole; a missing bound is the day of the user's first or
+    last expense.  The window - 1 days before the first day are read too, so
+    every average is over a full window.
+
+    Returns:
+        A list of {'day': 'YYYY-MM-DD', 'total': amount, 'average': amount}.
+
+    Raises:
+        ValueError: If the series would have more than max_days days.
+    """
+    first_day = to_epoch(start_date) // DAY_SECONDS * DAY_SECONDS if start_date else None
+    last_day = to_epoch(end_date) // DAY_SECONDS * DAY_SECONDS if end_date else None
+    load_from = _day(first_day - (window - 1) * DAY_SECONDS) if first_day is not None else None
+    load_to = _day(last_day) if last_day is not None else None
+    rows = Expense.daily_totals(user_id, load_from, load_to, expand_recurring, now)
+    if first_day is None or last_day is None:
+        if not rows:
+            return []
+        first_day = first_day if first_day is not None else to_epoch(rows[0][0])
+        last_day = last_day if last_day is not None else to_epoch(rows[-1][0])
+    days = (last_day - first_day) // DAY_SECONDS + 1
+    if days <= 0:
+        return []
+    if max_days is not None and days > max_days:
+        raise ValueError(f'The range has more than {max_days} days.')
+    epochs = [to_epoch(day) for day, _ in rows]
+    cents = [total for _, total in rows]
+    return [{'day': _day(day), 'total': total, 'average': average}
+            for day, total, average in moving_average(epochs, cents, first_day, days, window)]
+
+def anomalies(columns, threshold=DEFAULT_ANOMALY_THRESHOLD):
+    """
+    Expenses unusually large for their category.
+
+    Each amount is scored against its category's median and median absolute
+    deviation (MAD), which a few extreme amounts cannot drag along the way they
+    would a mean and standard deviation.  Categories with a MAD of zero (most
+    amounts identical) flag nothing.
+
+    Returns:
+        (positions, scores, medians): the flagged positions in columns, oldest
+        first, their modified z-scores and the median of every category in cents.
+    """
+    groups = len(columns.categories)
+    if not groups:
+        return [], [], []
+    # Medians of integers are whole or half cents, so doubled deviations stay integers
+    # and the MAD can use the same integer sort as the medians.
+    medians, = _group_quantiles(columns.cents, columns.codes, groups, (0.5,))
+    if numpy is not None:
+        doubled = 2 * columns.cents - (2 * medians).astype(numpy.int64)[columns.codes]
+        mads, = _group_quantiles(numpy.abs(doubled), columns.codes, groups, (0.5,))
+        scale = mads[columns.codes]
+        scores = numpy.divide(MAD_SCALE * doubled, scale, out=numpy.zeros(len(columns)), where=scale > 0)
+        positions = numpy.flatnonzero(scores > threshold)
+        return positions.tolist(), scores[positions].tolist(), medians.tolist()
+    doubled = [2 * cents - int(2 * medians[code]) for code, cents in zip(columns.codes, columns.cents)]
+    mads, = _group_quantiles([abs(d) for d in doubled], columns.codes, groups, (0.5,))
+    positions, scores = [], []
+    for i, (code, deviation) in enumerate(zip(columns.codes, doubled)):
+        if mads[code] > 0:
+            score = MAD_SCALE * deviation / mads[code]
+            if score > threshold:
+                positions.append(i)
+                scores.append(score)
+    return positions, scores, medians
+
+def anomaly_dicts(columns, positions, scores, medians):
+    result = []
+    for position, score in zip(positions, scores):
+        code = int(columns.codes[position])
+        result.append({
+            'id': columns.ids[position],
+            'date': datetime.fromtimestamp(int(columns.epochs[position]), timezone.utc).isoformat(),
+            'category': columns.categories[code],
+            'amount': int(columns.cents[position]) / 100,
+            'category_median': _amount(medians[code]),
+            'score': round(score, 2),
+        })
+    return result
+
+def _amount(cents):
+    # Statistics are computed in cents and reported in currency units, rounded to the cent.
+    return round(float(cents)) / 100
+
+def _day(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).date().isoformat()
@@ -0,0 +1,146 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+class CacheBackend:
+    """
+    Storage interface for the response cache.
+
+    Backends only need get and set; expiry is their responsibility.  Keys
+    and values are strings and bytes so any shared store can hold them.
+    """
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+class LRUCache(CacheBackend):
+    """In-process cache bounded to max_entries, evicting the least recently used key."""
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache kept in its own SQLite file, shared by every worker process on a host.
+
+    Expired entries are ignored on read.  Every trim_every writes an instance
+    purges expired entries and, if more than max_entries remain, evicts those
+    closest to expiry, i.e. the oldest.  Between checks each process can go
+    past max_entries by at most trim_every entries.
+    """
+    def __init__(self, path, max_entries=100000, trim_every=64):
+        self.max_entries = max_entries
+        self.trim_every = trim_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous = OFF')
+        self._db.execute('CREATE TABLE IF NOT EXISTS response_cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS response_cache_expires ON response_cache (expires)')
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute('SELECT value FROM response_cache WHERE key = ? AND expires > ?', (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO response_cache (key, value, expires) VALUES (?,?,?)', (key, value, time.time() + ttl))
+            self._writes += 1
+            if self._writes % self.trim_every == 0:
+                self._trim()
+
+    def _trim(self):
+        # Counting the table is a full scan, so it only happens every trim_every writes.
+        self._db.execute('DELETE FROM response_cache WHERE expires <= ?', (time.time(),))
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            self._db.execute('''DELETE FROM response_cache WHERE key IN
+                                (SELECT key FROM response_cache ORDER BY expires LIMIT ?)''', (excess,))
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+
+class ResponseCache:
+    """Counts hits and misses in front of a CacheBackend."""
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value, self.ttl)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'entries': len(self.backend),
+            }
+
+def create_response_cache(config):
+    backend = config['RESPONSE_CACHE_BACKEND']
+    if not backend:
+        return None
+    if backend == 'memory':
+        store = LRUCache(config['RESPONSE_CACHE_MAX_ENTRIES'])
+    elif backend == 'sqlite':
+        store = SQLiteCache(config['RESPONSE_CACHE_URL'], config['RESPONSE_CACHE_MAX_ENTRIES'])
+    else:
+        raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: '{backend}'. Expected 'memory' or 'sqlite'.")
+    return ResponseCache(store, config['RESPONSE_CACHE_TTL'])
+
+def get_response_cache(app):
+    return app.extensions.get('response_cache')
+
+def response_cache_stats(app):
+    cache = get_response_cache(app)
+    return cache.stats() if cache is not None else None
@@ -1,25 +1,282 @@
+import queue
 import sqlite3
-from flask import g, current_app
+import threading
+from flask import g, current_app, jsonify
+from .migrations import migrate
 
-def get_db():
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became free within the pool timeout."""
+
+class ConnectionPool:
+    """
+    A fixed-size pool of SQLite connections shared by all request threads.
+
+    Connections are opened lazily up to size, configured once with the
+    pragmas from Config and handed out most-recently-used first, so a warm
+    page cache and prepared statement cache are reused across requests.
+    """
+    def __init__(self, database, size, timeout, pragmas=()):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = list(pragmas)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._acquired = 0
+        self._waits = 0
+        self._timeouts = 0
+
+    def acquire(self):
+        try:
+            db = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    self._waits += 1
+                    create = False
+            if create:
+                try:
+                    db = connect(self.database, self.pragmas, check_same_thread=False)
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    db = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise PoolTimeout(f'No database connection available after {self.timeout}s')
+        with self._lock:
+            self._in_use += 1
+            self._acquired += 1
+        return db
+
+    def release(self, db):
+        # Never hand a connection with a half-finished transaction to the next request.
+        if db.in_transaction:
+            db.rollback()
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(db)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'open': self._created,
+                'in_use': self._in_use,
+                'idle': self._created - self._in_use,
+                'acquired': self._acquired,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+            }
+
+def connection_pragmas(config):
+    return [
+        ('journal_mode', config['SQLITE_JOURNAL_MODE']),
+        ('synchronous', config['SQLITE_SYNCHRONOUS']),
+        ('busy_timeout', config['SQLITE_BUSY_TIMEOUT']),
+        ('cache_size', config['SQLITE_CACHE_SIZE']),
+        ('mmap_size', config['SQLITE_MMAP_SIZE']),
+    ]
+
+def connect(database, pragmas=(), **kwargs):
+    # file: URIs carry open flags, e.g. the read replicas' ?mode=ro.
+    if database.startswith('file:'):
+        kwargs.setdefault('uri', True)
+    db = sqlite3.connect(database, **kwargs)
+    db.row_factory = sqlite3.Row
+    for name, value in pragmas:
+        db.execute(f'PRAGMA {name} = {value}')
+    return db
+
+def get_pool(app=None):
+    app = app or current_app
+    return app.extensions.get('db_pool')
+
+def pool_stats(app=None):
+    pool = get_pool(app)
+    return pool.stats() if pool is not None else None
+
+def get_shard_router(app=None):
+    app = app or current_app
+    return app.extensions.get('db_shards')
+
+def _directory_connection():
     db = getattr(g, '_database', None)
     if db is None:
-        # Access DATABASE_URL through current_app.config:
-        db_url = current_app.config['DATABASE_URL']
-        db = g._database = sqlite3.connect(db_url)
-        db.row_factory = sqlite3.Row
+        pool = get_pool()
+        if pool is not None:
+            db = g._database = pool.acquire()
+        else:
+            # Access DATABASE_URL through current_app.config:
+            db_url = current_app.config['DATABASE_URL']
+            db = g._database = connect(db_url, connection_pragmas(current_app.config))
+    return db
+
+def _shard_index(router, user_id):
+    # Fixed for the request once known; the router's cache spares most requests the
+    # directory lookup (and the directory connection it would take from the pool).
+    shards = g.setdefault('_user_shards', {})
+    index = shards.get(user_id)
+    if index is None:
+        index = router.cached_shard(user_id)
+        if index is None:
+            row = _directory_connection().execute('SELECT shard FROM users WHERE id = ?', (user_id,)).fetchone()
+            if row is None:
+                index = router.placement(user_id)
+            else:
+                index = row[0]
+                router.cache_shard(user_id, index)
+        shards[user_id] = index
+    return index
+
+def _shard_connection(router, user_id):
+    index = _shard_index(router, user_id)
+    connections = g.setdefault('_shard_databases', {})
+    db = connections.get(index)
+    if db is None:
+        db = connections[index] = router.acquire(index)
     return db
 
+def _timed(db):
+    # With instrumentation on, requests see a proxy that times every statement.
+    timings = g.get('request_timings')
+    return timings.wrap(db) if timings is not None else db
+
+def _replica_connection(key, user_id):
+    # The read replica connection of this request for the database at key (a shard index,
+    # None unsharded), or None when the request must read the primary.  Decided once per
+    # request, so one response never mixes the replica with the primary.
+    replicas = current_app.extensions.get('db_replicas')
+    if replicas is None or not g.get('read_replica'):
+        return None
+    chosen = g.setdefault('_replica_databases', {})
+    if key not in chosen:
+        replica = replicas.replica_for(key, user_id)
+        chosen[key] = (replica, replica.acquire()) if replica is not None else None
+    return chosen[key][1] if chosen[key] is not None else None
+
+def get_db(user_id=None):
+    """
+    Returns the connection holding user_id's expenses.
+
+    Unsharded, that is the one DATABASE_URL database.  With DATABASE_SHARDS,
+    it is the user's shard as recorded in the users directory; user_id
+    defaults to the request's authenticated user (g.user_id), and with no
+    user at all the directory database is returned.  GET and HEAD requests
+    get a read replica instead when DATABASE_READ_MODE is set and the user
+    has no write the replica is missing (see app/replicas.py).
+    """
+    if user_id is None:
+        user_id = g.get('user_id')
+    router = get_shard_router()
+    if router is not None:
+        if user_id is not None:
+            index = _shard_index(router, user_id)
+            return _timed(_replica_connection(index, user_id) or _shard_connection(router, user_id))
+        return _timed(_directory_connection())
+    return _timed(_replica_connection(None, user_id) or _directory_connection())
+
+def get_shard_index(user_id=None):
+    """
+    Returns the position in DATABASE_SHARDS of user_id's shard (the request's
+    user by default), or None when unsharded or there is no user.
+    """
+    router = get_shard_router()
+    if router is None:
+        return None
+    if user_id is None:
+        user_id = g.get('user_id')
+    return _shard_index(router, user_id) if user_id is not None else None
+
+def get_directory_db():
+    """Returns the connection to the DATABASE_URL database, which holds the users directory."""
+    return _timed(_directory_connection())
+
+def expense_databases():
+    """
+    Yields a connection to every database holding expenses, for maintenance
+    work that spans all users: the DATABASE_URL database, or each shard in
+    turn (closed once the caller moves on).
+    """
+    router = get_shard_router()
+    if router is None:
+        yield get_db()
+        return
+    for index in range(len(router)):
+        db = router.connect(index)
+        try:
+            yield db
+        finally:
+            db.close()
+
 def close_db(e=None):
-    db = getattr(g, '_database', None)
+    db = g.pop('_database', None)
     if db is not None:
-        db.close()
+        pool = get_pool()
+        if pool is not None:
+            pool.release(db)
+        else:
+            db.close()
+    shards = g.pop('_shard_databases', None)
+    if shards:
+        router = get_shard_router()
+        for index, db in shards.items():
+            router.release(index, db)
+
+def forget_user(e=None):
+    # The authenticated user and their shard belong to one request, even when several
+    # requests share an app context (as under the test client).
+    g.pop('user_id', None)
+    g.pop('_user_shards', None)
+    g.pop('read_replica', None)
+    # Replica connections are only handed to requests, so they go back with the request.
+    replicas = g.pop('_replica_databases', None)
+    if replicas:
+        for chosen in replicas.values():
+            if chosen is not None:
+                replica, db = chosen
+                replica.release(db)
+
+def release_db():
+    # Hands a pooled connection back before slow work that needs no database (password
+    # hashing), so waiting requests do not starve the pool.  get_db() takes a new one.
+    if get_pool() is not None:
+        close_db()
+
+def handle_pool_timeout(e):
+    response = jsonify({'error': 'Database busy, try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 def init_db(app):
+    # DATABASE_POOL_SIZE = 0 keeps one private connection per app context
+    # (required for ':memory:', where every connection is a separate database).
+    if app.config['DATABASE_POOL_SIZE'] and get_pool(app) is None:
+        app.extensions['db_pool'] = ConnectionPool(app.config['DATABASE_URL'], app.config['DATABASE_POOL_SIZE'],
+                                                   app.config['DATABASE_POOL_TIMEOUT'], connection_pragmas(app.config))
+    app.teardown_appcontext(close_db)
+    app.teardown_request(forget_user)
+    app.register_error_handler(PoolTimeout, handle_pool_timeout)
+
     with app.app_context():
         db = get_db()
-        with app.open_resource('../schema.sql', mode='r') as f:
-            db.cursor().executescript(f.read())
-        db.commit()
-
-    app.teardown_appcontext(close_db)
\ No newline at end of file
+        # Only applies the schema changes this database has not seen yet.
+        migrate(db)
@@ -0,0 +1,182 @@
+"""
+Group commit for expense inserts.
+
+Every POST /expenses otherwise runs its own INSERT and commit, and commits
+queue one behind the other on SQLite's write lock, each paying for its own
+WAL sync.  With GROUP_COMMIT_ENABLED, Expense.save hands new rows to a
+GroupCommitWriter instead: one thread per database that takes whatever is
+queued, waits up to GROUP_COMMIT_MAX_DELAY seconds for more (at most
+GROUP_COMMIT_MAX_BATCH rows), inserts them in one transaction and commits
+once.  The request blocks on a future until its group has committed, so the
+API still answers with the new id, and only after the row is durable.
+
+The writer opens its own connection, so group commit needs a file database;
+with ':memory:' it would write to a private, empty database.
+"""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from flask import current_app
+
+from .database import connect, connection_pragmas, get_shard_index, get_shard_router
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class GroupCommitWriter(threading.Thread):
+    """Runs queued single-row statements on its own connection, committing them in groups."""
+    def __init__(self, connect, max_batch=256, max_delay=0.002, name='group-commit-writer'):
+        super().__init__(name=name, daemon=True)
+        self.connect = connect
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._stopping = False
+        self._batches = 0
+        self._statements = 0
+        self._failed = 0
+
+    def submit(self, sql, params):
+        """
+        Queues one statement for the next group.
+
+        Returns:
+            A Future resolving to the statement's lastrowid once its group has
+            committed, or to the error that statement or the commit raised.
+        """
+        future = Future()
+        with self._lock:
+            if self._stopping:
+                raise RuntimeError('The group commit writer is stopped')
+            self._queue.put((sql, params, future))
+        return future
+
+    def execute(self, sql, params):
+        return self.submit(sql, params).result()
+
+    def run(self):
+        try:
+            db = self.connect()
+            try:
+                stopping = False
+                while not stopping:
+                    batch, stopping = self._next_batch()
+                    if batch:
+                        self._commit(db, batch)
+            finally:
+                db.close()
+        finally:
+            # Whatever ended the loop, nobody may be left waiting on a future.
+            with self._lock:
+                self._stopping = True
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    item[2].set_exception(RuntimeError('The group commit writer is stopped'))
+
+    def _next_batch(self):
+        # Blocks for the first statement, then takes what else is queued, waiting up to
+        # max_delay for more while the group is short.  Under load the queue refills
+        # while the previous group commits, so groups grow without any waiting.
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _commit(self, db, batch):
+        results = []
+        try:
+            with db:
+                db.execute('BEGIN IMMEDIATE')
+                for sql, params, future in batch:
+                    # A failing statement is rolled back on its own; the rest of the group commits.
+                    try:
+                        results.append((future, db.execute(sql, params).lastrowid, None))
+                    except sqlite3.Error as e:
+                        results.append((future, None, e))
+        except Exception as e:
+            logger.exception('Group commit of %d statements failed', len(batch))
+            with self._lock:
+                self._failed += len(batch)
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        with self._lock:
+            self._batches += 1
+            self._statements += len(batch)
+        for future, rowid, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(rowid)
+
+    def stop(self, timeout=None):
+        # Statements queued before stop() still commit.
+        with self._lock:
+            if self._stopping:
+                return
+            self._stopping = True
+            self._queue.put(_STOP)
+        if self.is_alive():
+            self.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'batches': self._batches,
+                'statements': self._statements,
+                'failed': self._failed,
+            }
+
+def get_group_writer(user_id=None, app=None):
+    """Returns the writer for user_id's database, or None when group commit is off."""
+    app = app or current_app
+    writers = app.extensions.get('group_commit_writers')
+    if not writers:
+        return None
+    index = get_shard_index(user_id)
+    return writers[index if index is not None else 0]
+
+def init_group_commit(app):
+    if not app.config['GROUP_COMMIT_ENABLED'] or app.extensions.get('group_commit_writers'):
+        return
+    if app.config['DATABASE_URL'] == ':memory:':
+        raise ValueError('Group commit needs a file database, not :memory:')
+    router = get_shard_router(app)
+    if router is None:
+        connectors = [lambda: connect(app.config['DATABASE_URL'], connection_pragmas(app.config))]
+    else:
+        connectors = [lambda index=index: router.connect(index) for index in range(len(router))]
+    # One writer per database holding expenses, as each has its own write lock.
+    writers = [GroupCommitWriter(connector, app.config['GROUP_COMMIT_MAX_BATCH'], app.config['GROUP_COMMIT_MAX_DELAY'],
+                                 name=f'group-commit-writer-{index}')
+               for index, connector in enumerate(connectors)]
+    for writer in writers:
+        writer.start()
+    app.extensions['group_commit_writers'] = writers
@@ -0,0 +1,112 @@
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app, jsonify
+from werkzeug.security import generate_password_hash, check_password_hash
+
+class HashingBusy(Exception):
+    """Raised when a password hash could not start within the hashing timeout."""
+    def __init__(self, retry_after):
+        super().__init__(f'Password hashing is saturated, retry after {retry_after}s')
+        self.retry_after = retry_after
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords on a small, dedicated process pool.
+
+    scrypt and pbkdf2 are CPU-bound and hold the GIL, so run in the request
+    thread a burst of logins stalls every other endpoint.  Here at most
+    `workers` hashes run at once, each in its own process.  Further callers wait
+    up to `timeout` seconds for a slot.  A caller is turned away at once, with
+    HashingBusy, when the queue ahead of it (at the recently measured hash time)
+    already needs longer than that.  workers=0 hashes inline in the caller
+    (tests, scripts).
+    """
+    def __init__(self, method, workers, timeout):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers) if workers else None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._average = 0.0
+        self._hashed = 0
+        self._rejected = 0
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+
+        with self._lock:
+            expected_wait = (self._waiting / self.workers + 1) * self._average
+            if expected_wait > self.timeout:
+                self._rejected += 1
+                raise HashingBusy(math.ceil(expected_wait))
+            self._waiting += 1
+        try:
+            acquired = self._slots.acquire(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        if not acquired:
+            with self._lock:
+                self._rejected += 1
+            raise HashingBusy(math.ceil(self.timeout))
+
+        try:
+            start = time.monotonic()
+            result = self._get_executor().submit(fn, *args).result()
+            elapsed = time.monotonic() - start
+            with self._lock:
+                # Moving average, so the estimate follows the configured cost and current load.
+                self._average = elapsed if not self._hashed else 0.8 * self._average + 0.2 * elapsed
+                self._hashed += 1
+            return result
+        finally:
+            self._slots.release()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: forking a process full of request threads can copy held locks.
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'waiting': self._waiting,
+                'hashed': self._hashed,
+                'rejected': self._rejected,
+                'average_seconds': round(self._average, 4),
+            }
+
+def get_password_hasher(app=None):
+    app = app or current_app
+    return app.extensions.get('password_hasher')
+
+def handle_hashing_busy(e):
+    response = jsonify({'error': 'Too many login requests, try again shortly'})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
+def init_hashing(app):
+    app.extensions['password_hasher'] = PasswordHasher(app.config['PASSWORD_HASH_METHOD'], app.config['PASSWORD_HASH_WORKERS'],
+                                                       app.config['PASSWORD_HASH_TIMEOUT'])
+    app.register_error_handler(HashingBusy, handle_hashing_busy)
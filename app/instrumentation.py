@@ -0,0 +1,290 @@
+import atexit
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from flask import Blueprint, Response, current_app, g, jsonify, request
+from flask.json.provider import DefaultJSONProvider
+from .metrics import require_metrics_token
+
+# Upper bounds, in milliseconds, of the histogram buckets; the last one catches everything slower.
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float('inf'))
+PHASES = ('sql', 'serialize', 'app', 'total')
+
+bp = Blueprint('instrumentation', __name__)
+bp.before_request(require_metrics_token)
+
+class RequestTimings:
+    """
+    Where one request spent its time.
+
+    sql is the time spent inside SQLite (execute and fetch calls on the
+    connection from get_db), serialize the time spent encoding JSON bodies, and
+    app whatever remains of total: routing, JWT checks, building model objects.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql = 0.0
+        self.queries = 0
+        self.serialize = 0.0
+        self.total = None
+        self._connection = None
+
+    def wrap(self, db):
+        # One wrapper per connection; release_db() can swap the connection mid-request.
+        if self._connection is None or self._connection.raw is not db:
+            self._connection = TimedConnection(db, self)
+        return self._connection
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+        return self
+
+    def phases(self):
+        """Seconds per phase, with total measured up to now if the request has not finished."""
+        total = self.total if self.total is not None else time.perf_counter() - self.start
+        return {'sql': self.sql, 'serialize': self.serialize,
+                'app': max(0.0, total - self.sql - self.serialize), 'total': total}
+
+    def server_timing(self):
+        phases = self.phases()
+        return ', '.join([f'sql;dur={phases["sql"] * 1000:.2f};desc="{self.queries} queries"',
+                          f'serialize;dur={phases["serialize"] * 1000:.2f}',
+                          f'app;dur={phases["app"] * 1000:.2f}',
+                          f'total;dur={phases["total"] * 1000:.2f}'])
+
+class TimedConnection:
+    """
+    Proxy for a sqlite3 connection that adds the time of every statement, and
+    of fetching its rows, to a RequestTimings.  Everything else is passed through.
+    """
+    def __init__(self, db, timings):
+        self.raw = db
+        self._timings = timings
+
+    def execute(self, *args):
+        return self._timed(self.raw.execute, args)
+
+    def executemany(self, *args):
+        return self._timed(self.raw.executemany, args)
+
+    def cursor(self, *args):
+        return TimedCursor(self.raw.cursor(*args), self._timings)
+
+    def _timed(self, method, args):
+        start = time.perf_counter()
+        try:
+            return TimedCursor(method(*args), self._timings)
+        finally:
+            self._timings.sql += time.perf_counter() - start
+            self._timings.queries += 1
+
+    def __enter__(self):
+        self.raw.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.raw.__exit__(*exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+class TimedCursor:
+    """Proxy for a sqlite3 cursor; SQLite steps through rows as they are fetched, so fetches count as SQL time."""
+    def __init__(self, cursor, timings):
+        object.__setattr__(self, 'raw', cursor)
+        object.__setattr__(self, '_timings', timings)
+
+    def __setattr__(self, name, value):
+        # e.g. cursor.row_factory = None must reach the real cursor.
+        setattr(self.raw, name, value)
+
+    def execute(self, *args):
+        return self._timed(self.raw.execute, args, statement=True)
+
+    def executemany(self, *args):
+        return self._timed(self.raw.executemany, args, statement=True)
+
+    def fetchone(self):
+        return self._timed(self.raw.fetchone, ())
+
+    def fetchmany(self, *args):
+        return self._timed(self.raw.fetchmany, args)
+
+    def fetchall(self):
+        return self._timed(self.raw.fetchall, ())
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self._timed(self.raw.__next__, ())
+
+    def _timed(self, method, args, statement=False):
+        start = time.perf_counter()
+        try:
+            result = method(*args)
+        finally:
+            self._timings.sql += time.perf_counter() - start
+            if statement:
+                self._timings.queries += 1
+        return self if result is self.raw else result
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, adding the time spent encoding to the current request's timings."""
+    def dumps(self, obj, **kwargs):
+        timings = g.get('request_timings')
+        if timings is None:
+            return super().dumps(obj, **kwargs)
+        start = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            timings.serialize += time.perf_counter() - start
+
+class Histograms:
+    """Latency histograms per route and phase, with BUCKETS_MS bounds, plus request counts and sums."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def observe(self, route, phases):
+        with self._lock:
+            entry = self._routes.get(route)
+            if entry is None:
+                entry = self._routes[route] = {'count': 0, 'phases': {phase: {'buckets': [0] * len(BUCKETS_MS), 'sum_ms': 0.0}
+                                                                      for phase in PHASES}}
+            entry['count'] += 1
+            for phase in PHASES:
+                ms = phases[phase] * 1000
+                histogram = entry['phases'][phase]
+                histogram['sum_ms'] += ms
+                histogram['buckets'][bisect.bisect_left(BUCKETS_MS, ms)] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {route: {'count': entry['count'],
+                            'phases': {phase: {'buckets': list(histogram['buckets']), 'sum_ms': round(histogram['sum_ms'], 3)}
+                                       for phase, histogram in entry['phases'].items()}}
+                    for route, entry in self._routes.items()}
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of threads that are serving a request.
+
+    Every interval seconds a background thread reads sys._current_frames() for
+    the threads between before_request and teardown_request and counts each
+    stack, rooted at the request's route.  collapsed() renders the counts in the
+    folded format ("frame;frame;frame count") that flamegraph.pl, speedscope and
+    similar tools read.  Request threads only register and unregister themselves.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = Counter()
+        self._active = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enter(self, route):
+        self._active[threading.get_ident()] = route
+
+    def exit(self):
+        self._active.pop(threading.get_ident(), None)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        frames = sys._current_frames()
+        for ident, route in list(self._active.items()):
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            stack.append(route)
+            with self._lock:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        with self._lock:
+            return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            f.write(self.collapsed())
+
+def route_name():
+    rule = request.url_rule
+    return f'{request.method} {rule.rule if rule is not None else "<unmatched>"}'
+
+def start_timing():
+    g.request_timings = RequestTimings()
+    profiler = current_app.extensions.get('profiler')
+    if profiler is not None:
+        profiler.enter(route_name())
+
+def add_server_timing(response):
+    timings = g.get('request_timings')
+    if timings is not None:
+        response.headers['Server-Timing'] = timings.server_timing()
+    return response
+
+def record_timing(e=None):
+    # Runs once the response, streamed or not, is complete, so streamed exports count in full.
+    timings = g.pop('request_timings', None)
+    if timings is not None:
+        current_app.extensions['request_histograms'].observe(route_name(), timings.finish().phases())
+    profiler = current_app.extensions.get('profiler')
+    if profiler is not None:
+        profiler.exit()
+
+@bp.route('/metrics/timings', methods=['GET'])
+def timings():
+    return jsonify({'buckets_ms': [bound if bound != float('inf') else '+Inf' for bound in BUCKETS_MS],
+                    'routes': current_app.extensions['request_histograms'].snapshot()}), 200
+
+@bp.route('/metrics/profile', methods=['GET'])
+def profile():
+    profiler = current_app.extensions.get('profiler')
+    if profiler is None:
+        return jsonify({'error': 'The sampling profiler is not enabled'}), 404
+    return Response(profiler.collapsed(), mimetype='text/plain')
+
+def init_instrumentation(app):
+    # Nothing is hooked in unless enabled, so the default request path pays nothing.
+    if not app.config['INSTRUMENTATION_ENABLED']:
+        return
+    app.extensions['request_histograms'] = Histograms()
+    app.json = TimedJSONProvider(app)
+    app.before_request(start_timing)
+    app.after_request(add_server_timing)
+    app.teardown_request(record_timing)
+    if app.config['PROFILER_INTERVAL']:
+        profiler = app.extensions['profiler'] = SamplingProfiler(app.config['PROFILER_INTERVAL'])
+        profiler.start()
+        if app.config['PROFILER_OUTPUT']:
+            atexit.register(profiler.dump, app.config['PROFILER_OUTPUT'])
+    # The aggregates expose route names and stacks, so they are served only with the
+    # rest of the monitoring endpoints, behind the same METRICS_TOKEN check.
+    if app.config['METRICS_ENABLED']:
+        app.register_blueprint(bp)
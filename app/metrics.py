@@ -0,0 +1,240 @@
+import bisect
+import hmac
+import threading
+import time
+from flask import Blueprint, Response, current_app, jsonify, request
+from .cache import response_cache_stats
+from .database import get_shard_router, pool_stats
+
+# Upper bounds, in seconds, of the request latency histogram buckets.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+bp = Blueprint('metrics', __name__)
+
+def require_metrics_token():
+    # With METRICS_TOKEN set, the monitoring endpoints want it as a bearer token; they
+    # expose route names, error rates and internal queue depths.
+    token = current_app.config['METRICS_TOKEN']
+    if not token:
+        return None
+    scheme, _, given = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(given.encode(), token.encode()):
+        response = jsonify({'error': 'A valid metrics token is required'})
+        response.headers['WWW-Authenticate'] = 'Bearer realm="metrics"'
+        return response, 401
+    return None
+
+bp.before_request(require_metrics_token)
+
+class ThreadMetrics:
+    """
+    Request counts and latency histograms recorded by a single thread.
+
+    Only the owning thread writes to it, so recording needs no lock; readers
+    copy the dicts, which the GIL makes atomic.
+    """
+    __slots__ = ('thread', 'current', 'started', 'finished', 'requests', 'durations')
+
+    def __init__(self, thread=None):
+        self.thread = thread
+        self.current = None  # [method, route, status, start] of the request being served
+        self.started = 0
+        self.finished = 0
+        self.requests = {}   # (method, route, status) -> count
+        self.durations = {}  # (method, route) -> bucket counts, with the sum of seconds last
+
+    def merge(self, other):
+        self.started += other.started
+        self.finished += other.finished
+        for key, count in other.requests.copy().items():
+            self.requests[key] = self.requests.get(key, 0) + count
+        for key, histogram in other.durations.copy().items():
+            mine = self.durations.setdefault(key, [0] * (len(BUCKETS) + 1))
+            for index, value in enumerate(list(histogram)):
+                mine[index] += value
+
+class RequestMetrics:
+    """
+    Per-route request counters, latency histograms and the in-flight gauge.
+
+    Each thread records into its own ThreadMetrics, so the request path takes
+    no lock after a thread's first request.  collect() adds them up, folding the
+    counts of threads that have exited (the threaded dev server starts one per
+    connection) into a retired total so the list of threads stays short.
+    """
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._retired = ThreadMetrics()
+
+    def _thread_metrics(self):
+        try:
+            return self._local.metrics
+        except AttributeError:
+            metrics = self._local.metrics = ThreadMetrics(threading.current_thread())
+            with self._lock:
+                self._threads.append(metrics)
+            return metrics
+
+    def start(self, method, route):
+        metrics = self._thread_metrics()
+        metrics.started += 1
+        metrics.current = [method, route, 500, time.perf_counter()]
+
+    def set_status(self, status):
+        current = self._thread_metrics().current
+        if current is not None:
+            current[2] = status
+
+    def finish(self):
+        metrics = self._thread_metrics()
+        current = metrics.current
+        if current is None:
+            return
+        metrics.current = None
+        method, route, status, start = current
+        metrics.finished += 1
+        key = (method, route, status)
+        metrics.requests[key] = metrics.requests.get(key, 0) + 1
+        histogram = metrics.durations.get((method, route))
+        if histogram is None:
+            histogram = metrics.durations[(method, route)] = [0] * (len(BUCKETS) + 1)
+        seconds = time.perf_counter() - start
+        histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+
+    def collect(self):
+        """Returns a ThreadMetrics holding the totals over every thread so far."""
+        with self._lock:
+            live = []
+            for metrics in self._threads:
+                if metrics.thread.is_alive():
+                    live.append(metrics)
+                else:
+                    self._retired.merge(metrics)
+            self._threads = live
+            totals = ThreadMetrics()
+            totals.merge(self._retired)
+            for metrics in live:
+                totals.merge(metrics)
+        return totals
+
+def get_request_metrics(app=None):
+    app = app or current_app
+    return app.extensions.get('request_metrics')
+
+def labels(**values):
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in values.items()) + '}'
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def exposition(app):
+    """Renders the metrics in the Prometheus text exposition format."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for suffix, label_text, value in samples:
+            lines.append(f'{name}{suffix}{label_text} {value}')
+
+    totals = app.extensions['request_metrics'].collect()
+    metric('http_requests_total', 'counter', 'Requests served, by method, route and status.',
+           [('', labels(method=method, route=route, status=status), count)
+            for (method, route, status), count in sorted(totals.requests.items())])
+    samples = []
+    for (method, route), histogram in sorted(totals.durations.items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS, histogram):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            samples.append(('_bucket', labels(method=method, route=route, le=le), cumulative))
+        samples.append(('_sum', labels(method=method, route=route), round(histogram[-1], 6)))
+        samples.append(('_count', labels(method=method, route=route), cumulative))
+    metric('http_request_duration_seconds', 'histogram', 'Request latency, by method and route.', samples)
+    metric('http_requests_in_flight', 'gauge', 'Requests being served right now.',
+           [('', '', totals.started - totals.finished)])
+
+    pool = pool_stats(app)
+    if pool is not None:
+        metric('db_pool_connections', 'gauge', 'Pooled SQLite connections, by state.',
+               [('', labels(state=state), pool[state]) for state in ('open', 'in_use', 'idle')])
+        metric('db_pool_size', 'gauge', 'Most connections the pool will open.', [('', '', pool['size'])])
+        for key, help_text in (('acquired', 'Connections handed to requests.'),
+                               ('waits', 'Requests that had to wait for a free connection.'),
+                               ('timeouts', 'Requests that gave up waiting for a connection.')):
+            metric(f'db_pool_{key}_total', 'counter', help_text, [('', '', pool[key])])
+
+    router = get_shard_router(app)
+    shards = [(index, stats) for index, stats in enumerate(router.stats()) if stats is not None] if router is not None else []
+    if shards:
+        metric('db_shard_pool_connections', 'gauge', 'Pooled connections per shard, by state.',
+               [('', labels(shard=index, state=state), stats[state]) for index, stats in shards for state in ('open', 'in_use', 'idle')])
+        for key, help_text in (('acquired', 'Shard connections handed to requests.'),
+                               ('waits', 'Requests that had to wait for a free shard connection.'),
+                               ('timeouts', 'Requests that gave up waiting for a shard connection.')):
+            metric(f'db_shard_pool_{key}_total', 'counter', help_text, [('', labels(shard=index), stats[key]) for index, stats in shards])
+
+    writers = app.extensions.get('group_commit_writers')
+    if writers:
+        writes = [(index, writer.stats()) for index, writer in enumerate(writers)]
+        metric('group_commit_queued', 'gauge', 'Inserts waiting for the next group commit, per database.',
+               [('', labels(database=index), stats['queued']) for index, stats in writes])
+        for key, help_text in (('batches', 'Groups committed.'),
+                               ('statements', 'Inserts committed in groups.'),
+                               ('failed', 'Inserts whose group failed to commit.')):
+            metric(f'group_commit_{key}_total', 'counter', help_text, [('', labels(database=index), stats[key]) for index, stats in writes])
+
+    replicas = app.extensions.get('db_replicas')
+    if replicas is not None:
+        reads = replicas.stats()
+        metric('db_replica_reads_total', 'counter', 'Requests that read from a replica.', [('', '', reads['replica_reads'])])
+        metric('db_replica_sticky_reads_total', 'counter', 'Reads kept on the primary after the user\'s own write.',
+               [('', '', reads['sticky_reads'])])
+        metric('db_replica_sticky_users', 'gauge', 'Users whose latest write a replica is still missing.', [('', '', reads['sticky_users'])])
+
+    cache = response_cache_stats(app)
+    if cache is not None:
+        metric('response_cache_hits_total', 'counter', 'Response cache lookups that found an entry.', [('', '', cache['hits'])])
+        metric('response_cache_misses_total', 'counter', 'Response cache lookups that found nothing.', [('', '', cache['misses'])])
+        metric('response_cache_hit_ratio', 'gauge', 'Hits over lookups since start.', [('', '', round(cache['hit_ratio'], 6))])
+        metric('response_cache_entries', 'gauge', 'Entries in the response cache.', [('', '', cache['entries'])])
+
+    hasher = app.extensions.get('password_hasher')
+    if hasher is not None and hasher.workers:
+        hashing = hasher.stats()
+        metric('password_hash_waiting', 'gauge', 'Requests waiting for a hashing process.', [('', '', hashing['waiting'])])
+        metric('password_hash_total', 'counter', 'Passwords hashed or verified on the pool.', [('', '', hashing['hashed'])])
+        metric('password_hash_rejected_total', 'counter', 'Requests turned away with 503.', [('', '', hashing['rejected'])])
+    return '\n'.join(lines) + '\n'
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(exposition(current_app), content_type=CONTENT_TYPE)
+
+def init_metrics(app):
+    if not app.config['METRICS_ENABLED']:
+        return
+    metrics = app.extensions['request_metrics'] = RequestMetrics()
+
+    # The hooks reach the collector through the closure and keep per-request state on
+    # the thread, so the request path makes a single context-local lookup.
+    @app.before_request
+    def start_request():
+        current = request._get_current_object()
+        rule = current.url_rule
+        metrics.start(current.method, rule.rule if rule is not None else '<unmatched>')
+
+    @app.after_request
+    def remember_status(response):
+        metrics.set_status(response.status_code)
+        return response
+
+    @app.teardown_request
+    def finish_request(e=None):
+        metrics.finish()
+
+    app.register_blueprint(bp)
@@ -0,0 +1,105 @@
+import os
+import re
+import sqlite3
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_PATH = os.path.join(ROOT_DIR, 'schema.sql')
+MIGRATIONS_DIR = os.path.join(ROOT_DIR, 'migrations')
+
+_MIGRATION_NAME = re.compile(r'^(\d+)_\w+\.sql$')
+
+# Milliseconds to wait for another process's migration step (a table rebuild can take a while).
+MIGRATION_BUSY_TIMEOUT = 600000
+
+def get_version(db):
+    return db.execute('PRAGMA user_version').fetchone()[0]
+
+def list_migrations():
+    """
+    Lists the migration scripts shipped in the migrations/ directory.
+
+    Returns:
+        A list of (version, path) tuples sorted by version.  Scripts are named
+        NNNN_description.sql and the numeric prefix is the schema version they
+        bring the database to.
+    """
+    migrations = []
+    for name in os.listdir(MIGRATIONS_DIR):
+        match = _MIGRATION_NAME.match(name)
+        if match:
+            migrations.append((int(match.group(1)), os.path.join(MIGRATIONS_DIR, name)))
+    migrations.sort()
+    return migrations
+
+def split_statements(script):
+    """Splits an SQL script into single statements, keeping trigger bodies whole."""
+    statement = ''
+    for piece in script.split(';'):
+        statement += piece + ';'
+        if sqlite3.complete_statement(statement):
+            if statement.strip(' \t\r\n;'):
+                yield statement
+            statement = ''
+
+def _apply(db, script, number):
+    # Runs one step in a write transaction.  BEGIN IMMEDIATE takes the write lock before
+    # user_version is read, so when several connections migrate at once each step runs
+    # exactly once and the others see the new version and skip it (returning False).
+    # number 0 is the baseline schema, which leaves the version at 0.  Statements go
+    # through execute() because executescript() would commit the open transaction.
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        version = get_version(db)
+        if (version > 0) if number == 0 else (version >= number):
+            db.rollback()
+            return False
+        for statement in split_statements(script):
+            db.execute(statement)
+        if number:
+            db.execute(f'PRAGMA user_version = {number}')
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return True
+
+def migrate(db, target=None):
+    """
+    Brings the database schema up to date.
+
+    The schema version lives in SQLite's PRAGMA user_version.  A database at
+    version 0 (new, or created before migrations existed) first gets the
+    baseline tables from schema.sql, then every migration newer than the stored
+    version is applied in order, each one in its own transaction together with
+    the version bump.  An up-to-date database is left untouched.  Several
+    processes may migrate the same file at once (workers booting together):
+    each step re-reads the version under the write lock and is skipped when
+    another process already applied it.
+
+    Args:
+        db: An open sqlite3 connection.
+        target: Stop at this version instead of the latest (for tests and benchmarks).
+
+    Returns:
+        The list of versions that were applied.
+    """
+    # Each step opens its own transaction, so nothing may be left pending.
+    db.commit()
+    # A long rebuild in another process should be waited for, not fail this one.
+    busy_timeout = db.execute('PRAGMA busy_timeout').fetchone()[0]
+    db.execute(f'PRAGMA busy_timeout = {MIGRATION_BUSY_TIMEOUT}')
+    try:
+        if get_version(db) == 0:
+            with open(SCHEMA_PATH, 'r') as f:
+                _apply(db, f.read(), 0)
+        applied = []
+        for number, path in list_migrations():
+            if number <= get_version(db) or (target is not None and number > target):
+                continue
+            with open(path, 'r') as f:
+                script = f.read()
+            if _apply(db, script, number):
+                applied.append(number)
+        return applied
+    finally:
+        db.execute(f'PRAGMA busy_timeout = {busy_timeout}')
@@ -1,6 +1,47 @@
-from .database import get_db
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import timedelta
+from .database import get_db, get_directory_db, get_shard_router
+from .recurrence import add_months, occurrence_at, parse_expense_date, format_like, to_utc_string, iter_virtual_occurrences
+from .utils import to_cents, from_cents, to_epoch
+from .hashing import get_password_hasher
+from .group_commit import get_group_writer
+from datetime import date, datetime, timedelta, timezone
+from itertools import islice
+import heapq
+
+DAY_SECONDS = 86400
+
+# Trend buckets as SQL over a UTC day ('YYYY-MM-DD'), each labelled by its first day;
+# weeks start on Monday, like ISO weeks.
+TREND_BUCKETS = {
+  'day': '{day}',
+  'week': "date({day}, 'weekday 0', '-6 days')",
+  'month': "strftime('%Y-%m-01', {day})",
+}
+
+def _utc_day(epoch):
+  return datetime.fromtimestamp(epoch, timezone.utc).date().isoformat()
+
+def _bucket_start(day, granularity):
+  # The Python twin of TREND_BUCKETS, for a 'YYYY-MM-DD' day.
+  value = date.fromisoformat(day)
+  if granularity == 'week':
+    value -= timedelta(days=value.weekday())
+  elif granularity == 'month':
+    value = value.replace(day=1)
+  return value.isoformat()
+
+def _iter_bucket_starts(first, last, granularity):
+  value = date.fromisoformat(first)
+  last = date.fromisoformat(last)
+  n = 0
+  while True:
+    if granularity == 'month':
+      current = add_months(value, n)
+    else:
+      current = value + timedelta(days=n * (7 if granularity == 'week' else 1))
+    if current > last:
+      return
+    yield current.isoformat()
+    n += 1
 
 class User:
   def __init__(self, username, password_hash, id=None):
@@ -9,11 +50,15 @@ class User:
     self.password_hash = password_hash
 
   def save(self):
-    db = get_db()
+    db = get_directory_db()
     if self.id is None:
-      cur = db.execute('INSERT INTO users (username, password_hash) VALUES (?,?)', (self.username, self.password_hash))
-      db.commit()
-      self.id = cur.lastrowid # Update id after insertion.
+      # A duplicate username raises IntegrityError and is rolled back with the transaction.
+      with db:
+        cur = db.execute('INSERT INTO users (username, password_hash) VALUES (?,?)', (self.username, self.password_hash))
+        self.id = cur.lastrowid # Update id after insertion.
+        router = get_shard_router()
+        if router is not None:
+          db.execute('UPDATE users SET shard = ? WHERE id = ?', (router.placement(self.id), self.id))
     else:
       db.execute('UPDATE users SET username = ?, password_hash = ? WHERE id = ?', (self.username, self.password_hash, self.id))
       db.commit()
@@ -21,7 +66,7 @@ class User:
 
   @staticmethod
   def get_by_username(username):
-      db = get_db()
+      db = get_directory_db()
       cur = db.execute('SELECT * FROM users WHERE username = ?', (username,))
       row = cur.fetchone()
       if row:
@@ -30,20 +75,40 @@ class User:
 
   @staticmethod
   def get_by_id(user_id):
-      db = get_db()
+      db = get_directory_db()
       cur = db.execute('SELECT * FROM users WHERE id = ?', (user_id,))
       row = cur.fetchone()
       if row:
           return User(id=row['id'], username=row['username'], password_hash=row['password_hash'])
       return None
+  @staticmethod
+  def get_data_version(user_id):
+      # Bumped by triggers on every write to the user's expenses (migrations/0005).
+      db = get_db(user_id)
+      cur = db.execute('SELECT version FROM user_data_versions WHERE user_id = ?', (user_id,))
+      row = cur.fetchone()
+      return row['version'] if row else 0
+
   def set_password(self, password):
-      self.password_hash = generate_password_hash(password)
+      # Runs on the app's PasswordHasher pool and may raise HashingBusy.
+      self.password_hash = get_password_hasher().hash(password)
 
   def check_password(self, password):
-      return check_password_hash(self.password_hash, password)
+      return get_password_hasher().verify(self.password_hash, password)
 
 class Expense:
-  def __init__(self, user_id, amount, description, date, category, recurrence_flag, id=None ):
+  # The public fields, in API order.  Every expense response is built from this tuple
+  # (see app/serialization.py), so it is the one place the JSON shape is defined.
+  FIELDS = ('id', 'user_id', 'amount', 'description', 'date', 'category', 'recurrence_flag')
+  # The same fields selected straight from expenses rows, then the (date_epoch, id) sort key.
+  FIELD_COLUMNS = 'id, user_id, amount_cents / 100.0, description, date, category, recurrence_flag'
+  API_COLUMNS = FIELD_COLUMNS + ', date_epoch, id'
+  INSERT = '''INSERT INTO expenses (user_id, amount_cents, description, date, date_epoch, category, recurrence_flag, recurring)
+              VALUES (?,?,?,?,?,?,?,?)'''
+  # recurring is write-only: it opts the expense in to generated occurrences (see app/recurrence.py).
+  __slots__ = FIELDS + ('recurring', 'template_id')
+
+  def __init__(self, user_id, amount, description, date, category, recurrence_flag, id=None, template_id=None, recurring=False):
     self.id = id
     self.user_id = user_id
     self.amount = amount
@@ -51,69 +116,348 @@ class Expense:
     self.date = date
     self.category = category
     self.recurrence_flag = recurrence_flag
+    self.recurring = recurring
+    self.template_id = template_id
+
+  @staticmethod
+  def from_row(row):
+    # Rows store amount_cents and date_epoch; the model exposes the amount in currency
+    # units and the date string as entered.
+    return Expense(user_id = row['user_id'], amount = from_cents(row['amount_cents']), description = row['description'], date = row['date'], category = row['category'], recurrence_flag=row['recurrence_flag'], id = row['id'], recurring=bool(row['recurring']))
+
+  def sort_key(self):
+    # Newest-first listing order is (date_epoch, id) descending.  A virtual occurrence has
+    # no id and uses minus its template's id instead, so keyset positions stay unique.
+    return (to_epoch(self.date), self.id if self.id is not None else -self.template_id)
+
+  def to_dict(self):
+    return {field: getattr(self, field) for field in Expense.FIELDS}
+
+  def api_row(self):
+    # The shape Expense.iter_api_rows yields: FIELDS values, then the sort key.
+    return (self.id, self.user_id, self.amount, self.description, self.date, self.category, self.recurrence_flag) + self.sort_key()
+
+  def _columns(self):
+    # Converts to the stored representation, and rounds self.amount to whole cents so
+    # the object matches what was written.
+    cents = to_cents(self.amount)
+    self.amount = from_cents(cents)
+    return (self.user_id, cents, self.description, self.date, to_epoch(self.date), self.category)
+
+  def _insert_params(self):
+    return self._columns() + (self.recurrence_flag, int(self.recurring))
 
   def save(self):
-    db = get_db()
     if self.id is None:
-      cur = db.execute('''INSERT INTO expenses (user_id, amount, description, date, category, recurrence_flag)
-                        VALUES (?,?,?,?,?,?)''', (self.user_id, self.amount, self.description, self.date, self.category, self.recurrence_flag))
+      writer = get_group_writer(self.user_id)
+      if writer is not None:
+        # Joins the writer's next group commit and returns once that group is durable.
+        self.id = writer.execute(Expense.INSERT, self._insert_params())
+        return self
+      db = get_db(self.user_id)
+      cur = db.execute(Expense.INSERT, self._insert_params())
       db.commit()
       self.id = cur.lastrowid
     else:
-      db.execute('''UPDATE expenses SET user_id =?, amount = ?, description = ?, date = ?, category =?
-                  WHERE id = ?''', (self.user_id, self.amount, self.description, self.date, self.category, self.id))
+      db = get_db(self.user_id)
+      db.execute('''UPDATE expenses SET user_id =?, amount_cents = ?, description = ?, date = ?, date_epoch = ?, category =?, recurring = ?
+                  WHERE id = ?''', self._columns() + (int(self.recurring), self.id))
       db.commit()
     return self
 
+  @staticmethod
+  def save_all(expenses):
+    # Inserts new expenses with one executemany in a single transaction (one commit, one fsync).
+    if not expenses:
+      return expenses
+    db = get_db(expenses[0].user_id)
+    with db:
+      if not db.in_transaction:
+        db.execute('BEGIN IMMEDIATE')
+      db.executemany(Expense.INSERT, [e._insert_params() for e in expenses])
+      # The write lock is held for the whole batch, so the new ids are consecutive.
+      last_id = db.execute('SELECT last_insert_rowid()').fetchone()[0]
+    for offset, expense in enumerate(expenses):
+      expense.id = last_id - len(expenses) + 1 + offset
+    return expenses
+
   @staticmethod
   def get_by_id(expense_id):
+      # Looks in the current user's shard when sharded, so other users' expenses are not found.
       db = get_db()
       cur = db.execute('SELECT * FROM expenses WHERE id = ?', (expense_id,))
       row = cur.fetchone()
       if row:
-          return Expense(user_id = row['user_id'], amount = row['amount'], description = row['description'], date = row['date'], category = row['category'], recurrence_flag=row['recurrence_flag'], id = row['id'])
+          return Expense.from_row(row)
       return None
 
   @staticmethod
-  def get_all_by_user_id(user_id, start_date=None, end_date=None, category=None):
-      db = get_db()
-      query = 'SELECT * FROM expenses WHERE user_id = ?'
+  def _user_query(user_id, start_date=None, end_date=None, category=None, limit=None, after=None, columns='*'):
+      # Results are ordered newest first by (date_epoch, id).  For keyset pagination pass
+      # after=sort_key() of the last expense already returned, never an OFFSET.
+      query = f'SELECT {columns} FROM expenses WHERE user_id = ?'
       params = [user_id]
       if start_date:
-          query += ' AND date >= ?'
-          params.append(start_date)
+          query += ' AND date_epoch >= ?'
+          params.append(to_epoch(start_date))
       if end_date:
-          query += ' AND date <= ?'
-          params.append(end_date)
+          query += ' AND date_epoch <= ?'
+          params.append(to_epoch(end_date))
       if category:
           query += ' AND category = ?'
           params.append(category)
-      query += ' ORDER BY date DESC'
+      if after:
+          query += ' AND (date_epoch, id) < (?, ?)'
+          params.extend(after)
+      query += ' ORDER BY date_epoch DESC, id DESC'
+      if limit:
+          query += ' LIMIT ?'
+          params.append(limit)
+      return query, params
+
+  @staticmethod
+  def get_all_by_user_id(user_id, start_date=None, end_date=None, category=None, limit=None, after=None, expand_recurring=False, now=None):
+      # With expand_recurring, occurrences of recurring templates that were never
+      # materialized are computed for the window and merged in (RECURRENCE_MODE = 'virtual').
+      db = get_db(user_id)
+      query, params = Expense._user_query(user_id, start_date, end_date, category, limit, after)
       cur = db.execute(query, params)
       expenses = []
 
       for row in cur.fetchall():
-        expenses.append(Expense(user_id = row['user_id'], amount = row['amount'], description = row['description'], date = row['date'], category = row['category'], recurrence_flag=row['recurrence_flag'], id = row['id']))
+        expenses.append(Expense.from_row(row))
+      if expand_recurring:
+        streams = Expense._virtual_streams(db, user_id, start_date, end_date, category, after, now)
+        merged = heapq.merge(expenses, *streams, key=Expense.sort_key, reverse=True)
+        expenses = list(islice(merged, limit)) if limit else list(merged)
       return expenses
-  
+
+  @staticmethod
+  def iter_api_rows(user_id, start_date=None, end_date=None, category=None, limit=None, after=None, batch_size=None, expand_recurring=False, now=None):
+      # The expenses of get_all_by_user_id as plain tuples in the API_COLUMNS layout, read
+      # straight off the cursor without building Row or Expense objects.  batch_size reads
+      # that many rows at a time (streamed exports); otherwise all rows are fetched at once.
+      db = get_db(user_id)
+      query, params = Expense._user_query(user_id, start_date, end_date, category, limit, after, columns=Expense.API_COLUMNS)
+      cur = db.cursor()
+      cur.row_factory = None
+      cur.execute(query, params)
+
+      def stored():
+        if batch_size is None:
+          yield from cur.fetchall()
+          return
+        while True:
+          rows = cur.fetchmany(batch_size)
+          if not rows:
+            break
+          yield from rows
+
+      if not expand_recurring:
+        return stored()
+      streams = [map(Expense.api_row, stream) for stream in Expense._virtual_streams(db, user_id, start_date, end_date, category, after, now)]
+      merged = heapq.merge(stored(), *streams, key=lambda row: row[-2:], reverse=True)
+      return islice(merged, limit) if limit else merged
+
+  @staticmethod
+  def amount_rows(user_id, start_date=None, end_date=None, expand_recurring=False, now=None):
+      # (id, date_epoch, category, amount_cents) tuples, oldest first, for app/analytics.py.
+      # The (user_id, date_epoch, category, amount_cents) index covers the query.
+      db = get_db(user_id)
+      query = 'SELECT id, date_epoch, category, amount_cents FROM expenses WHERE user_id = ?'
+      params = [user_id]
+      if start_date:
+          query += ' AND date_epoch >= ?'
+          params.append(to_epoch(start_date))
+      if end_date:
+          query += ' AND date_epoch <= ?'
+          params.append(to_epoch(end_date))
+      cur = db.cursor()
+      cur.row_factory = None
+      cur.execute(query + ' ORDER BY date_epoch', params)
+      rows = cur.fetchall()
+      if expand_recurring:
+          for template in Expense._templates(db, user_id, end_date):
+              rows.extend((None, to_epoch(date), template['category'], template['amount_cents'])
+                          for date in iter_virtual_occurrences(template, start_date, end_date, now=now))
+          rows.sort(key=lambda row: row[1])
+      return rows
+
+  @staticmethod
+  def daily_totals(user_id, first_day=None, last_day=None, expand_recurring=False, now=None):
+      # (day, cents) per UTC day with expenses between the 'YYYY-MM-DD' days first_day and
+      # last_day (inclusive), oldest first, summed from the expense_daily_totals rollup.
+      db = get_db(user_id)
+      query = 'SELECT day, SUM(total) FROM expense_daily_totals WHERE user_id = ?'
+      params = [user_id]
+      if first_day:
+          query += ' AND day >= ?'
+          params.append(first_day)
+      if last_day:
+          query += ' AND day <= ?'
+          params.append(last_day)
+      totals = dict(db.execute(query + ' GROUP BY day', params).fetchall())
+      if expand_recurring:
+          end_date = last_day + 'T23:59:59+00:00' if last_day else None
+          for template in Expense._templates(db, user_id, end_date):
+              for occurrence in iter_virtual_occurrences(template, first_day, end_date, now=now):
+                  day = _utc_day(to_epoch(occurrence))
+                  totals[day] = totals.get(day, 0) + template['amount_cents']
+      return sorted(totals.items())
+
+  @staticmethod
+  def search(user_id, terms, limit, after=None):
+      # Stored expenses whose description or category match the FTS5 expression terms
+      # (see utils.search_terms), best bm25 rank first.  Rows come in the API_COLUMNS
+      # layout with (rank, id) as the sort key; pass the last one as after for the next page.
+      db = get_db(user_id)
+      match = f'user_id : "{int(user_id)}" AND {{description category}} : ({terms})'
+      query = 'SELECT rowid, rank FROM expenses_fts WHERE expenses_fts MATCH ?'
+      params = [match]
+      if after:
+          query += ' AND (rank, rowid) > (?, ?)'
+          params.extend(after)
+      query += ' ORDER BY rank, rowid LIMIT ?'
+      params.append(limit)
+      cur = db.cursor()
+      cur.row_factory = None
+      cur.execute(f'''SELECT {Expense.FIELD_COLUMNS}, matches.rank, id FROM ({query}) AS matches
+                      JOIN expenses ON expenses.id = matches.rowid ORDER BY matches.rank, id''', params)
+      return cur.fetchall()
+
+  @staticmethod
+  def _templates(db, user_id, end_date=None, category=None):
+      # Only expenses that opted in are expanded, exactly the ones the scheduler would materialize.
+      query = 'SELECT * FROM expenses WHERE user_id = ? AND recurring = 1 AND recurrence_flag IS NOT NULL AND template_id IS NULL'
+      params = [user_id]
+      if end_date:
+          query += ' AND date_epoch <= ?'
+          params.append(to_epoch(end_date))
+      if category:
+          query += ' AND category = ?'
+          params.append(category)
+      return db.execute(query, params).fetchall()
+
+  @staticmethod
+  def _virtual_streams(db, user_id, start_date, end_date, category, after, now):
+      # One lazy, newest-first stream of virtual occurrences per recurring template.
+      def occurrences(template):
+        for date in iter_virtual_occurrences(template, start_date, end_date, after, now):
+          yield Expense(user_id=template['user_id'], amount=from_cents(template['amount_cents']), description=template['description'], date=date, category=template['category'], recurrence_flag=None, template_id=template['id'])
+      return [occurrences(template) for template in Expense._templates(db, user_id, end_date, category)]
+
+  @staticmethod
+  def total_by_category(user_id, start_date=None, end_date=None, expand_recurring=False, now=None):
+      # Everything is summed in integer cents and converted once at the end, so totals are exact.
+      db = get_db(user_id)
+      totals = Expense._range_totals(db, user_id, start_date, end_date)
+      if expand_recurring:
+          for template in Expense._templates(db, user_id, end_date):
+              count = sum(1 for _ in iter_virtual_occurrences(template, start_date, end_date, now=now))
+              if count:
+                  totals[template['category']] = totals.get(template['category'], 0) + count * template['amount_cents']
+      return {category: from_cents(cents) for category, cents in totals.items()}
+
+  @staticmethod
+  def trend(user_id, granularity, start_date=None, end_date=None, max_buckets=None, expand_recurring=False, now=None):
+      # Per-bucket, per-category totals in one GROUP BY over the rollup (plus the partial
+      # edge days).  Returns (categories, buckets): buckets holds (start, total, totals per
+      # category) for every bucket from the first to the last, gaps included as zeros.
+      db = get_db(user_id)
+      totals = Expense._range_totals(db, user_id, start_date, end_date, TREND_BUCKETS[granularity])
+      if expand_recurring:
+          for template in Expense._templates(db, user_id, end_date):
+              for occurrence in iter_virtual_occurrences(template, start_date, end_date, now=now):
+                  key = (_bucket_start(_utc_day(to_epoch(occurrence)), granularity), template['category'])
+                  totals[key] = totals.get(key, 0) + template['amount_cents']
+
+      starts = [key[0] for key in totals]
+      first = _bucket_start(_utc_day(to_epoch(start_date)), granularity) if start_date else min(starts, default=None)
+      last = _bucket_start(_utc_day(to_epoch(end_date)), granularity) if end_date else max(starts, default=None)
+      categories = sorted({key[1] for key in totals})
+      buckets = []
+      if first is not None and last is not None:
+          for bucket in _iter_bucket_starts(first, last, granularity):
+              if max_buckets is not None and len(buckets) == max_buckets:
+                  raise ValueError(f'The range has more than {max_buckets} {granularity} buckets.')
+              cents = [totals.get((bucket, category), 0) for category in categories]
+              buckets.append((bucket, from_cents(sum(cents)), {category: from_cents(c) for category, c in zip(categories, cents)}))
+      return categories, buckets
+
+  @staticmethod
+  def _range_totals(db, user_id, start_date, end_date, bucket=None):
+      # Sums cents per category, or per (bucket start, category) when bucket is one of
+      # TREND_BUCKETS.  Whole UTC days are summed from the expense_daily_totals rollup
+      # (O(days)); only the partial first and last day of the range are read from
+      # expenses rows.
+      totals = {}
+      rollup_query = 'SELECT ' + Expense._total_keys(bucket, 'day') + ', SUM(total) FROM expense_daily_totals WHERE user_id = ?'
+      rollup_params = [user_id]
+      start = to_epoch(start_date) if start_date else None
+      end = to_epoch(end_date) if end_date else None
+      first_full_day = None
+      if start is not None:
+          first_full_day = (start // DAY_SECONDS + 1) * DAY_SECONDS
+          rollup_query += ' AND day >= ?'
+          rollup_params.append(_utc_day(first_full_day))
+          # start up to midnight of the next day
+          Expense._add_row_totals(db, totals, user_id, start, first_full_day, end, bucket)
+      if end is not None:
+          last_day_start = end // DAY_SECONDS * DAY_SECONDS
+          rollup_query += ' AND day < ?'
+          rollup_params.append(_utc_day(last_day_start))
+          # midnight of the last day up to end, unless the first day already covered it
+          if first_full_day is not None:
+              last_day_start = max(last_day_start, first_full_day)
+          Expense._add_row_totals(db, totals, user_id, last_day_start, None, end, bucket)
+      rollup_query += ' GROUP BY 1' if bucket is None else ' GROUP BY 1, 2'
+      Expense._add_totals(totals, db.execute(rollup_query, rollup_params), bucket)
+      return totals
+
+  @staticmethod
+  def _add_row_totals(db, totals, user_id, low, below, end, bucket=None):
+      # Adds SUM(amount_cents) per key for low <= date_epoch < below and date_epoch <= end.
+      query = 'SELECT ' + Expense._total_keys(bucket, "date(date_epoch, 'unixepoch')") + ', SUM(amount_cents) FROM expenses WHERE user_id = ? AND date_epoch >= ?'
+      params = [user_id, low]
+      if below is not None:
+          query += ' AND date_epoch < ?'
+          params.append(below)
+      if end is not None:
+          query += ' AND date_epoch <= ?'
+          params.append(end)
+      query += ' GROUP BY 1' if bucket is None else ' GROUP BY 1, 2'
+      Expense._add_totals(totals, db.execute(query, params), bucket)
+
+  @staticmethod
+  def _total_keys(bucket, day):
+      return 'category' if bucket is None else bucket.format(day=day) + ', category'
+
+  @staticmethod
+  def _add_totals(totals, rows, bucket):
+      for row in rows:
+          key = row[0] if bucket is None else (row[0], row[1])
+          totals[key] = totals.get(key, 0) + row[-1]
+
   def create_recurring_expense(self):
-    new_expense = None
-    if self.recurrence_flag == "daily":
-      new_date = self.date + timedelta(days=1)
-    elif self.recurrence_flag == "weekly":
-      new_date = self.date + timedelta(weeks=1)
-    elif self.recurrence_flag == "monthly":
-      new_date = self.date + timedelta(days=30)
-
-    new_expense = Expense(user_id=self.user_id, amount=self.amount, description=self.description, date=new_date, recurrence_flag=self.recurrence_flag)
-        
-    db = get_db()
-    cur = db.execute('''INSERT INTO expenses (user_id, amount, description, date, category, recurrence_flag)
-                        VALUES (?,?,?,?,?,?)''', (new_expense.user_id, new_expense.amount, new_expense.description, new_expense.date, new_expense.category, new_expense.recurrence_flag))
-    db.commit()
-    # self.id = cur.lastrowid # Update id after insertion.
-                      
+    # Inserts the next occurrence of this saved template and advances its schedule.
+    # The scheduler in app/recurrence.py does the same for every due template in bulk.
+    db = get_db(self.user_id)
+    row = db.execute('SELECT recurrence_count FROM expenses WHERE id = ?', (self.id,)).fetchone()
+    n = row['recurrence_count'] + 1
+    anchor = parse_expense_date(self.date)
+    new_date = format_like(occurrence_at(anchor, self.recurrence_flag, n), self.date)
+
+    new_expense = Expense(user_id=self.user_id, amount=self.amount, description=self.description, date=new_date, category=self.category, recurrence_flag=None)
+    with db:
+      cur = db.execute('''INSERT OR IGNORE INTO expenses (user_id, amount_cents, description, date, date_epoch, category, recurrence_flag, template_id)
+                          VALUES (?,?,?,?,?,?,?,?)''', new_expense._columns() + (new_expense.recurrence_flag, self.id))
+      db.execute('UPDATE expenses SET recurrence_count = ?, next_due = ? WHERE id = ?',
+                 (n, to_utc_string(occurrence_at(anchor, self.recurrence_flag, n + 1)), self.id))
+    if cur.rowcount:
+      new_expense.id = cur.lastrowid
+    return new_expense
+
   def delete(self):
-    db = get_db()
+    db = get_db(self.user_id)
     db.execute('DELETE FROM expenses WHERE id = ?', (self.id,))
     db.commit()
\ No newline at end of file
@@ -0,0 +1,213 @@
+import calendar
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from .utils import to_epoch
+
+logger = logging.getLogger(__name__)
+
+RECURRENCE_FLAGS = ['daily', 'weekly', 'monthly']
+
+def add_months(value, months):
+    """
+    Adds calendar months to a date or datetime.
+
+    The day of month is kept when the target month has it and clamped to the
+    month's last day otherwise (Jan 31 + 1 month = Feb 28/29).
+
+    Args:
+        value: A date or datetime.
+        months: The number of months to add.
+
+    Returns:
+        A value of the same type, months later.
+    """
+    month_index = value.month - 1 + months
+    year = value.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+def occurrence_at(anchor, recurrence_flag, n):
+    """
+    Returns the n-th occurrence of a series starting at anchor (n=0 is anchor).
+
+    Every occurrence is computed from the anchor rather than from the previous
+    one, so a series anchored on the 31st returns to the 31st after short months.
+    """
+    if recurrence_flag == 'daily':
+        return anchor + timedelta(days=n)
+    if recurrence_flag == 'weekly':
+        return anchor + timedelta(weeks=n)
+    if recurrence_flag == 'monthly':
+        return add_months(anchor, n)
+    raise ValueError(f"Invalid recurrence flag: '{recurrence_flag}'.")
+
+def parse_expense_date(date_str):
+    return datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+
+def format_like(value, template_date):
+    # Occurrences keep the shape of the template's date: date-only stays date-only.
+    if len(template_date) == 10:
+        return value.date().isoformat()
+    return value.isoformat()
+
+def to_utc_string(value):
+    # Naive dates are taken as UTC, like the +00:00 that convert_to_iso adds to date-only input.
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S+00:00')
+
+def plan_template(template, now_utc):
+    """
+    Works out which occurrences of a template are due.
+
+    Args:
+        template: A row with date, recurrence_flag and recurrence_count.
+        now_utc: The current time as a UTC string from to_utc_string.
+
+    Returns:
+        (dates, next_due, recurrence_count): the date strings to insert, the
+        UTC due time of the following occurrence and the new count.
+    """
+    anchor = parse_expense_date(template['date'])
+    n = template['recurrence_count'] + 1
+    dates = []
+    while True:
+        occurrence = occurrence_at(anchor, template['recurrence_flag'], n)
+        due = to_utc_string(occurrence)
+        if due > now_utc:
+            return dates, due, n - 1
+        dates.append(format_like(occurrence, template['date']))
+        n += 1
+
+def _index_bound(anchor, recurrence_flag, upper):
+    # An occurrence index at or past the last occurrence before the epoch upper, with a
+    # margin for UTC offsets between the template's date and the bound.
+    days = (upper - to_epoch(anchor)) / 86400
+    if recurrence_flag == 'daily':
+        return int(days) + 2
+    if recurrence_flag == 'weekly':
+        return int(days / 7) + 2
+    anchor_utc = datetime.fromtimestamp(to_epoch(anchor), timezone.utc)
+    upper_utc = datetime.fromtimestamp(upper, timezone.utc)
+    return (upper_utc.year - anchor_utc.year) * 12 + upper_utc.month - anchor_utc.month + 2
+
+def iter_virtual_occurrences(template, start_date=None, end_date=None, before=None, now=None):
+    """
+    Yields the occurrence dates of a template that were never materialized, newest first.
+
+    Only occurrences after the template's recurrence_count are produced (earlier
+    ones exist as rows), and only those due by now.  Dates are compared with
+    start_date, end_date and before as UTC epochs, exactly like the date_epoch
+    filters on stored rows, and are generated lazily downwards from the upper
+    bound, so a window costs only the occurrences it contains.
+
+    Args:
+        template: A row with id, date, recurrence_flag and recurrence_count.
+        start_date: Inclusive lower bound, or None.
+        end_date: Inclusive upper bound, or None.
+        before: A (date_epoch, key) keyset position; only occurrences whose
+            (date_epoch, -template id) sorts below it are yielded.
+        now: The current time (defaults to the current time).
+
+    Yields:
+        Date strings shaped like the template's date.
+    """
+    anchor = parse_expense_date(template['date'])
+    flag = template['recurrence_flag']
+    upper = to_epoch(now or datetime.now(timezone.utc))
+    if end_date:
+        upper = min(upper, to_epoch(end_date))
+    if before:
+        upper = min(upper, before[0])
+    start = to_epoch(start_date) if start_date else None
+
+    first = template['recurrence_count'] + 1
+    n = max(first, _index_bound(anchor, flag, upper))
+    key = -template['id']
+    while n >= first:
+        occurrence = occurrence_at(anchor, flag, n)
+        epoch = to_epoch(occurrence)
+        if start is not None and epoch < start:
+            return
+        if epoch <= upper and (not before or (epoch, key) < tuple(before)):
+            yield format_like(occurrence, template['date'])
+        n -= 1
+
+def generate_due_occurrences(db, now=None, batch_size=1000):
+    """
+    Materializes every recurring expense occurrence that has fallen due.
+
+    Templates are read through the (recurrence_flag, next_due) index in batches
+    of batch_size; each batch's inserts and schedule updates commit together.
+    Occurrences are inserted with INSERT OR IGNORE against the unique
+    (template_id, date) index, so a rerun after a crash, or several workers
+    running at once, never create duplicates.
+
+    Args:
+        db: An open sqlite3 connection with sqlite3.Row rows.
+        now: The time to generate up to (defaults to the current time).
+        batch_size: Templates per transaction.
+
+    Returns:
+        A dict with the number of templates processed and occurrences created.
+    """
+    now_utc = to_utc_string(now or datetime.now(timezone.utc))
+    stats = {'templates': 0, 'occurrences': 0}
+    for flag in RECURRENCE_FLAGS:
+        while True:
+            with db:
+                if not db.in_transaction:
+                    db.execute('BEGIN IMMEDIATE')
+                templates = db.execute('''SELECT id, user_id, amount_cents, description, date, category, recurrence_flag, recurrence_count
+                                          FROM expenses WHERE recurrence_flag = ? AND next_due <= ? AND template_id IS NULL
+                                          ORDER BY next_due LIMIT ?''', (flag, now_utc, batch_size)).fetchall()
+                if not templates:
+                    break
+                occurrences = []
+                schedule = []
+                for template in templates:
+                    try:
+                        dates, next_due, count = plan_template(template, now_utc)
+                    except ValueError:
+                        # Unparseable date: take it off the schedule instead of retrying forever.
+                        logger.warning('Unschedulable recurring expense %s with date %r', template['id'], template['date'])
+                        schedule.append((None, template['recurrence_count'], template['id']))
+                        continue
+                    occurrences.extend((template['user_id'], template['amount_cents'], template['description'], date,
+                                        to_epoch(date), template['category'], template['id']) for date in dates)
+                    schedule.append((next_due, count, template['id']))
+                cur = db.executemany('''INSERT OR IGNORE INTO expenses (user_id, amount_cents, description, date, date_epoch, category, recurrence_flag, template_id)
+                                        VALUES (?,?,?,?,?,?,NULL,?)''', occurrences)
+                stats['occurrences'] += max(cur.rowcount, 0)
+                db.executemany('UPDATE expenses SET next_due = ?, recurrence_count = ? WHERE id = ?', schedule)
+                stats['templates'] += len(templates)
+    return stats
+
+class RecurrenceScheduler(threading.Thread):
+    """Runs generate_due_occurrences every interval seconds on its own connection."""
+    def __init__(self, connect, interval=60, batch_size=1000):
+        super().__init__(name='recurrence-scheduler', daemon=True)
+        self.connect = connect
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stopped = threading.Event()
+
+    def run(self):
+        db = self.connect()
+        try:
+            while not self._stopped.is_set():
+                try:
+                    stats = generate_due_occurrences(db, batch_size=self.batch_size)
+                    if stats['occurrences']:
+                        logger.info('Generated %(occurrences)s occurrences from %(templates)s recurring expenses', stats)
+                except Exception:
+                    logger.exception('Recurring expense generation failed')
+                self._stopped.wait(self.interval)
+        finally:
+            db.close()
+
+    def stop(self):
+        self._stopped.set()
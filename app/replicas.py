@@ -0,0 +1,198 @@
+"""
+Read replicas for GET and HEAD requests.
+
+DATABASE_READ_MODE picks what a read request's get_db() returns:
+
+- 'readonly': the same database file opened with a read-only URI
+  (file:...?mode=ro) from its own pool.  In WAL mode these readers never wait
+  on the writer and see every commit at once, so they are never stale.
+- 'snapshot': a copy of each database (expenses.db -> expenses.snapshot.db),
+  made with the SQLite backup API at startup and every DATABASE_READ_REFRESH
+  seconds by a background thread.  Reads never touch the primary's file, at
+  the cost of being up to one refresh behind.
+
+Writes always go to the primary.  After a user's own write (any request other
+than GET, HEAD or OPTIONS), their reads stay on the primary until a snapshot
+taken after that write is in place, so a user always reads what they wrote.
+Other users' writes, and occurrences from the recurrence scheduler, show up
+on the next refresh.  The last-write times live in the process, so with
+several worker processes stickiness only holds within the worker that took
+the write; the 'readonly' mode has no such gap.
+
+With DATABASE_SHARDS every shard gets its own replica; the users directory
+is always read from the primary.
+"""
+import logging
+import os
+import threading
+import time
+from urllib.parse import quote
+
+from flask import current_app, g, request
+
+from .database import ConnectionPool, connect, connection_pragmas, get_shard_router
+
+logger = logging.getLogger(__name__)
+
+READ_MODES = ('readonly', 'snapshot')
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+def snapshot_path(url):
+    root, ext = os.path.splitext(url)
+    return f'{root}.snapshot{ext or ".db"}'
+
+def read_only_uri(path):
+    return f'file:{quote(os.path.abspath(path))}?mode=ro'
+
+class Replica:
+    """Read-only connections to one database, or to its snapshot copy."""
+    def __init__(self, url, mode, pool_size, timeout, pragmas=()):
+        self.url = url
+        self.mode = mode
+        self.snapshot_url = snapshot_path(url) if mode == 'snapshot' else None
+        self.read_url = read_only_uri(self.snapshot_url or url)
+        # journal_mode cannot be changed through a read-only connection; the file keeps its own.
+        self.pragmas = [(name, value) for name, value in pragmas if name != 'journal_mode']
+        self.pool = ConnectionPool(self.read_url, pool_size, timeout, self.pragmas) if pool_size else None
+        self._pragmas = list(pragmas)
+        self._target = None
+        # monotonic() when the data now in the snapshot was read from the primary.
+        self.synced_at = None
+
+    def covers(self, written_at):
+        # Whether a write committed at written_at (monotonic) is visible here.
+        if self.mode == 'readonly':
+            return True
+        return self.synced_at is not None and written_at < self.synced_at
+
+    def refresh(self):
+        """Copies the primary into the snapshot file (snapshot mode only)."""
+        if self._target is None:
+            self._target = connect(self.snapshot_url, self._pragmas, check_same_thread=False)
+        source = connect(self.url)
+        try:
+            started = time.monotonic()
+            # One step: the copy is one consistent read of the primary as of `started`, and
+            # readers of the snapshot keep their old view until it commits.
+            source.backup(self._target)
+        finally:
+            source.close()
+        self.synced_at = started
+
+    def acquire(self):
+        return self.pool.acquire() if self.pool is not None else connect(self.read_url, self.pragmas)
+
+    def release(self, db):
+        if self.pool is not None:
+            self.pool.release(db)
+        else:
+            db.close()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+        if self._target is not None:
+            self._target.close()
+            self._target = None
+
+class ReadReplicas:
+    """
+    The replica of every database holding expenses, keyed by shard index (None
+    unsharded), and the time of each user's last write.
+    """
+    def __init__(self, replicas):
+        self.replicas = replicas
+        self.snapshots = any(replica.mode == 'snapshot' for replica in replicas.values())
+        self._last_writes = {}
+        self._lock = threading.Lock()
+        self._reads = 0
+        self._sticky = 0
+
+    def note_write(self, user_id):
+        # Read-only replicas see every commit at once; only snapshots can miss a write.
+        if not self.snapshots:
+            return
+        with self._lock:
+            self._last_writes[user_id] = time.monotonic()
+
+    def replica_for(self, key, user_id):
+        """The replica to read user_id's data from, or None to read the primary."""
+        replica = self.replicas[key]
+        with self._lock:
+            written_at = self._last_writes.get(user_id)
+            if written_at is not None and not replica.covers(written_at):
+                self._sticky += 1
+                return None
+            self._reads += 1
+        return replica
+
+    def refresh(self):
+        for replica in self.replicas.values():
+            if replica.mode == 'snapshot':
+                replica.refresh()
+        # Writes every snapshot has caught up with no longer pin anyone to the primary.
+        oldest = min((replica.synced_at for replica in self.replicas.values() if replica.mode == 'snapshot'), default=None)
+        if oldest is not None:
+            with self._lock:
+                self._last_writes = {user_id: at for user_id, at in self._last_writes.items() if at >= oldest}
+
+    def close(self):
+        for replica in self.replicas.values():
+            replica.close()
+
+    def stats(self):
+        with self._lock:
+            return {'replica_reads': self._reads, 'sticky_reads': self._sticky, 'sticky_users': len(self._last_writes)}
+
+class SnapshotRefresher(threading.Thread):
+    """Refreshes the snapshot replicas every interval seconds."""
+    def __init__(self, replicas, interval):
+        super().__init__(name='snapshot-refresher', daemon=True)
+        self.replicas = replicas
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.replicas.refresh()
+            except Exception:
+                logger.exception('Refreshing the read snapshots failed')
+
+    def stop(self):
+        self._stopped.set()
+
+def get_read_replicas(app=None):
+    app = app or current_app
+    return app.extensions.get('db_replicas')
+
+def route_reads():
+    # Every request decides once: reads may go to a replica only for safe methods.
+    g.read_replica = request.method in SAFE_METHODS
+
+def remember_write(response):
+    if request.method not in SAFE_METHODS and g.get('user_id') is not None:
+        get_read_replicas().note_write(g.user_id)
+    return response
+
+def init_replicas(app):
+    mode = app.config['DATABASE_READ_MODE']
+    if not mode or get_read_replicas(app) is not None:
+        return
+    if mode not in READ_MODES:
+        raise ValueError(f'DATABASE_READ_MODE must be one of {", ".join(READ_MODES)}, not {mode!r}')
+    if app.config['DATABASE_URL'] == ':memory:':
+        raise ValueError('Read replicas need a file database, not :memory:')
+    router = get_shard_router(app)
+    urls = {None: app.config['DATABASE_URL']} if router is None else dict(enumerate(router.urls))
+    replicas = ReadReplicas({key: Replica(url, mode, app.config['DATABASE_POOL_SIZE'], app.config['DATABASE_POOL_TIMEOUT'],
+                                          connection_pragmas(app.config))
+                             for key, url in urls.items()})
+    # The first snapshot is taken before any request may read it.
+    replicas.refresh()
+    app.extensions['db_replicas'] = replicas
+    if mode == 'snapshot':
+        refresher = app.extensions['db_snapshot_refresher'] = SnapshotRefresher(replicas, app.config['DATABASE_READ_REFRESH'])
+        refresher.start()
+    app.before_request(route_reads)
+    app.after_request(remember_write)
@@ -0,0 +1,63 @@
+import click
+from flask.cli import with_appcontext
+from .database import expense_databases
+
+EXPECTED_QUERY = '''SELECT user_id, date(date_epoch, 'unixepoch') AS day, category, SUM(amount_cents) AS total, COUNT(*) AS count
+                    FROM expenses GROUP BY user_id, date(date_epoch, 'unixepoch'), category'''
+
+def rebuild_rollup(db):
+    """
+    Recomputes expense_daily_totals from the expenses table in one transaction.
+
+    Returns:
+        The number of rollup rows written.
+    """
+    with db:
+        db.execute('DELETE FROM expense_daily_totals')
+        cur = db.execute('INSERT INTO expense_daily_totals (user_id, day, category, total, count) ' + EXPECTED_QUERY)
+    return cur.rowcount
+
+def check_rollup(db):
+    """
+    Compares expense_daily_totals against a fresh aggregation of expenses.
+
+    Returns:
+        A list of mismatches, one dict per (user_id, day, category) that is
+        missing, extra or wrong in the rollup.  Empty when consistent.
+    """
+    expected = {(r['user_id'], r['day'], r['category']): (r['total'], r['count']) for r in db.execute(EXPECTED_QUERY)}
+    actual = {(r['user_id'], r['day'], r['category']): (r['total'], r['count'])
+              for r in db.execute('SELECT user_id, day, category, total, count FROM expense_daily_totals')}
+
+    mismatches = []
+    for key in sorted(expected.keys() | actual.keys(), key=repr):
+        want = expected.get(key, (0, 0))
+        got = actual.get(key, (0, 0))
+        if want != got:
+            mismatches.append({'user_id': key[0], 'day': key[1], 'category': key[2],
+                               'expected_total': want[0], 'expected_count': want[1],
+                               'actual_total': got[0], 'actual_count': got[1]})
+    return mismatches
+
+@click.group('rollup')
+def rollup_cli():
+    """Maintain the expense_daily_totals report rollup."""
+
+@rollup_cli.command('rebuild')
+@with_appcontext
+def rebuild_command():
+    """Recompute the rollup from the expenses table."""
+    rows = sum(rebuild_rollup(db) for db in expense_databases())
+    click.echo(f'Rebuilt expense_daily_totals: {rows} rows.')
+
+@rollup_cli.command('check')
+@with_appcontext
+def check_command():
+    """Report rollup rows that disagree with the expenses table."""
+    mismatches = [m for db in expense_databases() for m in check_rollup(db)]
+    for m in mismatches:
+        click.echo(f"user {m['user_id']} {m['day']} {m['category']}: expected {m['expected_total']} ({m['expected_count']}), "
+                   f"found {m['actual_total']} ({m['actual_count']})")
+    if mismatches:
+        raise click.ClickException(f'{len(mismatches)} inconsistent rollup rows; run "flask rollup rebuild".')
+    click.echo('expense_daily_totals is consistent.')
@@ -1,10 +1,102 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from .models import User, Expense
-from .utils import validate_date_format, validate_recurrence_flag, convert_to_iso
+import hashlib
+import math
+import sqlite3
+from datetime import datetime, timezone
+from functools import wraps
+from urllib.parse import urlencode
+from flask import Blueprint, Response, g, request, jsonify, current_app, make_response, stream_with_context
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt, get_jwt_identity
+from . import analytics
+from .models import User, Expense, TREND_BUCKETS
+from .cache import get_response_cache
+from .database import release_db
+from .serialization import json_response, expense_dicts, ndjson_line
+from .utils import validate_amount, validate_date_format, validate_recurrence_flag, convert_to_iso, encode_cursor, decode_cursor, encode_search_cursor, decode_search_cursor, search_terms
 
 bp = Blueprint('routes', __name__)
 
+NDJSON_MIMETYPE = 'application/x-ndjson'
+USER_ID_CLAIM = 'uid'
+
+def current_user_id():
+    # Tokens issued by login carry the user id as a claim; only tokens minted
+    # before that claim existed still need the username lookup.
+    user_id = get_jwt().get(USER_ID_CLAIM)
+    if user_id is None:
+        user_id = User.get_by_username(get_jwt_identity()).id
+    # get_db() finds it here to pick the user's shard.
+    g.user_id = user_id
+    return user_id
+
+def expand_recurring():
+    return current_app.config['RECURRENCE_MODE'] == 'virtual'
+
+def page_limit(limit_str):
+    # The page size asked for, EXPENSES_PAGE_SIZE when absent, or None when out of range.
+    if limit_str is None:
+        return current_app.config['EXPENSES_PAGE_SIZE']
+    if not limit_str.isdigit() or not 1 <= int(limit_str) <= current_app.config['EXPENSES_MAX_PAGE_SIZE']:
+        return None
+    return int(limit_str)
+
+def date_range_args():
+    # (start_date, end_date, error): the validated, normalized start_date and end_date query
+    # parameters (None when absent), or an error response for the first invalid one.
+    dates = []
+    for name, label in (('start_date', 'start'), ('end_date', 'end')):
+        value = request.args.get(name)
+        if value and not validate_date_format(value):
+            return None, None, (jsonify({'error': f'Invalid {label} date format.  Use ISO 8601 format (e.g., YYYY-MM-DDTHH:MM:SSZ).' }), 400)
+        dates.append(convert_to_iso(value) if value else None)
+    return dates[0], dates[1], None
+
+def conditional_get(cache=True):
+    # Wraps GET views whose body depends only on the path, the query string and the
+    # user's expenses.  The user's data version (bumped by triggers on every write)
+    # gives a strong ETag, so If-None-Match is answered with 304 before the view
+    # runs, and keys the response cache so any write makes older entries unreachable.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.accept_mimetypes.best == NDJSON_MIMETYPE:
+                return view(*args, **kwargs)
+
+            user_id = current_user_id()
+            query = urlencode(sorted(request.args.items(multi=True)))
+            key = f'{request.path}?{query}:{user_id}:{User.get_data_version(user_id)}'
+            if expand_recurring():
+                # Virtual occurrences fall due without any write, so the key also
+                # carries the current minute.
+                key += ':' + datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M')
+            etag = hashlib.sha1(key.encode('utf-8')).hexdigest()
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = cached_view(view, key, cache, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+def cached_view(view, key, cache, *args, **kwargs):
+    response_cache = get_response_cache(current_app) if cache else None
+    if response_cache is None:
+        return make_response(view(*args, **kwargs))
+
+    body = response_cache.get(key)
+    if body is not None:
+        response = current_app.response_class(body, status=200, mimetype='application/json')
+        response.headers['X-Cache'] = 'HIT'
+        return response
+
+    response = make_response(view(*args, **kwargs))
+    if response.status_code == 200 and not response.is_streamed:
+        response_cache.set(key, response.get_data())
+    response.headers['X-Cache'] = 'MISS'
+    return response
+
 @bp.route('/users/register', methods=['POST'])
 def register_user():
     data = request.get_json()
@@ -19,8 +111,13 @@ def register_user():
         return jsonify({'error': 'Username already exists'}), 409
 
     user = User(username = username, password_hash = None)
+    release_db()
     user.set_password(password)
-    user.save()
+    try:
+        user.save()
+    except sqlite3.IntegrityError:
+        # Another request registered the name while this one was hashing; UNIQUE caught it.
+        return jsonify({'error': 'Username already exists'}), 409
     return jsonify({'message': 'User registered successfully'}), 201
 
 @bp.route('/users/login', methods=['POST'])
@@ -33,138 +130,277 @@ def login():
     username = data['username']
     password = data['password']
     user = User.get_by_username(username)
+    release_db()
 
     if user and user.check_password(password):
-        access_token = create_access_token(identity=username)
+        # The user id rides along in the token so protected routes never have to look it up.
+        access_token = create_access_token(identity=username, additional_claims={USER_ID_CLAIM: user.id})
         return jsonify({'access_token': access_token}), 200
     else:
         return jsonify({'error': 'Invalid credentials'}), 401
 
-@bp.route('/expenses', methods=['POST'])
-@jwt_required()
-def create_expense():
-    data = request.get_json()
-
-    # ... validation ...
-    required_fields = ['amount', 'description', 'date', 'category', 'recurrence_flag']
-    if not all(field in data for field in required_fields):
-        return jsonify({'error': 'Missing required fields', 'required_fields': required_fields}), 400
-    if not isinstance(data['amount'], (int, float)):
-        return jsonify({'error': 'Amount must be a number'}), 400
+REQUIRED_EXPENSE_FIELDS = ['amount', 'description', 'date', 'category', 'recurrence_flag']
+
+def validate_new_expense(data):
+    # Returns the error payload for an invalid new expense, or None when it is valid.
+    if not isinstance(data, dict) or not all(field in data for field in REQUIRED_EXPENSE_FIELDS):
+        return {'error': 'Missing required fields', 'required_fields': REQUIRED_EXPENSE_FIELDS}
+    # bool is a subclass of int, but true is not an amount.
+    if not isinstance(data['amount'], (int, float)) or isinstance(data['amount'], bool):
+        return {'error': 'Amount must be a number'}
+    if not validate_amount(data['amount']):
+        return {'error': 'Amount is out of range'}
     if not isinstance(data['description'], str):
-        return jsonify({'error': 'Description must be a string'}), 400
+        return {'error': 'Description must be a string'}
     if not isinstance(data['date'], str):
-        return jsonify({'error': 'Date must be a string'}), 400
+        return {'error': 'Date must be a string'}
     if not isinstance(data['category'], str):
-        return jsonify({'error': 'Category must be a string'}), 400
+        return {'error': 'Category must be a string'}
     if not validate_date_format(data['date']):
-        return jsonify({'error': 'Invalid date format.  Use ISO 8601 format (e.g., YYYY-MM-DDTHH:MM:SSZ).' }), 400
+        return {'error': 'Invalid date format.  Use ISO 8601 format (e.g., YYYY-MM-DDTHH:MM:SSZ).' }
     if not isinstance(data['recurrence_flag'], str):
-        return jsonify({'error': 'Recurrence flag must be a string'}), 400
+        return {'error': 'Recurrence flag must be a string'}
     if not validate_recurrence_flag(data['recurrence_flag']):
-        return jsonify({'error': 'Invalid recurrence flag'}), 400
+        return {'error': 'Invalid recurrence flag'}
+    if not isinstance(data.get('recurring', False), bool):
+        return {'error': 'Recurring must be a boolean'}
+    return None
+
+@bp.route('/expenses', methods=['POST'])
+@jwt_required()
+def create_expense():
+    data = request.get_json()
+
+    # ... validation ...
+    error = validate_new_expense(data)
+    if error:
+        return jsonify(error), 400
     # Convert to full ISO 8601 (handling date-only)
     date_iso = convert_to_iso(data['date'])
 
-    current_username = get_jwt_identity()
-    user = User.get_by_username(current_username)  # Use model to get user
+    user_id = current_user_id()
 
-    expense = Expense(user_id=user.id, amount=data['amount'], description=data['description'], date=date_iso, category=data['category'], recurrence_flag=data['recurrence_flag'])
+    expense = Expense(user_id=user_id, amount=data['amount'], description=data['description'], date=date_iso, category=data['category'], recurrence_flag=data['recurrence_flag'], recurring=data.get('recurring', False))
     expense.save()
 
-    return jsonify({'id': expense.id, 'user_id': expense.user_id, 'amount': expense.amount, 'description': expense.description, 'date': expense.date, 'category': expense.category, 'recurrence_flag': expense.recurrence_flag}), 201
+    return json_response(expense.to_dict(), 201)
 
 
-@bp.route('/expenses', methods=['GET'])
+@bp.route('/expenses/bulk', methods=['POST'])
 @jwt_required()
-def list_expenses():
-    start_date_str = request.args.get('start_date')
-    end_date_str = request.args.get('end_date')
-    category = request.args.get('category')
+def create_expenses_bulk():
+    data = request.get_json()
+    max_expenses = current_app.config['BULK_MAX_EXPENSES']
 
-    current_username = get_jwt_identity()
-    user = User.get_by_username(current_username)
+    if not isinstance(data, dict) or not isinstance(data.get('expenses'), list) or not data['expenses']:
+        return jsonify({'error': 'Body must be {"expenses": [...]} with at least one expense'}), 400
+    if len(data['expenses']) > max_expenses:
+        return jsonify({'error': f'At most {max_expenses} expenses per request'}), 413
 
-    # Convert date strings to datetime objects, handling potential errors
-    start_date = None
-    end_date = None
+    user_id = current_user_id()
 
-    # ... validation ...
-    if start_date_str:
-        if not validate_date_format(start_date_str):
-            return jsonify({'error': 'Invalid start date format.  Use ISO 8601 format (e.g., YYYY-MM-DDTHH:MM:SSZ).' }), 400
-        start_date = convert_to_iso(start_date_str)
-    if end_date_str:
-        if not validate_date_format(end_date_str):
-            return jsonify({'error': 'Invalid end date format.  Use ISO 8601 format (e.g., YYYY-MM-DDTHH:MM:SSZ).' }), 400
-        end_date = convert_to_iso(end_date_str)
+    # Invalid rows are reported by index; the valid ones are still written.
+    expenses = []
+    errors = []
+    for index, item in enumerate(data['expenses']):
+        error = validate_new_expense(item)
+        if error:
+            errors.append(dict(error, index=index))
+            continue
+        expenses.append(Expense(user_id=user_id, amount=item['amount'], description=item['description'], date=convert_to_iso(item['date']), category=item['category'], recurrence_flag=item['recurrence_flag'], recurring=item.get('recurring', False)))
+
+    if not expenses:
+        return jsonify({'created': 0, 'ids': [], 'errors': errors}), 400
 
-    expenses = Expense.get_all_by_user_id(user.id, start_date, end_date, category)
-    expenses_data = [{'id': e.id, 'user_id': e.user_id, 'amount': e.amount, 'description': e.description, 'date': e.date, 'category': e.category, 'recurrence_flag': e.recurrence_flag} for e in expenses]
+    Expense.save_all(expenses)
 
-    return jsonify(expenses_data), 200
+    return jsonify({'created': len(expenses), 'ids': [e.id for e in expenses], 'errors': errors}), 201
+
+@bp.route('/expenses', methods=['GET'])
+@jwt_required()
+@conditional_get()
+def list_expenses():
+    category = request.args.get('category')
+    limit_str = request.args.get('limit')
+    cursor = request.args.get('cursor')
+
+    user_id = current_user_id()
+
+    start_date, end_date, error = date_range_args()
+    if error:
+        return error
+
+    # Exports stream one JSON object per line straight off the cursor instead of building the list.
+    if request.accept_mimetypes.best == NDJSON_MIMETYPE:
+        batch_size = current_app.config['EXPORT_BATCH_SIZE']
+        expand = expand_recurring()
+
+        def generate():
+            for row in Expense.iter_api_rows(user_id, start_date, end_date, category, batch_size=batch_size, expand_recurring=expand):
+                yield ndjson_line(row)
+
+        return Response(stream_with_context(generate()), status=200, mimetype=NDJSON_MIMETYPE)
+
+    # Without limit or cursor the whole list is returned as a plain array, as before.
+    if limit_str is None and cursor is None:
+        rows = Expense.iter_api_rows(user_id, start_date, end_date, category, expand_recurring=expand_recurring())
+        return json_response(expense_dicts(rows))
+
+    limit = page_limit(limit_str)
+    if limit is None:
+        return jsonify({'error': f"Limit must be an integer between 1 and {current_app.config['EXPENSES_MAX_PAGE_SIZE']}"}), 400
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    # Fetch one extra row to learn whether another page exists.
+    rows = list(Expense.iter_api_rows(user_id, start_date, end_date, category, limit=limit + 1, after=after, expand_recurring=expand_recurring()))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*rows[-1][-2:])
+
+    return json_response({'expenses': expense_dicts(rows), 'next_cursor': next_cursor})
+
+@bp.route('/expenses/search', methods=['GET'])
+@jwt_required()
+@conditional_get()
+def search_expenses():
+    terms = search_terms(request.args.get('q', ''))
+    if terms is None:
+        return jsonify({'error': 'Query parameter q must contain at least one word'}), 400
+    limit = page_limit(request.args.get('limit'))
+    if limit is None:
+        return jsonify({'error': f"Limit must be an integer between 1 and {current_app.config['EXPENSES_MAX_PAGE_SIZE']}"}), 400
+    after = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            after = decode_search_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    # Best matches first; one extra row tells whether another page exists.
+    rows = Expense.search(current_user_id(), terms, limit + 1, after)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_search_cursor(*rows[-1][-2:])
+
+    return json_response({'expenses': expense_dicts(rows), 'next_cursor': next_cursor})
 
 @bp.route('/reports/expenses', methods=['GET'])
 @jwt_required()
+@conditional_get()
 def total_expenses_per_category():
-    start_date_str = request.args.get('start_date')
-    end_date_str = request.args.get('end_date')
+    start_date, end_date, error = date_range_args()
+    if error:
+        return error
 
-    # Convert date strings to datetime objects, handling potential errors
-    start_date = None
-    end_date = None
+    user_id = current_user_id()
 
-    # ... validation ...
-    if start_date_str:
-        if not validate_date_format(start_date_str):
-            return jsonify({'error': 'Invalid start date format.  Use ISO 8601 format (e.g., YYYY-MM-DDTHH:MM:SSZ).' }), 400
-        start_date = convert_to_iso(start_date_str)
-    if end_date_str:
-        if not validate_date_format(end_date_str):
-            return jsonify({'error': 'Invalid end date format.  Use ISO 8601 format (e.g., YYYY-MM-DDTHH:MM:SSZ).' }), 400
-        end_date = convert_to_iso(end_date_str)
-
-    current_username = get_jwt_identity()
-    user = User.get_by_username(current_username)
-
-    expenses = Expense.get_all_by_user_id(user.id, start_date, end_date)
-
-    totals = {}
-    for expense in expenses:
-        if expense.category in totals:
-            totals[expense.category] += expense.amount
-        else:
-            totals[expense.category] = expense.amount
+    totals = Expense.total_by_category(user_id, start_date, end_date, expand_recurring=expand_recurring())
 
     return jsonify(totals), 200
 
+@bp.route('/reports/trend', methods=['GET'])
+@jwt_required()
+@conditional_get()
+def expense_trend():
+    granularity = request.args.get('granularity', 'month')
+    if granularity not in TREND_BUCKETS:
+        return jsonify({'error': "Invalid granularity.  Use 'day', 'week' or 'month'."}), 400
+    start_date, end_date, error = date_range_args()
+    if error:
+        return error
+
+    try:
+        categories, buckets = Expense.trend(current_user_id(), granularity, start_date, end_date,
+                                            max_buckets=current_app.config['TREND_MAX_BUCKETS'], expand_recurring=expand_recurring())
+    except ValueError as e:
+        return jsonify({'error': f'{e}  Narrow the range or use a coarser granularity.'}), 400
+
+    return jsonify({
+        'granularity': granularity,
+        'categories': categories,
+        'buckets': [{'start': start, 'total': total, 'totals': totals} for start, total, totals in buckets],
+    }), 200
+
+@bp.route('/reports/percentiles', methods=['GET'])
+@jwt_required()
+@conditional_get()
+def expense_percentiles():
+    start_date, end_date, error = date_range_args()
+    if error:
+        return error
+    columns = analytics.load_columns(current_user_id(), start_date, end_date, expand_recurring=expand_recurring())
+    return jsonify(analytics.percentiles(columns)), 200
+
+@bp.route('/reports/moving-average', methods=['GET'])
+@jwt_required()
+@conditional_get()
+def expense_moving_average():
+    start_date, end_date, error = date_range_args()
+    if error:
+        return error
+    window = request.args.get('window', '30')
+    if not window.isdigit() or not 1 <= int(window) <= 365:
+        return jsonify({'error': 'Window must be an integer between 1 and 365'}), 400
+    try:
+        days = analytics.daily_moving_average(current_user_id(), start_date, end_date, int(window),
+                                              max_days=current_app.config['ANALYTICS_MAX_DAYS'], expand_recurring=expand_recurring())
+    except ValueError as e:
+        return jsonify({'error': f'{e}  Narrow the range.'}), 400
+    return jsonify({'window': int(window), 'days': days}), 200
+
+@bp.route('/reports/anomalies', methods=['GET'])
+@jwt_required()
+@conditional_get()
+def expense_anomalies():
+    start_date, end_date, error = date_range_args()
+    if error:
+        return error
+    try:
+        threshold = float(request.args.get('threshold', analytics.DEFAULT_ANOMALY_THRESHOLD))
+    except ValueError:
+        threshold = math.nan
+    if not 0 < threshold < math.inf:
+        return jsonify({'error': 'Threshold must be a positive number'}), 400
+    columns = analytics.load_columns(current_user_id(), start_date, end_date, expand_recurring=expand_recurring())
+    flagged = analytics.anomaly_dicts(columns, *analytics.anomalies(columns, threshold))
+    return jsonify({'threshold': threshold, 'expenses': flagged}), 200
+
 @bp.route('/expenses/<int:expense_id>', methods=['GET'])
 @jwt_required()
+@conditional_get(cache=False)
 def get_expense(expense_id):
-    current_username = get_jwt_identity()
-    user = User.get_by_username(current_username)
+    user_id = current_user_id()
     expense = Expense.get_by_id(expense_id)
 
-    if not expense or expense.user_id != user.id:
+    if not expense or expense.user_id != user_id:
         return jsonify({'error': 'Expense not found or not authorized'}), 204
 
-    return jsonify({'id': expense.id, 'user_id': expense.user_id, 'amount': expense.amount, 'description': expense.description, 'date': expense.date, 'category': expense.category}), 200
+    return json_response(expense.to_dict())
 
 @bp.route('/expenses/<int:expense_id>', methods=['PUT'])
 @jwt_required()
 def update_expense(expense_id):
     data = request.get_json()
-    current_username = get_jwt_identity()
-    user = User.get_by_username(current_username)
+    user_id = current_user_id()
     expense = Expense.get_by_id(expense_id)
 
-    if not expense or expense.user_id != user.id:
+    if not expense or expense.user_id != user_id:
         return jsonify({'error': 'Expense not found or not authorized'}), 204
 
     # Update fields (with validation)
     if 'amount' in data:
-        if not isinstance(data['amount'], (int, float)):
+        if not isinstance(data['amount'], (int, float)) or isinstance(data['amount'], bool):
             return jsonify({'error': 'Amount must be a number'}), 400
+        if not validate_amount(data['amount']):
+            return jsonify({'error': 'Amount is out of range'}), 400
         expense.amount = data['amount']
     if 'description' in data:
         if not isinstance(data['description'], str):
@@ -185,16 +421,19 @@ def update_expense(expense_id):
             return jsonify({'error': 'Recurrence flag must be a string'}), 400
         if not validate_recurrence_flag(data['recurrence_flag']):
             return jsonify({'error': 'Invalid recurrence flag'}), 400
+    if 'recurring' in data:
+        if not isinstance(data['recurring'], bool):
+            return jsonify({'error': 'Recurring must be a boolean'}), 400
+        expense.recurring = data['recurring']
     expense.save()
-    return jsonify({'id': expense.id, 'user_id': expense.user_id, 'amount': expense.amount, 'description': expense.description, 'date': expense.date, 'category': expense.category, 'recurrence_flag': expense.recurrence_flag}), 200
+    return json_response(expense.to_dict())
 
 @bp.route('/expenses/<int:expense_id>', methods=['DELETE'])
 @jwt_required()
 def delete_expense(expense_id):
-    current_username = get_jwt_identity()
-    user = User.get_by_username(current_username)
+    user_id = current_user_id()
     expense = Expense.get_by_id(expense_id)
-    if not expense or expense.user_id != user.id:
+    if not expense or expense.user_id != user_id:
         return jsonify({'error': 'Expense not found or not authorized'}), 204
     expense.delete()
     return jsonify({}), 204
\ No newline at end of file
@@ -0,0 +1,65 @@
+import json
+import time
+from flask import current_app, g
+from .models import Expense
+
+try:
+    import orjson
+except ImportError:  # optional: pip install orjson
+    orjson = None
+
+JSON_MIMETYPE = 'application/json'
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+def get_encoder(name):
+    """
+    Returns a function that encodes an object to JSON bytes.
+
+    Args:
+        name: 'orjson', 'json' (the standard library) or 'auto', which picks
+            orjson when it is installed.
+
+    Returns:
+        The encoder function.
+
+    Raises:
+        ValueError: If name is unknown, or 'orjson' without orjson installed.
+    """
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'json'
+    if name == 'orjson':
+        if orjson is None:
+            raise ValueError("JSON_ENCODER is 'orjson' but orjson is not installed (pip install orjson)")
+        return orjson.dumps
+    if name == 'json':
+        return _stdlib_dumps
+    raise ValueError(f"Unknown JSON_ENCODER: '{name}'. Expected 'auto', 'orjson' or 'json'.")
+
+def dumps(obj):
+    """Encodes obj with the app's JSON encoder, counting the time as serialization when requests are timed."""
+    encoder = current_app.extensions['json_encoder']
+    timings = g.get('request_timings')
+    if timings is None:
+        return encoder(obj)
+    start = time.perf_counter()
+    try:
+        return encoder(obj)
+    finally:
+        timings.serialize += time.perf_counter() - start
+
+def expense_dicts(rows):
+    """Maps tuples in the Expense.API_COLUMNS layout to expense objects; the trailing sort key is dropped by zip."""
+    fields = Expense.FIELDS
+    return [dict(zip(fields, row)) for row in rows]
+
+def json_response(payload, status=200):
+    return current_app.response_class(dumps(payload), status=status, mimetype=JSON_MIMETYPE)
+
+def ndjson_line(row):
+    """One line of an NDJSON export for a tuple in the Expense.API_COLUMNS layout."""
+    return dumps(dict(zip(Expense.FIELDS, row))) + b'\n'
+
+def init_serialization(app):
+    app.extensions['json_encoder'] = get_encoder(app.config['JSON_ENCODER'])
@@ -0,0 +1,262 @@
+"""
+Spreads users' expenses over several SQLite files (shards) so writes for
+different users do not queue on one database's write lock.
+
+With DATABASE_SHARDS set, the DATABASE_URL database is the users directory:
+it keeps the users table, and users.shard names the DATABASE_SHARDS entry
+(by position) holding each user's expenses.  Every shard carries the full
+schema, so the rollup, data versions, search index and recurrence schedule
+all live next to the expenses they describe.  get_db(user_id) picks the
+shard; model methods pass their user id, and requests default to the
+authenticated user.
+
+Expense ids stay unique across shards: shard i allocates ids from
+i * SHARD_ID_SPAN upwards, and moving a user renumbers their expenses into
+the target's range.  The order of DATABASE_SHARDS is therefore part of the
+data; append new shards, never reorder them.
+"""
+import os
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from .cache import LRUCache
+from .database import ConnectionPool, connect, connection_pragmas, get_directory_db, get_shard_router
+from .migrations import migrate
+
+SHARD_ID_SPAN = 1 << 40
+
+class ShardRouter:
+    """
+    The connection pools of the shards, in DATABASE_SHARDS order, and a
+    bounded cache of which shard each recently seen user lives on, so most
+    requests skip the directory lookup.
+    """
+    def __init__(self, urls, pool_size, timeout, pragmas=(), cache_size=10000, cache_ttl=30):
+        self.urls = list(urls)
+        self.pragmas = list(pragmas)
+        # pool_size 0 opens a connection per app context, as for the directory.
+        self.pools = [ConnectionPool(url, pool_size, timeout, self.pragmas) if pool_size else None for url in self.urls]
+        self.cache_ttl = cache_ttl
+        self._locations = LRUCache(cache_size)
+
+    def __len__(self):
+        return len(self.urls)
+
+    def placement(self, user_id):
+        # Where a new user goes; `flask shards rebalance` may move them later.
+        return user_id % len(self.urls)
+
+    def cached_shard(self, user_id):
+        return self._locations.get(user_id)
+
+    def cache_shard(self, user_id, index):
+        if self.cache_ttl > 0:
+            self._locations.set(user_id, index, self.cache_ttl)
+
+    def forget_shard(self, user_id):
+        self._locations.delete(user_id)
+
+    def connect(self, index, **kwargs):
+        return connect(self.urls[index], self.pragmas, **kwargs)
+
+    def acquire(self, index):
+        pool = self.pools[index]
+        return pool.acquire() if pool is not None else self.connect(index)
+
+    def release(self, index, db):
+        pool = self.pools[index]
+        if pool is not None:
+            pool.release(db)
+        else:
+            db.close()
+
+    def close(self):
+        for pool in self.pools:
+            if pool is not None:
+                pool.close()
+
+    def stats(self):
+        return [pool.stats() if pool is not None else None for pool in self.pools]
+
+def reserve_id_range(db, index):
+    # AUTOINCREMENT continues from sqlite_sequence, so raising it to the shard's base once
+    # keeps every id this shard hands out clear of the other shards' ranges.
+    base = index * SHARD_ID_SPAN
+    with db:
+        db.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'expenses' AND seq < ?", (base, base))
+        db.execute("INSERT INTO sqlite_sequence (name, seq) SELECT 'expenses', ? WHERE NOT EXISTS "
+                   "(SELECT 1 FROM sqlite_sequence WHERE name = 'expenses')", (base,))
+
+def init_shards(app):
+    urls = app.config['DATABASE_SHARDS']
+    if not urls or get_shard_router(app) is not None:
+        return
+    router = ShardRouter(urls, app.config['DATABASE_POOL_SIZE'], app.config['DATABASE_POOL_TIMEOUT'], connection_pragmas(app.config),
+                         app.config['SHARD_CACHE_SIZE'], app.config['SHARD_CACHE_TTL'])
+    for index in range(len(router)):
+        db = router.connect(index)
+        try:
+            migrate(db)
+            reserve_id_range(db, index)
+        finally:
+            db.close()
+    app.extensions['db_shards'] = router
+    app.cli.add_command(shards_cli)
+
+def shard_loads(router):
+    """
+    Returns {user_id: expense count} for every shard, in DATABASE_SHARDS order.
+    """
+    loads = []
+    for index in range(len(router)):
+        db = router.connect(index)
+        try:
+            loads.append(dict(db.execute('SELECT user_id, COUNT(*) FROM expenses GROUP BY user_id').fetchall()))
+        finally:
+            db.close()
+    return loads
+
+def plan_rebalance(loads, max_moves=None):
+    """
+    Picks users to move so the shards hold similar numbers of expenses.
+
+    Greedy: the largest user on the fullest shard that is smaller than the gap
+    to the emptiest shard moves there, which always narrows the gap, until no
+    such user is left (or max_moves is reached).
+
+    Args:
+        loads: {user_id: expense count} per shard, as from shard_loads.
+
+    Returns:
+        A list of (user_id, source, target) moves.
+    """
+    users = [dict(shard) for shard in loads]
+    totals = [sum(shard.values()) for shard in users]
+    moves = []
+    while max_moves is None or len(moves) < max_moves:
+        source = max(range(len(totals)), key=totals.__getitem__)
+        target = min(range(len(totals)), key=totals.__getitem__)
+        gap = totals[source] - totals[target]
+        candidates = [(count, user_id) for user_id, count in users[source].items() if 0 < count < gap]
+        if not candidates:
+            break
+        count, user_id = max(candidates)
+        del users[source][user_id]
+        users[target][user_id] = count
+        totals[source] -= count
+        totals[target] += count
+        moves.append((user_id, source, target))
+    return moves
+
+def move_user(directory_url, router, user_id, target):
+    """
+    Moves a user's expenses to another shard and points the directory at it.
+
+    The rows are copied under new ids from the target's range, so the shard's
+    triggers rebuild the user's rollup, search index and data version there,
+    then deleted from the source.  Old ids (and cursors holding them) stop
+    resolving; the data version moves on, so ETags and cached pages do too.
+    The source shard's write lock is held from the copy until the directory
+    is updated, so no write to the user is lost in between; a request
+    that looked up the user's shard before the move and writes after it still
+    lands on the old shard, so run moves when the user is idle, or with the
+    app stopped.  This process's shard cache forgets the user; other processes
+    keep routing them to the old shard for up to SHARD_CACHE_TTL seconds.
+
+    Returns:
+        The number of expenses moved.
+    """
+    db = connect(directory_url)
+    try:
+        row = db.execute('SELECT shard FROM users WHERE id = ?', (user_id,)).fetchone()
+        if row is None:
+            raise click.ClickException(f'No user with id {user_id}.')
+        source = row['shard']
+        if source == target:
+            return 0
+        # A shard may share the directory's file (e.g. the original database as shard 0).
+        schemas = {}
+        for name, index in (('source', source), ('target', target)):
+            if os.path.abspath(router.urls[index]) == os.path.abspath(directory_url):
+                schemas[name] = 'main'
+            else:
+                db.execute(f'ATTACH DATABASE ? AS {name}', (router.urls[index],))
+                schemas[name] = name
+        source_schema, target_schema = schemas['source'], schemas['target']
+        columns = [r['name'] for r in db.execute(f'PRAGMA {source_schema}.table_info(expenses)')]
+        with db:
+            # IMMEDIATE takes the write lock of every attached database before the copy reads.
+            db.execute('BEGIN IMMEDIATE')
+            # New ids continue the target's own range (AUTOINCREMENT would otherwise carry on
+            # from the largest id copied in, inside another shard's range); occurrences follow
+            # their template to its new id.
+            db.execute('DROP TABLE IF EXISTS temp.moved_ids')
+            db.execute(f'''CREATE TEMP TABLE moved_ids AS
+                          SELECT id AS old_id, (SELECT seq FROM {target_schema}.sqlite_sequence WHERE name = 'expenses')
+                                               + ROW_NUMBER() OVER (ORDER BY id) AS new_id
+                          FROM {source_schema}.expenses WHERE user_id = ?''', (user_id,))
+            copied = ', '.join('moved.new_id' if name == 'id' else
+                               '(SELECT new_id FROM moved_ids WHERE old_id = expenses.template_id)' if name == 'template_id' else
+                               f'expenses.{name}' for name in columns)
+            moved = db.execute(f'''INSERT INTO {target_schema}.expenses ({', '.join(columns)})
+                                  SELECT {copied} FROM {source_schema}.expenses AS expenses
+                                  JOIN moved_ids AS moved ON moved.old_id = expenses.id ORDER BY moved.new_id''').rowcount
+            # Continue past the version the source reached, so cache keys never repeat.
+            db.execute(f'''INSERT INTO {target_schema}.user_data_versions (user_id, version)
+                          SELECT ?, COALESCE((SELECT version FROM {source_schema}.user_data_versions WHERE user_id = ?), 0) + 1 WHERE true
+                          ON CONFLICT (user_id) DO UPDATE SET version = MAX(version, excluded.version) + 1''', (user_id, user_id))
+            db.execute(f'DELETE FROM {source_schema}.expenses WHERE user_id = ?', (user_id,))
+            db.execute(f'DELETE FROM {source_schema}.user_data_versions WHERE user_id = ?', (user_id,))
+            db.execute('UPDATE main.users SET shard = ? WHERE id = ?', (target, user_id))
+            db.execute('DROP TABLE temp.moved_ids')
+        router.forget_shard(user_id)
+        return moved
+    finally:
+        db.close()
+
+@click.group('shards')
+def shards_cli():
+    """Inspect and rebalance the DATABASE_SHARDS databases."""
+
+@shards_cli.command('status')
+@with_appcontext
+def status_command():
+    """Print the users and expenses held by each shard."""
+    router = get_shard_router()
+    directory = dict(get_directory_db().execute('SELECT shard, COUNT(*) FROM users GROUP BY shard').fetchall())
+    for index, loads in enumerate(shard_loads(router)):
+        click.echo(f'{index}  {router.urls[index]}  users={directory.get(index, 0)}  expenses={sum(loads.values())}')
+
+@shards_cli.command('move')
+@click.argument('user_id', type=int)
+@click.argument('target', type=int)
+@with_appcontext
+def move_command(user_id, target):
+    """Move USER_ID's expenses to shard TARGET."""
+    router = get_shard_router()
+    if not 0 <= target < len(router):
+        raise click.BadParameter(f'there are {len(router)} shards', param_hint='TARGET')
+    moved = move_user(current_app.config['DATABASE_URL'], router, user_id, target)
+    click.echo(f'Moved {moved} expenses of user {user_id} to shard {target}.')
+
+@shards_cli.command('rebalance')
+@click.option('--dry-run', is_flag=True, help='Only print the moves.')
+@click.option('--max-moves', type=int, default=None, help='Stop after this many users.')
+@with_appcontext
+def rebalance_command(dry_run, max_moves):
+    """Move users until the shards hold similar numbers of expenses.
+
+    After appending a shard to DATABASE_SHARDS this fills it; users placed
+    before it existed stay where they are until moved.
+    """
+    router = get_shard_router()
+    moves = plan_rebalance(shard_loads(router), max_moves)
+    for user_id, source, target in moves:
+        if dry_run:
+            click.echo(f'user {user_id}: shard {source} -> {target}')
+        else:
+            moved = move_user(current_app.config['DATABASE_URL'], router, user_id, target)
+            click.echo(f'user {user_id}: shard {source} -> {target} ({moved} expenses)')
+    click.echo(f'{len(moves)} users {"to move" if dry_run else "moved"}.')
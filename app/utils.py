@@ -1,4 +1,8 @@
+import base64
+import json
+import math
 from datetime import datetime, timezone
+from decimal import Decimal, ROUND_HALF_EVEN
 
 def validate_date_format(date_str):
     """
@@ -21,6 +25,24 @@ def validate_recurrence_flag(recurrence_flag_str):
         return False
     return True
 
+# Amounts are stored as cents in a SQLite INTEGER, which is signed 64-bit.
+MAX_CENTS = 2 ** 63 - 1
+
+def validate_amount(amount):
+    """
+    Validates that a numeric amount can be stored.
+
+    Args:
+        amount: An int or float amount (already type-checked, bools excluded).
+
+    Returns:
+        True if the amount is finite and its cents fit in a signed 64-bit
+        integer, False otherwise (NaN, Infinity, 1e20 and so on).
+    """
+    if isinstance(amount, float) and not math.isfinite(amount):
+        return False
+    return -MAX_CENTS - 1 <= to_cents(amount) <= MAX_CENTS
+
 def convert_to_iso(date_str):
     """
     Converts a valid ISO 8601 date or datetime string to a full ISO 8601
@@ -41,4 +63,150 @@ def convert_to_iso(date_str):
             date_obj = datetime.combine(date_obj.date(), datetime.min.time()).replace(tzinfo=timezone.utc)
         return date_obj.isoformat()
     except ValueError:
-        raise ValueError(f"Invalid date format: '{date_str}'.  Expected ISO 8601 (YYYY-MM-DDTHH:MM:SSZ or YYYY-MM-DD).")
\ No newline at end of file
+        raise ValueError(f"Invalid date format: '{date_str}'.  Expected ISO 8601 (YYYY-MM-DDTHH:MM:SSZ or YYYY-MM-DD).")
+
+def to_cents(amount):
+    """
+    Converts an amount in currency units to integer minor units (cents).
+
+    The amount goes through its decimal string, so 0.1 becomes exactly 10;
+    fractions of a cent are rounded half to even.
+
+    Args:
+        amount: An int or float amount, e.g. 12.34.
+
+    Returns:
+        The amount in cents as an int, e.g. 1234.
+    """
+    return int((Decimal(str(amount)) * 100).to_integral_value(ROUND_HALF_EVEN))
+
+def from_cents(cents):
+    """
+    Converts integer cents back to the float amount the API exposes.
+
+    Args:
+        cents: An amount in cents.
+
+    Returns:
+        The amount in currency units, e.g. 12.34 for 1234.
+    """
+    return cents / 100
+
+def to_epoch(value):
+    """
+    Converts an ISO 8601 string or a datetime to a UTC Unix epoch in seconds.
+
+    Naive values are taken as UTC, like the +00:00 that convert_to_iso adds
+    to date-only input.  Fractions of a second are dropped.
+
+    Args:
+        value: An ISO 8601 date or datetime string, or a datetime.
+
+    Returns:
+        The number of whole seconds since 1970-01-01T00:00:00Z.
+
+    Raises:
+        ValueError: If value is a string that is not ISO 8601.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return math.floor(value.timestamp())
+
+def _encode_position(values):
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def _is_int64(value):
+    # Larger ints would make sqlite3 raise OverflowError when bound to the query.
+    return type(value) is int and -2 ** 63 <= value < 2 ** 63
+
+def _decode_position(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        first, expense_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cursor: '{cursor}'.")
+    if not _is_int64(expense_id):
+        raise ValueError(f"Invalid cursor: '{cursor}'.")
+    return first, expense_id
+
+def encode_cursor(date_epoch, expense_id):
+    """
+    Encodes the keyset position of an expense as an opaque pagination cursor.
+
+    Args:
+        date_epoch: The stored date_epoch of the last expense on a page.
+        expense_id: The id of that expense.
+
+    Returns:
+        A URL-safe string to hand back to the client as next_cursor.
+    """
+    return _encode_position([date_epoch, expense_id])
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor produced by encode_cursor.
+
+    Args:
+        cursor: The cursor string received from the client.
+
+    Returns:
+        A (date_epoch, expense_id) tuple.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    date_epoch, expense_id = _decode_position(cursor)
+    if not _is_int64(date_epoch):
+        raise ValueError(f"Invalid cursor: '{cursor}'.")
+    return date_epoch, expense_id
+
+def encode_search_cursor(rank, expense_id):
+    """
+    Encodes the position of a search result as an opaque pagination cursor.
+
+    Args:
+        rank: The bm25 rank of the last result on a page (lower ranks first).
+        expense_id: The id of that expense.
+
+    Returns:
+        A URL-safe string to hand back to the client as next_cursor.
+    """
+    return _encode_position([rank, expense_id])
+
+def decode_search_cursor(cursor):
+    """
+    Decodes a cursor produced by encode_search_cursor.
+
+    Args:
+        cursor: The cursor string received from the client.
+
+    Returns:
+        A (rank, expense_id) tuple.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    rank, expense_id = _decode_position(cursor)
+    if not (_is_int64(rank) or type(rank) is float and math.isfinite(rank)):
+        raise ValueError(f"Invalid cursor: '{cursor}'.")
+    return float(rank), expense_id
+
+def search_terms(text):
+    """
+    Splits a search box string into FTS5 prefix terms.
+
+    Every word is quoted, so FTS5 operators and punctuation in user input are
+    matched as text, and gets a trailing * so partial words match.  Words
+    without a letter or digit are dropped, since they would index no tokens.
+
+    Args:
+        text: The raw search string, e.g. 'uber airport'.
+
+    Returns:
+        The FTS5 expression, e.g. '"uber"* "airport"*', or None if no word is left.
+    """
+    terms = ['"' + word.replace('"', '""') + '"*' for word in text.split() if any(c.isalnum() for c in word)]
+    return ' '.join(terms) or None
@@ -0,0 +1,75 @@
+"""
+Latency of the /reports analytics (per-category percentiles, a 30-day moving
+average and anomaly flags) over a user's whole history: a pure-Python loop
+over Expense objects against app/analytics.py on array.array and on NumPy.
+
+    python -m benchmarks.bench_analytics --rows 1000000
+"""
+import argparse
+import json
+import statistics
+from collections import defaultdict
+
+from app import analytics
+from app.models import Expense, DAY_SECONDS
+from app.utils import to_epoch
+from .common import connect, make_app, measure, seed, temp_database_path
+
+def python_loop(user_id, window=30):
+    # What the statistics would cost computed from get_all_by_user_id.
+    amounts = defaultdict(list)
+    daily = defaultdict(float)
+    for expense in Expense.get_all_by_user_id(user_id):
+        amounts[expense.category].append(expense.amount)
+        daily[to_epoch(expense.date) // DAY_SECONDS] += expense.amount
+    stats = {}
+    flagged = []
+    for category, values in amounts.items():
+        values.sort()
+        median = statistics.median(values)
+        stats[category] = (len(values), median, statistics.quantiles(values, n=10, method='inclusive')[-1])
+        mad = statistics.median(abs(v - median) for v in values)
+        flagged += [v for v in values if mad and analytics.MAD_SCALE * (v - median) / mad > analytics.DEFAULT_ANOMALY_THRESHOLD]
+    first, last = min(daily), max(daily)
+    averages = [sum(daily.get(d, 0) for d in range(day - window + 1, day + 1)) / window for day in range(first, last + 1)]
+    return stats, averages, flagged
+
+def vectorized(user_id, window=30):
+    columns = analytics.load_columns(user_id)
+    averages = analytics.daily_moving_average(user_id, window=window)
+    return analytics.percentiles(columns), averages, analytics.anomalies(columns)
+
+def run_with(backend, fn, *args):
+    saved = analytics.numpy
+    analytics.numpy = backend
+    try:
+        return fn(*args)
+    finally:
+        analytics.numpy = saved
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    path = temp_database_path()
+    db = connect(path)
+    app = make_app(path)
+    # A single power user owns every row, five years of history.
+    seed(db, args.rows, users=1)
+    db.close()
+
+    report = {'rows': args.rows}
+    with app.app_context():
+        report['python_loop'] = measure(lambda: python_loop(1), args.repeat)
+        report['array'] = measure(lambda: run_with(None, vectorized, 1), args.repeat)
+        if analytics.numpy is not None:
+            report['numpy'] = measure(lambda: vectorized(1), args.repeat)
+            columns = analytics.load_columns(1)
+            report['numpy_load_columns'] = measure(lambda: analytics.load_columns(1), args.repeat)
+            report['numpy_stats_only'] = measure(lambda: (analytics.percentiles(columns), analytics.anomalies(columns)), args.repeat)
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
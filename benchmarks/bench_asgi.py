@@ -0,0 +1,136 @@
+"""
+Load test of the sync (threaded WSGI) and async (ASGI under uvicorn) serving
+modes: requests/sec and p50/p95/p99 latency at many concurrent connections.
+
+    python -m benchmarks.bench_asgi --connections 1000 --duration 20
+
+Needs uvicorn for the async mode (pip install uvicorn).  Each server runs in
+its own process against the same seeded database file; every request opens a
+new connection, so both modes see the same number of concurrent sockets.
+"""
+import argparse
+import asyncio
+import json
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+from .common import auth_headers, make_app, temp_database_path
+
+PATH = '/expenses?limit=20'
+POOL_SIZE = 8
+
+def raise_file_limit():
+    # Every concurrent connection is a file descriptor on each side.
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+def serve(mode, path, port):
+    raise_file_limit()
+    app = make_app(path, DATABASE_POOL_SIZE=POOL_SIZE, ASGI_WORKERS=POOL_SIZE)
+    if mode == 'sync':
+        import logging
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+    else:
+        import uvicorn
+        from app.aio import AsgiApp
+        uvicorn.run(AsgiApp(app), host='127.0.0.1', port=port, backlog=4096, log_level='warning', access_log=False)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'server on port {port} did not start')
+
+async def request(port, raw, timeout):
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    try:
+        writer.write(raw)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    return int(response.split(b' ', 2)[1])
+
+async def load(port, headers, connections, duration, timeout):
+    raw = (f'GET {PATH} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n'
+           + ''.join(f'{k}: {v}\r\n' for k, v in headers.items()) + '\r\n').encode()
+    latencies, statuses, errors = [], {}, 0
+    stop = time.monotonic() + duration
+
+    async def client():
+        nonlocal errors
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            try:
+                status = await request(port, raw, timeout)
+            except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(connections)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 1) if latencies else None
+    return {
+        'requests': len(latencies),
+        'requests_per_s': round(statuses.get(200, 0) / elapsed, 1),
+        'p50_ms': percentile(0.50), 'p95_ms': percentile(0.95), 'p99_ms': percentile(0.99),
+        'statuses': statuses, 'errors': errors,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--modes', nargs='+', default=['sync', 'async'], choices=['sync', 'async'])
+    parser.add_argument('--serve', choices=['sync', 'async'], help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args.serve, args.db, args.port)
+
+    raise_file_limit()
+    path = temp_database_path()
+    app = make_app(path, DATABASE_POOL_SIZE=POOL_SIZE)
+    client = app.test_client()
+    headers = auth_headers(client)
+    client.post('/expenses/bulk', headers=headers, json={'expenses': [
+        {'amount': i % 100 + 0.5, 'description': f'Load {i}', 'date': f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}',
+         'category': 'Load', 'recurrence_flag': 'monthly'} for i in range(500)]})
+    app.extensions['db_pool'].close()
+
+    report = {'connections': args.connections, 'duration_s': args.duration, 'path': PATH}
+    for mode in args.modes:
+        port = free_port()
+        server = subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_asgi', '--serve', mode, '--db', path, '--port', str(port)])
+        try:
+            wait_for_port(port)
+            report[mode] = asyncio.run(load(port, headers, args.connections, args.duration, args.timeout))
+        finally:
+            server.terminate()
+            server.wait()
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
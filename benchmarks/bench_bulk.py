@@ -0,0 +1,51 @@
+"""
+Insert throughput of POST /expenses (one request and one commit per row)
+against POST /expenses/bulk (one executemany transaction per batch).
+
+    python -m benchmarks.bench_bulk --rows 2000 --batch 1000
+"""
+import argparse
+import json
+import time
+
+from .common import auth_headers, make_app, temp_database_path
+
+def payload(i):
+    return {'amount': i % 500 + 0.99, 'description': f'Statement line {i}', 'date': '2024-07-28T14:30:00Z',
+            'category': 'Import', 'recurrence_flag': 'monthly'}
+
+def per_row(client, headers, rows):
+    for i in range(rows):
+        response = client.post('/expenses', data=json.dumps(payload(i)), content_type='application/json', headers=headers)
+        assert response.status_code == 201
+
+def bulk(client, headers, rows, batch):
+    for start in range(0, rows, batch):
+        body = {'expenses': [payload(i) for i in range(start, min(start + batch, rows))]}
+        response = client.post('/expenses/bulk', data=json.dumps(body), content_type='application/json', headers=headers)
+        assert response.status_code == 201
+
+def rows_per_second(fn, rows):
+    start = time.perf_counter()
+    fn()
+    return round(rows / (time.perf_counter() - start), 1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=1000)
+    args = parser.parse_args()
+
+    app = make_app(temp_database_path())
+    client = app.test_client()
+    headers = auth_headers(client)
+    report = {
+        'rows': args.rows,
+        'batch': args.batch,
+        'per_row_rows_per_s': rows_per_second(lambda: per_row(client, headers, args.rows), args.rows),
+        'bulk_rows_per_s': rows_per_second(lambda: bulk(client, headers, args.rows, args.batch), args.rows),
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Latency of repeated dashboard polling of /reports/expenses and GET /expenses
+with the response cache disabled and enabled.
+
+    python -m benchmarks.bench_cache --rows 100000
+"""
+import argparse
+import json
+
+from app.cache import response_cache_stats
+from .common import auth_headers, connect, make_app, measure, seed, temp_database_path
+
+PATHS = ['/reports/expenses?start_date=2021-01-01&end_date=2021-12-31', '/expenses?limit=100']
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    report = {'rows': args.rows}
+    for backend in (None, 'memory', 'sqlite'):
+        path = temp_database_path()
+        app = make_app(path, RESPONSE_CACHE_BACKEND=backend, RESPONSE_CACHE_URL=path + '.cache')
+        client = app.test_client()
+        headers = auth_headers(client)
+        db = connect(path)
+        seed(db, args.rows, users=1)
+        db.close()
+        report[backend or 'disabled'] = {
+            p: measure(lambda: client.get(p, headers=headers), args.repeat) for p in PATHS
+        }
+        report[backend or 'disabled']['stats'] = response_cache_stats(app)
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
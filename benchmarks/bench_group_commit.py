@@ -0,0 +1,80 @@
+"""
+Concurrent writers against POST /expenses, committing each insert in its own
+transaction versus through the group commit writer (GROUP_COMMIT_ENABLED).
+
+    python -m benchmarks.bench_group_commit --threads 16 --seconds 10 --synchronous FULL NORMAL
+
+With per-request commits every insert takes the write lock and syncs the WAL
+on its own; under group commit one thread inserts what has queued and syncs
+once for the whole group.  The gain follows the cost of a sync, so compare
+SQLITE_SYNCHRONOUS=FULL (a sync per commit) with NORMAL (syncs only at
+checkpoints in WAL mode).
+"""
+import argparse
+import json
+import threading
+import time
+
+from .common import auth_headers, make_app, summarize, temp_database_path
+
+CONFIGURATIONS = {
+    'per_request_commit': {'GROUP_COMMIT_ENABLED': False},
+    'group_commit': {'GROUP_COMMIT_ENABLED': True},
+}
+
+EXPENSE = json.dumps({'amount': 12.5, 'description': 'Load test', 'date': '2024-07-28T14:30:00Z',
+                      'category': 'Load', 'recurrence_flag': 'monthly'})
+
+def worker(app, headers, deadline, results):
+    client = app.test_client()
+    samples = []
+    errors = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        if client.post('/expenses', data=EXPENSE, content_type='application/json', headers=headers).status_code != 201:
+            errors += 1
+        samples.append((time.perf_counter() - start) * 1000)
+    results.append((samples, errors))
+
+def run(overrides, threads, seconds, synchronous, max_delay):
+    app = make_app(temp_database_path(), DATABASE_POOL_SIZE=threads, SQLITE_SYNCHRONOUS=synchronous,
+                   GROUP_COMMIT_MAX_DELAY=max_delay, **overrides)
+    client = app.test_client()
+    users = [auth_headers(client, f'writer{i}') for i in range(threads)]
+
+    results = []
+    deadline = time.perf_counter() + seconds
+    pool = [threading.Thread(target=worker, args=(app, headers, deadline, results)) for headers in users]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    report = {}
+    for writer in app.extensions.get('group_commit_writers', []):
+        writer.stop()
+        stats = writer.stats()
+        report['mean_group_size'] = round(stats['statements'] / max(stats['batches'], 1), 1)
+    app.extensions['db_pool'].close()
+    samples = [sample for result in results for sample in result[0]]
+    return {
+        'writes': len(samples),
+        'writes_per_s': round(len(samples) / seconds, 1),
+        **summarize(samples),
+        'errors': sum(r[1] for r in results),
+        **report,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--synchronous', nargs='+', default=['FULL', 'NORMAL'])
+    parser.add_argument('--max-delay', type=float, default=0.002, help='GROUP_COMMIT_MAX_DELAY in seconds')
+    args = parser.parse_args()
+
+    report = {f'{name}_{synchronous.lower()}': run(overrides, args.threads, args.seconds, synchronous, args.max_delay)
+              for synchronous in args.synchronous for name, overrides in CONFIGURATIONS.items()}
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Query latency of Expense.get_all_by_user_id style listings before and after
+the index migrations.
+
+    python -m benchmarks.bench_indexes --rows 1000000 10000000
+"""
+import argparse
+import json
+import random
+
+from app.migrations import migrate
+from app.utils import to_epoch
+from .common import CATEGORIES, connect, load_schema, measure, seed, temp_database_path
+
+QUERIES = {
+    'all': ('SELECT * FROM expenses WHERE user_id = ? ORDER BY {date} DESC, id DESC', lambda rng, users, day: (rng.randint(1, users),)),
+    'date_range': ('SELECT * FROM expenses WHERE user_id = ? AND {date} >= ? AND {date} <= ? ORDER BY {date} DESC, id DESC',
+                   lambda rng, users, day: (rng.randint(1, users), day('2022-01-01T00:00:00+00:00'), day('2022-03-31T00:00:00+00:00'))),
+    'category': ('SELECT * FROM expenses WHERE user_id = ? AND category = ? ORDER BY {date} DESC, id DESC',
+                 lambda rng, users, day: (rng.randint(1, users), rng.choice(CATEGORIES))),
+}
+
+def run_queries(db, users, repeat):
+    # The baseline schema filters on the date string; once migrated, on date_epoch.
+    columns = {row[1] for row in db.execute('PRAGMA table_info(expenses)')}
+    date, day = ('date_epoch', to_epoch) if 'date_epoch' in columns else ('date', str)
+    results = {}
+    for name, (query, make_params) in QUERIES.items():
+        rng = random.Random(7)
+        results[name] = measure(lambda: db.execute(query.format(date=date), make_params(rng, users, day)).fetchall(), repeat)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000000, 10000000])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    report = []
+    for rows in args.rows:
+        db = connect(temp_database_path())
+        load_schema(db)
+        seed(db, rows, args.users)
+        before = run_queries(db, args.users, args.repeat)
+        migrate(db)
+        after = run_queries(db, args.users, args.repeat)
+        report.append({'rows': rows, 'users': args.users, 'before': before, 'after': after})
+        db.close()
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
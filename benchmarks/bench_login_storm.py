@@ -0,0 +1,55 @@
+"""
+GET /expenses latency while a storm of logins hashes passwords, with hashing
+inline in the request threads against the bounded process pool.
+
+    python -m benchmarks.bench_login_storm --login-threads 16 --duration 10
+"""
+import argparse
+import json
+import threading
+import time
+
+from .common import auth_headers, make_app, measure, temp_database_path
+
+def storm(client, stop, counts):
+    credentials = {'username': 'benchuser', 'password': 'benchpassword'}
+    while not stop.is_set():
+        status = client.post('/users/login', json=credentials).status_code
+        counts[status] = counts.get(status, 0) + 1
+
+def run(workers, args):
+    app = make_app(temp_database_path(), DATABASE_POOL_SIZE=8, PASSWORD_HASH_METHOD=args.method,
+                   PASSWORD_HASH_WORKERS=workers, PASSWORD_HASH_TIMEOUT=args.hash_timeout)
+    headers = auth_headers(app.test_client())
+    quiet = measure(lambda: app.test_client().get('/expenses?limit=20', headers=headers), args.repeat)
+
+    stop = threading.Event()
+    counts = {}
+    threads = [threading.Thread(target=storm, args=(app.test_client(), stop, counts)) for _ in range(args.login_threads)]
+    for thread in threads:
+        thread.start()
+    time.sleep(1)  # let the storm build up
+    started = time.perf_counter()
+    loaded = measure(lambda: app.test_client().get('/expenses?limit=20', headers=headers), args.repeat)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    app.extensions['password_hasher'].shutdown()
+    return {'expenses_quiet': quiet, 'expenses_during_storm': loaded,
+            'login_statuses': counts, 'logins_per_s': round(counts.get(200, 0) / elapsed, 1)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--login-threads', type=int, default=16)
+    parser.add_argument('--method', default='scrypt:32768:8:1')
+    parser.add_argument('--workers', type=int, default=2, help='hashing processes for the pooled run')
+    parser.add_argument('--hash-timeout', type=float, default=2.0)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    print(json.dumps({'login_threads': args.login_threads, 'method': args.method,
+                      'inline': run(0, args), 'pool': run(args.workers, args)}, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Cost of the /metrics collection on the request path: the per-thread record
+calls on their own, and whole requests with metrics on against off.
+
+    python -m benchmarks.bench_metrics --requests 20000
+"""
+import argparse
+import json
+import threading
+import time
+
+from app.metrics import RequestMetrics
+from .common import make_app, temp_database_path
+
+def record_cost(iterations, threads):
+    # The collector calls the three hooks make, without Flask's request context around them.
+    metrics = RequestMetrics()
+
+    def run():
+        for _ in range(iterations):
+            metrics.start('GET', '/expenses')
+            metrics.set_status(200)
+            metrics.finish()
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return round((time.perf_counter() - started) / (iterations * threads) * 1e6, 3)
+
+def request_cost(requests, rounds):
+    # A 404 touches no database, so the hooks are a visible share of the request.  The two
+    # apps take turns and the best round of each counts, to keep machine noise out of the difference.
+    clients = {enabled: make_app(temp_database_path(), METRICS_ENABLED=enabled).test_client() for enabled in (False, True)}
+    best = {False: float('inf'), True: float('inf')}
+    for _ in range(rounds):
+        for enabled, client in clients.items():
+            started = time.perf_counter()
+            for _ in range(requests):
+                client.get('/no/such/route')
+            best[enabled] = min(best[enabled], (time.perf_counter() - started) / requests * 1e6)
+    return round(best[False], 2), round(best[True], 2)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    off, on = request_cost(args.requests // args.rounds, args.rounds)
+    print(json.dumps({
+        'record_us': record_cost(args.requests, 1),
+        f'record_us_{args.threads}_threads': record_cost(args.requests // args.threads, args.threads),
+        'request_us_metrics_off': off,
+        'request_us_metrics_on': on,
+        'overhead_us_per_request': round(on - off, 2),
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
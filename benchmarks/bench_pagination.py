@@ -0,0 +1,41 @@
+"""
+Page latency of GET /expenses style listings at increasing depth: keyset
+seeking on (date_epoch, id) against LIMIT/OFFSET.
+
+    python -m benchmarks.bench_pagination --rows 200000 --page-size 100
+"""
+import argparse
+import json
+
+from app.migrations import migrate
+from .common import connect, measure, seed, temp_database_path
+
+KEYSET = 'SELECT * FROM expenses WHERE user_id = ? AND (date_epoch, id) < (?, ?) ORDER BY date_epoch DESC, id DESC LIMIT ?'
+OFFSET = 'SELECT * FROM expenses WHERE user_id = ? ORDER BY date_epoch DESC, id DESC LIMIT ? OFFSET ?'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    db = connect(temp_database_path())
+    migrate(db)
+    # A single user owns every row, so depth is measured within one listing.
+    seed(db, args.rows, users=1)
+
+    report = []
+    for fraction in (0, 0.1, 0.5, 0.9):
+        offset = int(args.rows * fraction)
+        boundary = db.execute('SELECT date_epoch, id FROM expenses WHERE user_id = 1 ORDER BY date_epoch DESC, id DESC LIMIT 1 OFFSET ?',
+                              (max(offset - 1, 0),)).fetchone()
+        report.append({
+            'offset': offset,
+            'keyset': measure(lambda: db.execute(KEYSET, (1, boundary['date_epoch'], boundary['id'], args.page_size)).fetchall(), args.repeat),
+            'offset_scan': measure(lambda: db.execute(OFFSET, (1, args.page_size, offset)).fetchall(), args.repeat),
+        })
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Concurrent read/write load against GET /expenses and POST /expenses, comparing
+the old setup (a fresh connection per request, rollback journal) with the
+pooled WAL configuration.
+
+    python -m benchmarks.bench_pool --threads 8 --seconds 10 --write-ratio 0.2
+"""
+import argparse
+import json
+import random
+import sqlite3
+import threading
+import time
+
+from .common import auth_headers, connect, make_app, seed, temp_database_path
+
+CONFIGURATIONS = {
+    'unpooled_rollback_journal': {'DATABASE_POOL_SIZE': 0, 'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL'},
+    'pooled_wal': {'DATABASE_POOL_SIZE': 8, 'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'NORMAL'},
+}
+
+EXPENSE = json.dumps({'amount': 12.5, 'description': 'Load test', 'date': '2024-07-28T14:30:00Z',
+                      'category': 'Load', 'recurrence_flag': 'monthly'})
+
+def worker(app, headers, deadline, write_ratio, seed_value, results):
+    client = app.test_client()
+    rng = random.Random(seed_value)
+    requests = locked = errors = 0
+    while time.perf_counter() < deadline:
+        try:
+            if rng.random() < write_ratio:
+                response = client.post('/expenses', data=EXPENSE, content_type='application/json', headers=headers)
+            else:
+                response = client.get('/expenses?limit=50', headers=headers)
+            if response.status_code >= 500:
+                errors += 1
+        except sqlite3.OperationalError as e:
+            if 'locked' in str(e):
+                locked += 1
+            else:
+                errors += 1
+        requests += 1
+    results.append((requests, locked, errors))
+
+def run(overrides, threads, seconds, write_ratio, rows):
+    path = temp_database_path()
+    app = make_app(path, **overrides)
+    headers = auth_headers(app.test_client())
+    db = connect(path)
+    seed(db, rows, users=1)
+    db.close()
+
+    results = []
+    deadline = time.perf_counter() + seconds
+    pool = [threading.Thread(target=worker, args=(app, headers, deadline, write_ratio, i, results)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    requests = sum(r[0] for r in results)
+    return {
+        'requests': requests,
+        'requests_per_s': round(requests / seconds, 1),
+        'database_locked_errors': sum(r[1] for r in results),
+        'other_errors': sum(r[2] for r in results),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--rows', type=int, default=10000)
+    args = parser.parse_args()
+
+    report = {name: run(overrides, args.threads, args.seconds, args.write_ratio, args.rows)
+              for name, overrides in CONFIGURATIONS.items()}
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
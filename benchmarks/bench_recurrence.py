@@ -0,0 +1,62 @@
+"""
+Time for one recurrence scheduler pass over N due templates, and for the
+following no-op pass that proves the run is idempotent.
+
+    python -m benchmarks.bench_recurrence --templates 1000000 --budget 120
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.migrations import migrate
+from app.recurrence import generate_due_occurrences
+from app.utils import to_epoch
+from .common import CATEGORIES, RECURRENCE_FLAGS, connect, temp_database_path
+
+NOW = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+def seed_templates(db, templates, users=1000, batch=50000):
+    # Templates dated within the last two days, so each pass has real work to do.
+    rng = random.Random(3)
+    db.execute('PRAGMA synchronous = OFF')
+    dates = ((NOW - timedelta(seconds=rng.randrange(2 * 86400))) for _ in range(templates))
+    rows = ((rng.randint(1, users), rng.randint(100, 50000), 'Subscription', date.isoformat(), to_epoch(date),
+             rng.choice(CATEGORIES), rng.choice(RECURRENCE_FLAGS), 1) for date in dates)
+    while True:
+        chunk = [row for _, row in zip(range(batch), rows)]
+        if not chunk:
+            break
+        db.executemany('INSERT INTO expenses (user_id, amount_cents, description, date, date_epoch, category, recurrence_flag, recurring) VALUES (?,?,?,?,?,?,?,?)', chunk)
+    db.commit()
+    db.execute('PRAGMA synchronous = NORMAL')
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, round(time.perf_counter() - start, 3)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--templates', type=int, default=1000000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--budget', type=float, default=120, help='seconds allowed for the first pass')
+    args = parser.parse_args()
+
+    db = connect(temp_database_path())
+    db.execute('PRAGMA journal_mode = WAL')
+    migrate(db)
+    seed_templates(db, args.templates)
+
+    first, first_seconds = timed(lambda: generate_due_occurrences(db, now=NOW, batch_size=args.batch_size))
+    second, second_seconds = timed(lambda: generate_due_occurrences(db, now=NOW, batch_size=args.batch_size))
+    print(json.dumps({
+        'templates': args.templates,
+        'first_pass': dict(first, seconds=first_seconds, templates_per_s=round(first['templates'] / first_seconds)),
+        'second_pass': dict(second, seconds=second_seconds),
+        'within_budget': first_seconds <= args.budget,
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
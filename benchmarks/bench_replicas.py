@@ -0,0 +1,98 @@
+"""
+Mixed read/write load (GET /expenses, GET /reports/expenses, POST /expenses)
+with reads on the primary, on read-only connections and on a refreshed
+snapshot (DATABASE_READ_MODE).
+
+    python -m benchmarks.bench_replicas --threads 8 --seconds 10 --write-ratio 0.05
+
+Each thread is its own user, so read-your-writes stickiness sends a thread's
+reads to the primary after each of its writes until the next snapshot
+(--refresh seconds).  Reported per mode: requests/sec, latency per request
+kind and the share of reads served by the replica.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+
+from .common import auth_headers, connect, make_app, seed, summarize, temp_database_path
+
+MODES = [None, 'readonly', 'snapshot']
+
+EXPENSE = json.dumps({'amount': 12.5, 'description': 'Load test', 'date': '2024-07-28T14:30:00Z',
+                      'category': 'Load', 'recurrence_flag': 'monthly'})
+
+def worker(app, headers, deadline, write_ratio, seed_value, results):
+    client = app.test_client()
+    rng = random.Random(seed_value)
+    samples = {'list': [], 'report': [], 'write': []}
+    errors = 0
+    while time.perf_counter() < deadline:
+        roll = rng.random()
+        start = time.perf_counter()
+        if roll < write_ratio:
+            kind, response = 'write', client.post('/expenses', data=EXPENSE, content_type='application/json', headers=headers)
+        elif roll < (1 + write_ratio) / 2:
+            kind, response = 'list', client.get('/expenses?limit=50', headers=headers)
+        else:
+            kind, response = 'report', client.get('/reports/expenses?start_date=2022-01-01&end_date=2022-12-31', headers=headers)
+        samples[kind].append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            errors += 1
+    results.append((samples, errors))
+
+def prepare(threads, rows):
+    # Users are registered (so they can log in) before the bulk load fills in their expenses.
+    path = temp_database_path()
+    app = make_app(path, DATABASE_POOL_SIZE=0)
+    client = app.test_client()
+    users = [auth_headers(client, f'reader{i}') for i in range(threads)]
+    db = connect(path)
+    seed(db, rows, users=threads)
+    db.close()
+    return path, users
+
+def run(path, users, mode, seconds, write_ratio, refresh):
+    app = make_app(path, DATABASE_POOL_SIZE=len(users), RESPONSE_CACHE_BACKEND=None, DATABASE_READ_MODE=mode,
+                   DATABASE_READ_REFRESH=refresh)
+    results = []
+    deadline = time.perf_counter() + seconds
+    pool = [threading.Thread(target=worker, args=(app, headers, deadline, write_ratio, i, results)) for i, headers in enumerate(users)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    report = {}
+    replicas = app.extensions.get('db_replicas')
+    if replicas is not None:
+        if 'db_snapshot_refresher' in app.extensions:
+            app.extensions['db_snapshot_refresher'].stop()
+        stats = replicas.stats()
+        report['replica_read_share'] = round(stats['replica_reads'] / max(stats['replica_reads'] + stats['sticky_reads'], 1), 3)
+        replicas.close()
+    app.extensions['db_pool'].close()
+    requests = sum(len(s) for result in results for s in result[0].values())
+    return {
+        'requests': requests,
+        'requests_per_s': round(requests / seconds, 1),
+        **{kind: summarize([x for result in results for x in result[0][kind]]) for kind in ('list', 'report', 'write')},
+        'errors': sum(r[1] for r in results),
+        **report,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.05)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--refresh', type=float, default=1.0, help='DATABASE_READ_REFRESH in seconds')
+    args = parser.parse_args()
+
+    path, users = prepare(args.threads, args.rows)
+    report = {mode or 'primary': run(path, users, mode, args.seconds, args.write_ratio, args.refresh) for mode in MODES}
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
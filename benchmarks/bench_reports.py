@@ -0,0 +1,58 @@
+"""
+Latency and peak memory of the /reports/expenses aggregation: the old
+Python summation over Expense objects against the SQL GROUP BY.
+
+    python -m benchmarks.bench_reports --rows 10000 100000 1000000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from app.models import Expense
+from .common import connect, make_app, seed, temp_database_path
+
+def python_totals(user_id):
+    totals = {}
+    for expense in Expense.get_all_by_user_id(user_id):
+        if expense.category in totals:
+            totals[expense.category] += expense.amount
+        else:
+            totals[expense.category] = expense.amount
+    return totals
+
+def sql_totals(user_id):
+    return Expense.total_by_category(user_id)
+
+def profile(fn, user_id):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn(user_id)
+    elapsed = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'ms': round(elapsed, 3), 'peak_kib': round(peak / 1024, 1)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    report = []
+    for rows in args.rows:
+        path = temp_database_path()
+        app = make_app(path)
+        with app.app_context():
+            # A single power user owns every row.
+            db = connect(path)
+            seed(db, rows, users=1)
+            db.close()
+            report.append({
+                'rows': rows,
+                'python': profile(python_totals, 1),
+                'sql': profile(sql_totals, 1),
+            })
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
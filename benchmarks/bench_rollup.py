@@ -0,0 +1,51 @@
+"""
+Latency of /reports/expenses range reports answered from the
+expense_daily_totals rollup against a GROUP BY over the raw expenses rows.
+
+    python -m benchmarks.bench_rollup --rows 1000000
+"""
+import argparse
+import json
+
+from app.models import Expense
+from app.utils import to_epoch
+from .common import connect, make_app, measure, seed, temp_database_path
+
+RANGES = {
+    '1_month': ('2022-03-01T12:00:00+00:00', '2022-03-31T12:00:00+00:00'),
+    '1_year': ('2022-01-01T12:00:00+00:00', '2022-12-31T12:00:00+00:00'),
+    'all_time': (None, None),
+}
+
+RAW_QUERY = 'SELECT category, SUM(amount_cents) FROM expenses WHERE user_id = ?'
+
+def raw_totals(db, start_date, end_date):
+    query, params = RAW_QUERY, [1]
+    if start_date:
+        query += ' AND date_epoch >= ? AND date_epoch <= ?'
+        params += [to_epoch(start_date), to_epoch(end_date)]
+    return dict(db.execute(query + ' GROUP BY category', params).fetchall())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    path = temp_database_path()
+    app = make_app(path)
+    db = connect(path)
+    # A single power user owns every row; the rollup triggers fire during the load.
+    seed(db, args.rows, users=1)
+
+    report = {'rows': args.rows}
+    with app.app_context():
+        for name, (start_date, end_date) in RANGES.items():
+            report[name] = {
+                'raw_rows': measure(lambda: raw_totals(db, start_date, end_date), args.repeat),
+                'rollup': measure(lambda: Expense.total_by_category(1, start_date, end_date), args.repeat),
+            }
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Description search through the FTS5 index (GET /expenses/search) against a
+LIKE '%term%' scan, for a frequent and a rare word.
+
+    python -m benchmarks.bench_search --rows 1000000 --users 100
+"""
+import argparse
+import json
+import random
+import time
+
+from app.migrations import migrate
+from app.models import Expense
+from app.utils import search_terms
+from .common import connect, make_app, measure, seed, temp_database_path
+
+MERCHANTS = ['Uber', 'Lyft', 'Amazon', 'Walmart', 'Starbucks', 'Shell', 'Netflix', 'Spotify', 'Costco', 'Target',
+             'Airbnb', 'Delta', 'Whole Foods', 'Trader Joes', 'IKEA', 'Apple', 'Chipotle', 'CVS', 'Home Depot', 'Landlord']
+WORDS = ['ride', 'groceries', 'subscription', 'fuel', 'coffee', 'rent', 'flight', 'lunch', 'dinner', 'pharmacy',
+         'furniture', 'hotel', 'tools', 'gift', 'snacks', 'parking', 'office', 'books', 'repair', 'tickets']
+
+def description(rng):
+    # A handful of merchants dominate, as in real statements; 'zanzibar' is rare.
+    merchant = MERCHANTS[min(int(rng.expovariate(0.25)), len(MERCHANTS) - 1)]
+    extra = ' zanzibar' if rng.random() < 0.0005 else ''
+    return f'{merchant} {rng.choice(WORDS)} {rng.choice(WORDS)}{extra}'
+
+LIKE_USER = '''SELECT * FROM expenses WHERE user_id = ? AND (description LIKE ? OR category LIKE ?)
+               ORDER BY date_epoch DESC, id DESC LIMIT ?'''
+LIKE_ALL = 'SELECT COUNT(*) FROM expenses WHERE description LIKE ? OR category LIKE ?'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    path = temp_database_path()
+    db = connect(path)
+    migrate(db)
+    start = time.perf_counter()
+    seed(db, args.rows, args.users, descriptions=description)
+    report = {'rows': args.rows, 'users': args.users, 'seed_seconds': round(time.perf_counter() - start, 1),
+              'index_bytes': db.execute("SELECT SUM(pgsize) FROM dbstat WHERE name LIKE 'expenses_fts%'").fetchone()[0]}
+
+    app = make_app(path)
+    for word in ('uber', 'zanzibar'):
+        rng = random.Random(3)
+        pattern = f'%{word}%'
+        matches = db.execute(LIKE_ALL, (pattern, pattern)).fetchone()[0]
+        with app.app_context():
+            fts = measure(lambda: Expense.search(rng.randint(1, args.users), search_terms(word), args.limit), args.repeat)
+        like_user = measure(lambda: db.execute(LIKE_USER, (rng.randint(1, args.users), pattern, pattern, args.limit)).fetchall(), args.repeat)
+        like_all = measure(lambda: db.execute(LIKE_ALL, (pattern, pattern)).fetchone(), max(1, args.repeat // 10))
+        report[word] = {'matching_rows': matches, 'fts_per_user': fts, 'like_per_user': like_user, 'like_whole_table': like_all}
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
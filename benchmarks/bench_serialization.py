@@ -0,0 +1,60 @@
+"""
+Time and memory to turn a 100k-row expense listing into a JSON body: the old
+path (sqlite3.Row -> Expense -> dict -> Flask's encoder) against plain cursor
+tuples with the standard library encoder and with orjson.
+
+    python -m benchmarks.bench_serialization --rows 100000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from app.models import Expense
+from app.serialization import expense_dicts, get_encoder, orjson
+from .common import connect, make_app, seed, temp_database_path
+
+def legacy(app):
+    expenses = Expense.get_all_by_user_id(1)
+    data = [{'id': e.id, 'user_id': e.user_id, 'amount': e.amount, 'description': e.description, 'date': e.date,
+             'category': e.category, 'recurrence_flag': e.recurrence_flag} for e in expenses]
+    return app.json.dumps(data).encode('utf-8')
+
+def rows(encoder):
+    def build(app):
+        return encoder(expense_dicts(Expense.iter_api_rows(1)))
+    return build
+
+def run(app, build, repeat):
+    with app.app_context():
+        build(app)  # warm the page cache
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = build(app)
+            best = min(best, time.perf_counter() - start)
+        tracemalloc.start()
+        build(app)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {'best_ms': round(best * 1000, 1), 'peak_mib': round(peak / 2 ** 20, 1), 'body_bytes': len(body)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    path = temp_database_path()
+    app = make_app(path)
+    db = connect(path)
+    seed(db, args.rows, users=1)
+    db.close()
+
+    variants = {'row_object_dict_flask': legacy, 'tuple_dict_json': rows(get_encoder('json'))}
+    if orjson is not None:
+        variants['tuple_dict_orjson'] = rows(get_encoder('orjson'))
+    print(json.dumps({'rows': args.rows, **{name: run(app, build, args.repeat) for name, build in variants.items()}}, indent=2))
+
+if __name__ == '__main__':
+    main()
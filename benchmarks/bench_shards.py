@@ -0,0 +1,78 @@
+"""
+Concurrent writers against POST /expenses with the expenses on 1, 2 and 4
+shards (DATABASE_SHARDS), each thread writing as its own user.
+
+    python -m benchmarks.bench_shards --threads 8 --seconds 10 --shards 1 2 4
+
+Every shard has its own write lock and WAL, so commits of users on different
+shards no longer queue behind each other.  SQLITE_SYNCHRONOUS defaults to
+FULL here so every commit waits for its fsync, which is the part shards
+overlap; with NORMAL a commit is mostly CPU and the gain shrinks to the lock
+hand-offs saved.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .common import auth_headers, make_app, summarize, temp_database_path
+
+EXPENSE = json.dumps({'amount': 12.5, 'description': 'Load test', 'date': '2024-07-28T14:30:00Z',
+                      'category': 'Load', 'recurrence_flag': 'monthly'})
+
+def worker(app, headers, deadline, results):
+    client = app.test_client()
+    samples = []
+    locked = errors = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if client.post('/expenses', data=EXPENSE, content_type='application/json', headers=headers).status_code != 201:
+                errors += 1
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            locked += 1
+        samples.append((time.perf_counter() - start) * 1000)
+    results.append((samples, locked, errors))
+
+def run(shards, threads, seconds, synchronous):
+    directory = temp_database_path('directory.db')
+    urls = [os.path.join(os.path.dirname(directory), f'shard{i}.db') for i in range(shards)]
+    app = make_app(directory, DATABASE_SHARDS=urls, DATABASE_POOL_SIZE=threads, SQLITE_SYNCHRONOUS=synchronous)
+    client = app.test_client()
+    # Consecutive user ids, so placement (user_id % shards) spreads the writers evenly.
+    users = [auth_headers(client, f'writer{i}') for i in range(threads)]
+
+    results = []
+    deadline = time.perf_counter() + seconds
+    pool = [threading.Thread(target=worker, args=(app, headers, deadline, results)) for headers in users]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    app.extensions['db_shards'].close()
+    samples = [sample for result in results for sample in result[0]]
+    return {
+        'writes': len(samples),
+        'writes_per_s': round(len(samples) / seconds, 1),
+        **summarize(samples),
+        'database_locked_errors': sum(r[1] for r in results),
+        'other_errors': sum(r[2] for r in results),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--synchronous', default='FULL')
+    args = parser.parse_args()
+
+    report = {f'{shards}_shards': run(shards, args.threads, args.seconds, args.synchronous) for shards in args.shards}
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Index size and query time with amounts as REAL and dates as ISO strings
+(schema version 6) against integer cents and epoch dates (migration 0007).
+
+    python -m benchmarks.bench_storage --rows 1000000
+"""
+import argparse
+import json
+import random
+import time
+
+from app.migrations import migrate
+from app.utils import to_epoch
+from .common import CATEGORIES, connect, measure, seed, temp_database_path
+
+START, END = '2022-01-01T00:00:00+00:00', '2022-03-31T00:00:00+00:00'
+
+# The same three queries, written against each layout.
+QUERIES = {
+    'text_real': {
+        'range_page': ('SELECT * FROM expenses WHERE user_id = ? AND date >= ? AND date <= ? ORDER BY date DESC, id DESC LIMIT 100', (START, END)),
+        'range_sum': ('SELECT category, SUM(amount) FROM expenses WHERE user_id = ? AND date >= ? AND date <= ? GROUP BY category', (START, END)),
+        'category_page': ('SELECT * FROM expenses WHERE user_id = ? AND category = ? ORDER BY date DESC, id DESC LIMIT 100', ()),
+    },
+    'integer': {
+        'range_page': ('SELECT * FROM expenses WHERE user_id = ? AND date_epoch >= ? AND date_epoch <= ? ORDER BY date_epoch DESC, id DESC LIMIT 100',
+                       (to_epoch(START), to_epoch(END))),
+        'range_sum': ('SELECT category, SUM(amount_cents) FROM expenses WHERE user_id = ? AND date_epoch >= ? AND date_epoch <= ? GROUP BY category',
+                      (to_epoch(START), to_epoch(END))),
+        'category_page': ('SELECT * FROM expenses WHERE user_id = ? AND category = ? ORDER BY date_epoch DESC, id DESC LIMIT 100', ()),
+    },
+}
+
+def object_sizes(db):
+    # Bytes per table and index, from the dbstat virtual table.
+    return {row[0]: row[1] for row in db.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name ORDER BY name')
+            if row[0] == 'expenses' or row[0].startswith('idx_expenses')}
+
+def run_queries(db, layout, users, repeat):
+    results = {}
+    for name, (query, bounds) in QUERIES[layout].items():
+        rng = random.Random(7)
+        def params():
+            user_id = rng.randint(1, users)
+            return (user_id, rng.choice(CATEGORIES)) if name == 'category_page' else (user_id,) + bounds
+        results[name] = measure(lambda: db.execute(query, params()).fetchall(), repeat)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    db = connect(temp_database_path())
+    migrate(db, target=6)
+    seed(db, args.rows, args.users)
+    db.execute('VACUUM')
+    report = {'rows': args.rows, 'users': args.users}
+    report['text_real'] = {'bytes': object_sizes(db), 'queries': run_queries(db, 'text_real', args.users, args.repeat)}
+
+    start = time.perf_counter()
+    migrate(db)
+    migration_seconds = round(time.perf_counter() - start, 3)
+    db.execute('VACUUM')
+    report['integer'] = {'bytes': object_sizes(db), 'queries': run_queries(db, 'integer', args.users, args.repeat),
+                         'migration_seconds': migration_seconds}
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
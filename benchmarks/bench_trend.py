@@ -0,0 +1,58 @@
+"""
+Latency of a spending time series: one GET /reports/trend against the
+dashboard approach of one GET /reports/expenses per bucket.
+
+    python -m benchmarks.bench_trend --rows 1000000
+"""
+import argparse
+import json
+from datetime import date, timedelta
+
+from app.models import _iter_bucket_starts
+from .common import connect, make_app, measure, seed, temp_database_path
+from .suite import access_tokens
+
+SERIES = {
+    'day_90': ('day', '2023-01-01', '2023-03-31'),
+    'week_1_year': ('week', '2023-01-02', '2023-12-31'),
+    'month_5_years': ('month', '2020-01-01', '2024-12-31'),
+}
+
+def per_bucket_reports(client, headers, granularity, first, last):
+    # What dashboards did: one category report per bucket, each bucket ending a second before the next starts.
+    starts = list(_iter_bucket_starts(first, last, granularity))
+    ends = starts[1:] + [(date.fromisoformat(last) + timedelta(days=1)).isoformat()]
+    for start, end in zip(starts, ends):
+        query = {'start_date': start, 'end_date': f'{date.fromisoformat(end) - timedelta(days=1)}T23:59:59Z'}
+        assert client.get('/reports/expenses', headers=headers, query_string=query).status_code == 200
+    return len(starts)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    path = temp_database_path()
+    db = connect(path)
+    app = make_app(path)
+    # A single power user owns every row, five years of history.
+    seed(db, args.rows, users=1)
+    db.close()
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {access_tokens(app, 1)[1]}'}
+    report = {'rows': args.rows}
+    for name, (granularity, first, last) in SERIES.items():
+        query = {'granularity': granularity, 'start_date': first, 'end_date': f'{last}T23:59:59Z'}
+        response = client.get('/reports/trend', headers=headers, query_string=query)
+        assert response.status_code == 200
+        report[name] = {
+            'buckets': len(response.get_json()['buckets']),
+            'trend': measure(lambda: client.get('/reports/trend', headers=headers, query_string=query), args.repeat),
+            'report_per_bucket': measure(lambda: per_bucket_reports(client, headers, granularity, first, last), args.repeat),
+        }
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Storage and listing latency for recurring expenses kept as materialized rows
+against templates expanded on read (RECURRENCE_MODE = 'virtual').
+
+    python -m benchmarks.bench_virtual_recurrence --templates 200 --years 3
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from app.models import Expense
+from app.recurrence import generate_due_occurrences
+from .common import CATEGORIES, RECURRENCE_FLAGS, make_app, measure, temp_database_path
+
+NOW = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+def build(path, templates, years):
+    # One user owns every template, each anchored `years` before NOW.
+    app = make_app(path)
+    with app.app_context():
+        start = NOW - timedelta(days=365 * years)
+        Expense.save_all([Expense(user_id=1, amount=9.99, description='Subscription', date=(start + timedelta(hours=i)).isoformat(),
+                                  category=CATEGORIES[i % len(CATEGORIES)], recurrence_flag=RECURRENCE_FLAGS[i % len(RECURRENCE_FLAGS)], recurring=True)
+                          for i in range(templates)])
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--templates', type=int, default=200)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    window = ((NOW - timedelta(days=30)).isoformat(), NOW.isoformat())
+    report = {'templates': args.templates, 'years': args.years}
+    for mode in ('materialized', 'virtual'):
+        path = temp_database_path(f'recurrence_{mode}.db')
+        app = build(path, args.templates, args.years)
+        expand = mode == 'virtual'
+        with app.app_context():
+            from app.database import get_db
+            if not expand:
+                generate_due_occurrences(get_db(), now=NOW)
+            report[mode] = {
+                'rows': get_db().execute('SELECT COUNT(*) FROM expenses').fetchone()[0],
+                'file_bytes': os.path.getsize(path),
+                'first_page': measure(lambda: Expense.get_all_by_user_id(1, limit=args.page_size, expand_recurring=expand, now=NOW), args.repeat),
+                'last_30_days': measure(lambda: Expense.get_all_by_user_id(1, *window, expand_recurring=expand, now=NOW), args.repeat),
+                'report_last_30_days': measure(lambda: Expense.total_by_category(1, *window, expand_recurring=expand, now=NOW), args.repeat),
+            }
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
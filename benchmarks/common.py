@@ -0,0 +1,134 @@
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+CATEGORIES = ['Food', 'Travel', 'Rent', 'Utilities', 'Health', 'Entertainment', 'Shopping', 'Education']
+RECURRENCE_FLAGS = ['daily', 'weekly', 'monthly']
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+def temp_database_path(name='bench.db'):
+    return os.path.join(tempfile.mkdtemp(prefix='expense-bench-'), name)
+
+def connect(path):
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    return db
+
+def load_schema(db):
+    """Creates the baseline tables only, i.e. the schema as it was before any migration."""
+    from app.migrations import SCHEMA_PATH
+    with open(SCHEMA_PATH, 'r') as f:
+        db.executescript(f.read())
+
+def synthetic_expenses(rows, users, seed=42, days=5 * 365, descriptions=None):
+    # descriptions: optional function of a random.Random returning a description.  It gets
+    # its own generator, so the other columns are the same with or without it.
+    rng = random.Random(seed)
+    text_rng = random.Random(seed + 1)
+    for _ in range(rows):
+        date = EPOCH + timedelta(seconds=rng.randrange(days * 86400))
+        yield (rng.randint(1, users), round(rng.uniform(1, 500), 2), descriptions(text_rng) if descriptions else 'Synthetic expense',
+               date.isoformat(), rng.choice(CATEGORIES), rng.choice(RECURRENCE_FLAGS))
+
+def seed(db, rows, users, batch=50000, descriptions=None):
+    """
+    Bulk loads synthetic users and expenses as fast as SQLite allows.
+
+    fsync is switched off for the load and every batch is written with
+    executemany inside a single transaction.  The indexes and triggers on
+    expenses are dropped first and recreated afterwards, with the report rollup,
+    data versions and search index rebuilt in one pass each, since building an index over
+    sorted input is far cheaper than maintaining it and the triggers row by row.
+    Works on the baseline schema (amount, date) and on the current one
+    (amount_cents, date_epoch).
+    """
+    columns = {row[1] for row in db.execute('PRAGMA table_info(expenses)')}
+    tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    deferred = db.execute('''SELECT type, name, sql FROM sqlite_master
+                             WHERE tbl_name = 'expenses' AND type IN ('index', 'trigger') AND sql IS NOT NULL''').fetchall()
+    db.execute('PRAGMA synchronous = OFF')
+    for kind, name, _ in deferred:
+        db.execute(f'DROP {kind.upper()} {name}')
+    db.executemany('INSERT OR IGNORE INTO users (id, username, password_hash) VALUES (?,?,?)',
+                   ((i, f'bench{i}', 'x') for i in range(1, users + 1)))
+    expenses = synthetic_expenses(rows, users, descriptions=descriptions)
+    while True:
+        chunk = [row for _, row in zip(range(batch), expenses)]
+        if not chunk:
+            break
+        if 'amount_cents' in columns:
+            # Amounts have two decimals and dates are whole UTC seconds, so this matches to_cents/to_epoch.
+            # The rows are one-off expenses (recurring defaults to 0), so nothing is scheduled.
+            db.executemany('''INSERT INTO expenses (user_id, amount_cents, description, date, date_epoch, category, recurrence_flag)
+                              VALUES (?,?,?,?,?,?,?)''', [(u, round(a * 100), d, date, int(datetime.fromisoformat(date).timestamp()), c, f)
+                                                          for u, a, d, date, c, f in chunk])
+        elif 'next_due' in columns:
+            # Schema 6 scheduled every expense with a recurrence_flag, as its trigger would.
+            db.executemany('''INSERT INTO expenses (user_id, amount, description, date, category, recurrence_flag, next_due)
+                              VALUES (?,?,?,?,?,?,?)''', [row + (row[3],) for row in chunk])
+        else:
+            db.executemany('''INSERT INTO expenses (user_id, amount, description, date, category, recurrence_flag)
+                              VALUES (?,?,?,?,?,?)''', chunk)
+    for _, _, sql in deferred:
+        db.execute(sql)
+    if 'user_data_versions' in tables:
+        # WHERE true keeps SQLite from reading ON CONFLICT as part of the SELECT.
+        db.execute('''INSERT INTO user_data_versions (user_id, version) SELECT user_id, COUNT(*) FROM expenses WHERE true GROUP BY user_id
+                      ON CONFLICT (user_id) DO UPDATE SET version = version + excluded.version''')
+    db.commit()
+    if 'expense_daily_totals' in tables:
+        from app.rollup import rebuild_rollup
+        rebuild_rollup(db)
+    if 'expenses_fts' in tables:
+        db.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('rebuild')")
+        db.commit()
+    db.execute('PRAGMA synchronous = FULL')
+
+def summarize(samples):
+    """Latency statistics in milliseconds for a list of samples in milliseconds."""
+    samples = sorted(samples)
+    if not samples:
+        return {'mean_ms': None, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'max_ms': None}
+
+    def percentile(p):
+        return round(samples[min(len(samples) - 1, int(len(samples) * p))], 3)
+    return {
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(samples[-1], 3),
+    }
+
+def measure(fn, repeat):
+    """Calls fn repeat times and returns latency statistics in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+def make_app(path, **overrides):
+    """Creates the Flask app against the database file at path."""
+    from app import create_app
+    from config import TestingConfig
+
+    class BenchmarkConfig(TestingConfig):
+        DATABASE_URL = path
+        JWT_SECRET_KEY = 'benchmark-secret-key-that-is-long-enough'
+    for key, value in overrides.items():
+        setattr(BenchmarkConfig, key, value)
+    return create_app(BenchmarkConfig)
+
+def auth_headers(client, username='benchuser', password='benchpassword'):
+    """Registers a user through the API and returns Authorization headers for it."""
+    import json
+    credentials = json.dumps({'username': username, 'password': password})
+    client.post('/users/register', data=credentials, content_type='application/json')
+    response = client.post('/users/login', data=credentials, content_type='application/json')
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
@@ -0,0 +1,263 @@
+"""
+Load test of every endpoint at a configurable scale, through the Flask test
+client and a real multi-threaded server, with saved baselines to compare against.
+
+    python -m benchmarks.suite --rows 1000000 --users 1000 --save benchmarks/baselines/local.json
+    python -m benchmarks.suite --rows 1000000 --users 1000 --compare benchmarks/baselines/local.json
+
+Seeding 10^7 rows takes a few minutes, so --db keeps the database file and later
+runs against the same (non-empty) path skip the load.  Each scenario is run --requests
+times per driver: one after another in process ('client'), and from --threads
+keep-alive connections against `make_server(threaded=True)` in a subprocess
+('server').  --compare exits with status 1 when a scenario's p95 latency rose,
+or its throughput fell, by more than --tolerance against the baseline.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from .bench_asgi import free_port, wait_for_port
+from .common import CATEGORIES, RECURRENCE_FLAGS, connect, make_app, seed, summarize, temp_database_path
+
+POOL_SIZE = 8
+MONTH = ('2022-03-01T00:00:00Z', '2022-03-31T23:59:59Z')
+
+def scenarios(rng, users, expenses):
+    """
+    name -> function returning (user_id, method, path, body) for one request.
+
+    expenses is a sample of stored (id, user_id) pairs for the single-expense
+    routes.  Every request picks its user at random, so a response cache sees
+    the spread of a real workload rather than one hot key.
+    """
+    def user():
+        return rng.randint(1, users)
+
+    def new_expense():
+        return {'amount': round(rng.uniform(1, 500), 2), 'description': 'Suite expense',
+                'date': f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T12:00:00Z', 'category': rng.choice(CATEGORIES),
+                'recurrence_flag': rng.choice(RECURRENCE_FLAGS)}
+
+    def stored(method, body=None):
+        def build():
+            expense_id, user_id = rng.choice(expenses)
+            return user_id, method, f'/expenses/{expense_id}', body() if body else None
+        return build
+
+    return {
+        'list_page': lambda: (user(), 'GET', '/expenses?limit=100', None),
+        'list_page_category': lambda: (user(), 'GET', f'/expenses?limit=100&category={rng.choice(CATEGORIES)}', None),
+        'list_month': lambda: (user(), 'GET', f'/expenses?start_date={MONTH[0]}&end_date={MONTH[1]}', None),
+        'list_all': lambda: (user(), 'GET', '/expenses', None),
+        'report_month': lambda: (user(), 'GET', f'/reports/expenses?start_date={MONTH[0]}&end_date={MONTH[1]}', None),
+        'report_all': lambda: (user(), 'GET', '/reports/expenses', None),
+        'get_expense': stored('GET'),
+        'update_expense': stored('PUT', lambda: {'description': f'Suite update {rng.random()}'}),
+        'create_expense': lambda: (user(), 'POST', '/expenses', new_expense()),
+    }
+
+def access_tokens(app, users):
+    # Seeded users have no usable password, so tokens are minted with the claims login would put in them.
+    from flask_jwt_extended import create_access_token
+    from app.routes import USER_ID_CLAIM
+    with app.app_context():
+        return {i: create_access_token(identity=f'bench{i}', additional_claims={USER_ID_CLAIM: i}) for i in range(1, users + 1)}
+
+def parse_overrides(pairs):
+    # --config KEY=VALUE, with VALUE read as JSON when it parses (numbers, null, true) and as a string otherwise.
+    overrides = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        try:
+            overrides[key] = json.loads(value)
+        except ValueError:
+            overrides[key] = value
+    return overrides
+
+def prepare(args):
+    """Seeds a new database, or reuses a non-empty one, and returns its path and the seconds spent seeding."""
+    path = args.db or temp_database_path()
+    make_app(path, DATABASE_POOL_SIZE=0)  # creating the app runs the migrations
+    db = connect(path)
+    seed_seconds = None
+    if db.execute('SELECT NOT EXISTS (SELECT 1 FROM expenses)').fetchone()[0]:
+        start = time.perf_counter()
+        seed(db, args.rows, args.users)
+        seed_seconds = round(time.perf_counter() - start, 1)
+        db.execute('ANALYZE')
+    db.close()
+    return path, seed_seconds
+
+def sample_expenses(path, users, size=1000):
+    db = connect(path)
+    try:
+        rows = db.execute('''SELECT id, user_id FROM expenses WHERE user_id <= ? AND template_id IS NULL
+                             ORDER BY random() LIMIT ?''', (users, size)).fetchall()
+    finally:
+        db.close()
+    return [tuple(row) for row in rows]
+
+def run_client(app, build, tokens, requests):
+    client = app.test_client()
+    samples, statuses = [], {}
+    started = time.perf_counter()
+    for _ in range(requests):
+        user_id, method, path, body = build()
+        start = time.perf_counter()
+        response = client.open(path, method=method, json=body, headers={'Authorization': f'Bearer {tokens[user_id]}'})
+        samples.append((time.perf_counter() - start) * 1000)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    return report(samples, statuses, 0, time.perf_counter() - started)
+
+def run_server(port, build, tokens, requests, threads, timeout):
+    remaining = itertools.count()
+    lock = threading.Lock()
+    samples, statuses, errors = [], {}, [0]
+
+    def worker():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+        while next(remaining) < requests:
+            with lock:  # the shared random generator is not thread-safe
+                user_id, method, path, body = build()
+            headers = {'Authorization': f'Bearer {tokens[user_id]}'}
+            payload = None
+            if body is not None:
+                payload = json.dumps(body)
+                headers['Content-Type'] = 'application/json'
+            start = time.perf_counter()
+            try:
+                connection.request(method, path, body=payload, headers=headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+                with lock:
+                    errors[0] += 1
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                samples.append(elapsed)
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+        connection.close()
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return report(samples, statuses, errors[0], time.perf_counter() - started)
+
+def report(samples, statuses, errors, elapsed):
+    ok = sum(count for status, count in statuses.items() if status < 400)
+    return {'requests': len(samples), 'errors': errors + len(samples) - ok, 'statuses': statuses,
+            'requests_per_s': round(ok / elapsed, 1), **summarize(samples)}
+
+def serve(path, port, overrides):
+    import logging
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    make_server('127.0.0.1', port, make_app(path, **overrides), threaded=True).serve_forever()
+
+def compare(results, baseline, tolerance):
+    """
+    Lists the scenarios that regressed against a saved baseline.
+
+    A scenario regresses when its p95 latency grew, or its requests/sec shrank,
+    by more than tolerance (a fraction).  Scenarios missing from either side
+    are skipped, so adding one does not fail the comparison.
+    """
+    regressions = []
+    for driver, runs in results.items():
+        for name, current in runs.items():
+            previous = baseline.get(driver, {}).get(name)
+            if not previous:
+                continue
+            if previous['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                regressions.append({'driver': driver, 'scenario': name, 'metric': 'p95_ms',
+                                    'baseline': previous['p95_ms'], 'current': current['p95_ms']})
+            if current['requests_per_s'] < previous['requests_per_s'] * (1 - tolerance):
+                regressions.append({'driver': driver, 'scenario': name, 'metric': 'requests_per_s',
+                                    'baseline': previous['requests_per_s'], 'current': current['requests_per_s']})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario and driver')
+    parser.add_argument('--threads', type=int, default=16, help='concurrent connections for the server driver')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--drivers', nargs='+', default=['client', 'server'], choices=['client', 'server'])
+    parser.add_argument('--scenarios', nargs='+', help='run only these scenarios')
+    parser.add_argument('--config', nargs='*', default=[], metavar='KEY=VALUE',
+                        help='app config overrides, e.g. RESPONSE_CACHE_BACKEND=memory')
+    parser.add_argument('--db', help='database file to seed, or reuse if it already holds --rows expenses')
+    parser.add_argument('--save', metavar='PATH', help='write the results as a baseline')
+    parser.add_argument('--compare', metavar='PATH', help='baseline to check the results against')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    overrides = {'DATABASE_POOL_SIZE': POOL_SIZE, **parse_overrides(args.config)}
+    if args.serve:
+        return serve(args.db, args.port, overrides)
+
+    path, seed_seconds = prepare(args)
+    app = make_app(path, **overrides)
+    tokens = access_tokens(app, args.users)
+    expenses = sample_expenses(path, args.users)
+    names = args.scenarios or list(scenarios(random.Random(), args.users, expenses))
+
+    results = {}
+    if 'client' in args.drivers:
+        rng = random.Random(args.seed)
+        builders = scenarios(rng, args.users, expenses)
+        results['client'] = {name: run_client(app, builders[name], tokens, args.requests) for name in names}
+    if 'db_pool' in app.extensions:
+        app.extensions['db_pool'].close()
+
+    if 'server' in args.drivers:
+        port = free_port()
+        server = subprocess.Popen([sys.executable, '-m', 'benchmarks.suite', '--serve', '--db', path, '--port', str(port),
+                                   '--config', *args.config])
+        try:
+            wait_for_port(port)
+            rng = random.Random(args.seed)
+            builders = scenarios(rng, args.users, expenses)
+            results['server'] = {name: run_server(port, builders[name], tokens, args.requests, args.threads, args.timeout)
+                                 for name in names}
+        finally:
+            server.terminate()
+            server.wait()
+
+    output = {'settings': {'rows': args.rows, 'users': args.users, 'requests': args.requests, 'threads': args.threads,
+                           'config': overrides, 'cpus': os.cpu_count(), 'python': sys.version.split()[0]},
+              'seed_seconds': seed_seconds, 'results': results}
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['settings']['rows'] != args.rows or baseline['settings']['users'] != args.users:
+            output['warning'] = 'baseline was recorded at a different scale'
+        regressions = compare(results, baseline['results'], args.tolerance)
+        output['regressions'] = regressions
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(output, f, indent=2)
+            f.write('\n')
+    print(json.dumps(output, indent=2))
+    if regressions:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
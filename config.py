@@ -8,6 +8,87 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
+    # GET /expenses pagination: page size when only a cursor is given, and the largest allowed limit
+    EXPENSES_PAGE_SIZE = 100
+    EXPENSES_MAX_PAGE_SIZE = 1000
+    # Rows fetched from SQLite per batch when streaming GET /expenses as NDJSON
+    EXPORT_BATCH_SIZE = 500
+    # Most buckets one GET /reports/trend response may have (gaps included)
+    TREND_MAX_BUCKETS = 1000
+    # Most days one GET /reports/moving-average response may have
+    ANALYTICS_MAX_DAYS = 3660
+    # Largest number of expenses accepted by one POST /expenses/bulk request
+    BULK_MAX_EXPENSES = 5000
+    # Connections shared across requests (0 disables pooling) and how long a request
+    # waits for a free one before getting a 503
+    DATABASE_POOL_SIZE = 8
+    DATABASE_POOL_TIMEOUT = 5.0
+    # Sharding (app/sharding.py): SQLite files holding users' expenses, comma-separated in
+    # the environment, while DATABASE_URL keeps the users directory.  Empty keeps everything
+    # in DATABASE_URL.  Only append to the list: a shard's position is stored per user.
+    DATABASE_SHARDS = [url for url in os.environ.get('DATABASE_SHARDS', '').split(',') if url]
+    # Each process caches the shard of up to SHARD_CACHE_SIZE users for SHARD_CACHE_TTL
+    # seconds instead of asking the directory on every request.  A user moved by
+    # `flask shards move` from another process is routed to the old shard until the
+    # entry expires; 0 disables the cache.
+    SHARD_CACHE_SIZE = 10000
+    SHARD_CACHE_TTL = 30  # seconds
+    # Read replicas (app/replicas.py) for GET and HEAD requests: unset reads the primary,
+    # 'readonly' opens the same files read-only and 'snapshot' reads a copy refreshed with
+    # the backup API every DATABASE_READ_REFRESH seconds.  A user's reads stay on the
+    # primary until the snapshot holds their last write.  Needs a file database
+    DATABASE_READ_MODE = os.environ.get('DATABASE_READ_MODE') or None
+    DATABASE_READ_REFRESH = 5.0  # seconds
+    # Group commit (app/group_commit.py): POST /expenses inserts go to one writer thread per
+    # database, which commits what is queued together, waiting up to GROUP_COMMIT_MAX_DELAY
+    # seconds for more and taking at most GROUP_COMMIT_MAX_BATCH.  Needs a file database
+    GROUP_COMMIT_ENABLED = os.environ.get('GROUP_COMMIT_ENABLED') == '1'
+    GROUP_COMMIT_MAX_BATCH = 256
+    GROUP_COMMIT_MAX_DELAY = 0.002  # seconds
+    # Threads that run requests when served over ASGI (asgi.py); one per pooled connection
+    ASGI_WORKERS = 8
+    # Largest request body AsgiApp reads into memory; bigger ones get 413
+    ASGI_MAX_BODY = 16 * 1024 * 1024
+    # Password hashing: Werkzeug method string (scrypt:N:r:p or pbkdf2:sha256:iterations),
+    # processes hashing at once (0 hashes inline in the request thread) and how long a
+    # request may wait for one before getting a 503
+    PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+    PASSWORD_HASH_WORKERS = 2
+    PASSWORD_HASH_TIMEOUT = 2.0
+    # Pragmas applied to every new SQLite connection.  WAL lets readers run alongside
+    # the single writer; NORMAL sync is durable across application crashes in WAL mode.
+    SQLITE_JOURNAL_MODE = 'WAL'
+    SQLITE_SYNCHRONOUS = 'NORMAL'
+    SQLITE_BUSY_TIMEOUT = 5000  # ms
+    SQLITE_CACHE_SIZE = -65536  # negative means KiB, i.e. 64 MiB per connection
+    SQLITE_MMAP_SIZE = 268435456  # 256 MiB
+    # Cache for GET /expenses and /reports/expenses responses: 'memory' (per process),
+    # 'sqlite' (a file shared by the workers on one host) or None to disable
+    RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory')
+    RESPONSE_CACHE_URL = os.environ.get('RESPONSE_CACHE_URL', 'response_cache.db')
+    RESPONSE_CACHE_TTL = 30  # seconds
+    RESPONSE_CACHE_MAX_ENTRIES = 10000
+    # Recurring expenses: run the generator in a background thread of the web process
+    # (otherwise run scheduler.py as its own worker), how often, and templates per transaction
+    RECURRENCE_SCHEDULER_ENABLED = os.environ.get('RECURRENCE_SCHEDULER_ENABLED') == '1'
+    RECURRENCE_INTERVAL = 60  # seconds
+    RECURRENCE_BATCH_SIZE = 1000
+    # 'materialized' stores every due occurrence as a row; 'virtual' stores only the
+    # template and computes occurrences when expenses are listed or reported
+    RECURRENCE_MODE = os.environ.get('RECURRENCE_MODE', 'materialized')
+    # Encoder for expense responses: 'auto' (orjson when installed), 'orjson' or 'json'
+    JSON_ENCODER = os.environ.get('JSON_ENCODER', 'auto')
+    # Prometheus metrics at /metrics: request counts, latency histograms, pool and cache stats.
+    # Off by default; with METRICS_TOKEN set, /metrics and /metrics/* need it as a bearer token
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED') == '1'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # Per-request timing (SQL, JSON encoding, total) sent as a Server-Timing header and
+    # aggregated at /metrics/timings.  PROFILER_INTERVAL > 0 also samples request stacks
+    # every that many seconds, served at /metrics/profile and written to PROFILER_OUTPUT at exit.
+    # Both endpoints also need METRICS_ENABLED
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED') == '1'
+    PROFILER_INTERVAL = float(os.environ.get('PROFILER_INTERVAL', 0))
+    PROFILER_OUTPUT = os.environ.get('PROFILER_OUTPUT')
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -16,6 +97,11 @@ class DevelopmentConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     DATABASE_URL = ':memory:'  # In-memory DB for tests
+    DATABASE_POOL_SIZE = 0  # every ':memory:' connection is its own database
+    RESPONSE_CACHE_BACKEND = None  # the test database is rebuilt per test, a cache would outlive it
+    RECURRENCE_SCHEDULER_ENABLED = False
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'  # cheap, the tests hash hundreds of passwords
+    PASSWORD_HASH_WORKERS = 0
 
 class ProductionConfig(Config):
     DEBUG = False
\ No newline at end of file
@@ -0,0 +1,6 @@
+-- Serve Expense.get_all_by_user_id without a full table scan or a temp B-tree sort.
+-- Unfiltered and date-range listings seek on user_id and walk date in ORDER BY order.
+CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses (user_id, date DESC);
+
+-- Listings filtered by category seek on (user_id, category) and stay ordered by date.
+CREATE INDEX IF NOT EXISTS idx_expenses_user_category_date ON expenses (user_id, category, date);
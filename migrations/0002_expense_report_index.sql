@@ -0,0 +1,3 @@
+-- Covering index for Expense.total_by_category: the date range, the GROUP BY key and
+-- the summed column are all in the index, so reports never touch the table rows.
+CREATE INDEX IF NOT EXISTS idx_expenses_user_date_category_amount ON expenses (user_id, date, category, amount);
@@ -0,0 +1,5 @@
+-- Keyset pagination orders by (date DESC, id DESC).  The DESC index from 0001 keeps
+-- rowids ascending within a date, so that order still needed a sort; an ascending
+-- (user_id, date, id) index walked backwards matches it exactly.
+DROP INDEX IF EXISTS idx_expenses_user_date;
+CREATE INDEX IF NOT EXISTS idx_expenses_user_date_id ON expenses (user_id, date, id);
@@ -0,0 +1,43 @@
+-- Per-user, per-category, per-day rollup of expenses.  A day is the first ten
+-- characters of expenses.date, i.e. the calendar day the expense was recorded in.
+-- The triggers below keep it in step with every write path (Expense.save/delete,
+-- Expense.save_all, recurring expenses), so reports can sum days instead of rows.
+CREATE TABLE IF NOT EXISTS expense_daily_totals (
+  user_id INTEGER NOT NULL,
+  day TEXT NOT NULL,
+  category TEXT NOT NULL,
+  total REAL NOT NULL,
+  count INTEGER NOT NULL,
+  PRIMARY KEY (user_id, day, category)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS expenses_rollup_insert AFTER INSERT ON expenses
+BEGIN
+  INSERT INTO expense_daily_totals (user_id, day, category, total, count)
+  VALUES (NEW.user_id, substr(NEW.date, 1, 10), NEW.category, NEW.amount, 1)
+  ON CONFLICT (user_id, day, category) DO UPDATE SET total = total + excluded.total, count = count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS expenses_rollup_delete AFTER DELETE ON expenses
+BEGIN
+  UPDATE expense_daily_totals SET total = total - OLD.amount, count = count - 1
+  WHERE user_id = OLD.user_id AND day = substr(OLD.date, 1, 10) AND category = OLD.category;
+  DELETE FROM expense_daily_totals
+  WHERE user_id = OLD.user_id AND day = substr(OLD.date, 1, 10) AND category = OLD.category AND count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS expenses_rollup_update AFTER UPDATE OF user_id, amount, date, category ON expenses
+BEGIN
+  UPDATE expense_daily_totals SET total = total - OLD.amount, count = count - 1
+  WHERE user_id = OLD.user_id AND day = substr(OLD.date, 1, 10) AND category = OLD.category;
+  DELETE FROM expense_daily_totals
+  WHERE user_id = OLD.user_id AND day = substr(OLD.date, 1, 10) AND category = OLD.category AND count <= 0;
+  INSERT INTO expense_daily_totals (user_id, day, category, total, count)
+  VALUES (NEW.user_id, substr(NEW.date, 1, 10), NEW.category, NEW.amount, 1)
+  ON CONFLICT (user_id, day, category) DO UPDATE SET total = total + excluded.total, count = count + 1;
+END;
+
+DELETE FROM expense_daily_totals;
+INSERT INTO expense_daily_totals (user_id, day, category, total, count)
+SELECT user_id, substr(date, 1, 10), category, SUM(amount), COUNT(*) FROM expenses
+GROUP BY user_id, substr(date, 1, 10), category;
@@ -0,0 +1,26 @@
+-- A per-user counter bumped by every insert, update and delete on that user's
+-- expenses.  Cached responses are keyed by it, so any write makes them unreachable.
+CREATE TABLE IF NOT EXISTS user_data_versions (
+  user_id INTEGER PRIMARY KEY,
+  version INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS expenses_version_insert AFTER INSERT ON expenses
+BEGIN
+  INSERT INTO user_data_versions (user_id, version) VALUES (NEW.user_id, 1)
+  ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS expenses_version_update AFTER UPDATE ON expenses
+BEGIN
+  INSERT INTO user_data_versions (user_id, version) VALUES (OLD.user_id, 1)
+  ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+  INSERT INTO user_data_versions (user_id, version) VALUES (NEW.user_id, 1)
+  ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS expenses_version_delete AFTER DELETE ON expenses
+BEGIN
+  INSERT INTO user_data_versions (user_id, version) VALUES (OLD.user_id, 1)
+  ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
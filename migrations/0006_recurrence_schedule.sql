@@ -0,0 +1,37 @@
+-- Recurrence engine bookkeeping.  A template is an expense with a recurrence_flag
+-- and no template_id; the occurrences generated from it point back through
+-- template_id and have no recurrence_flag of their own.
+--   next_due          UTC time ('YYYY-MM-DDTHH:MM:SS+00:00') the next occurrence falls due
+--   recurrence_count  occurrences generated so far; occurrence n is anchored on the
+--                     template's own date, so monthly series never drift
+ALTER TABLE expenses ADD COLUMN template_id INTEGER REFERENCES expenses (id);
+ALTER TABLE expenses ADD COLUMN next_due TEXT;
+ALTER TABLE expenses ADD COLUMN recurrence_count INTEGER NOT NULL DEFAULT 0;
+
+-- The template's own date is never later than its first real occurrence, so it is a
+-- safe first next_due: the scheduler recomputes the exact value on its first pass.
+UPDATE expenses SET next_due = strftime('%Y-%m-%dT%H:%M:%S+00:00', date)
+WHERE recurrence_flag IS NOT NULL AND template_id IS NULL;
+
+CREATE TRIGGER IF NOT EXISTS expenses_schedule_template AFTER INSERT ON expenses
+WHEN NEW.recurrence_flag IS NOT NULL AND NEW.template_id IS NULL AND NEW.next_due IS NULL
+BEGIN
+  UPDATE expenses SET next_due = strftime('%Y-%m-%dT%H:%M:%S+00:00', NEW.date) WHERE id = NEW.id;
+END;
+
+-- The scheduler seeks per flag: recurrence_flag = ? AND next_due <= now.
+CREATE INDEX IF NOT EXISTS idx_expenses_recurrence_due ON expenses (recurrence_flag, next_due);
+
+-- One occurrence per template and date, so reruns and concurrent workers cannot duplicate.
+CREATE UNIQUE INDEX IF NOT EXISTS idx_expenses_template_date ON expenses (template_id, date) WHERE template_id IS NOT NULL;
+
+-- Schedule bookkeeping is invisible to the API, so it must not invalidate cached
+-- responses: only bump user_data_versions when user-visible columns change.
+DROP TRIGGER IF EXISTS expenses_version_update;
+CREATE TRIGGER expenses_version_update AFTER UPDATE OF user_id, amount, description, date, category, recurrence_flag ON expenses
+BEGIN
+  INSERT INTO user_data_versions (user_id, version) VALUES (OLD.user_id, 1)
+  ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+  INSERT INTO user_data_versions (user_id, version) VALUES (NEW.user_id, 1)
+  ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
@@ -0,0 +1,110 @@
+-- Amounts are stored as integer cents and every expense carries its UTC instant as
+-- a Unix epoch integer (date_epoch).  Sums are exact, and range filters, ordering
+-- and indexes compare integers instead of ISO strings whose offsets (+02:00, Z,
+-- none) do not sort.  date keeps the string as entered, for display.
+--
+-- SQLite cannot change a column's type, so the table is rebuilt.  That drops its
+-- indexes and triggers, and they are all recreated below on the new columns.
+CREATE TABLE expenses_new (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL,
+  amount_cents INTEGER NOT NULL,
+  description TEXT NOT NULL,
+  date TEXT NOT NULL,
+  date_epoch INTEGER NOT NULL,
+  category TEXT NOT NULL,
+  recurrence_flag TEXT,
+  template_id INTEGER REFERENCES expenses (id),
+  next_due TEXT,
+  recurrence_count INTEGER NOT NULL DEFAULT 0,
+  FOREIGN KEY (user_id) REFERENCES users (id)
+);
+
+-- A date SQLite cannot read falls back to its calendar day; one with no readable
+-- day at all fails the NOT NULL and the whole migration rolls back.
+INSERT INTO expenses_new (id, user_id, amount_cents, description, date, date_epoch, category,
+                          recurrence_flag, template_id, next_due, recurrence_count)
+SELECT id, user_id, CAST(round(amount * 100) AS INTEGER), description, date,
+       CAST(COALESCE(strftime('%s', date), strftime('%s', substr(date, 1, 10))) AS INTEGER),
+       category, recurrence_flag, template_id, next_due, recurrence_count
+FROM expenses;
+
+-- Keep the AUTOINCREMENT high-water mark, so ids of deleted expenses are not reused.
+DELETE FROM sqlite_sequence WHERE name = 'expenses_new';
+INSERT INTO sqlite_sequence (name, seq) SELECT 'expenses_new', seq FROM sqlite_sequence WHERE name = 'expenses';
+
+DROP TABLE expenses;
+ALTER TABLE expenses_new RENAME TO expenses;
+
+CREATE INDEX idx_expenses_user_date_id ON expenses (user_id, date_epoch, id);
+CREATE INDEX idx_expenses_user_category_date ON expenses (user_id, category, date_epoch);
+CREATE INDEX idx_expenses_user_date_category_amount ON expenses (user_id, date_epoch, category, amount_cents);
+CREATE INDEX idx_expenses_recurrence_due ON expenses (recurrence_flag, next_due);
+CREATE UNIQUE INDEX idx_expenses_template_date ON expenses (template_id, date_epoch) WHERE template_id IS NOT NULL;
+
+-- The rollup now sums cents per UTC calendar day of date_epoch.
+DROP TABLE expense_daily_totals;
+CREATE TABLE expense_daily_totals (
+  user_id INTEGER NOT NULL,
+  day TEXT NOT NULL,
+  category TEXT NOT NULL,
+  total INTEGER NOT NULL,
+  count INTEGER NOT NULL,
+  PRIMARY KEY (user_id, day, category)
+) WITHOUT ROWID;
+
+CREATE TRIGGER expenses_rollup_insert AFTER INSERT ON expenses
+BEGIN
+  INSERT INTO expense_daily_totals (user_id, day, category, total, count)
+  VALUES (NEW.user_id, date(NEW.date_epoch, 'unixepoch'), NEW.category, NEW.amount_cents, 1)
+  ON CONFLICT (user_id, day, category) DO UPDATE SET total = total + excluded.total, count = count + 1;
+END;
+
+CREATE TRIGGER expenses_rollup_delete AFTER DELETE ON expenses
+BEGIN
+  UPDATE expense_daily_totals SET total = total - OLD.amount_cents, count = count - 1
+  WHERE user_id = OLD.user_id AND day = date(OLD.date_epoch, 'unixepoch') AND category = OLD.category;
+  DELETE FROM expense_daily_totals
+  WHERE user_id = OLD.user_id AND day = date(OLD.date_epoch, 'unixepoch') AND category = OLD.category AND count <= 0;
+END;
+
+CREATE TRIGGER expenses_rollup_update AFTER UPDATE OF user_id, amount_cents, date_epoch, category ON expenses
+BEGIN
+  UPDATE expense_daily_totals SET total = total - OLD.amount_cents, count = count - 1
+  WHERE user_id = OLD.user_id AND day = date(OLD.date_epoch, 'unixepoch') AND category = OLD.category;
+  DELETE FROM expense_daily_totals
+  WHERE user_id = OLD.user_id AND day = date(OLD.date_epoch, 'unixepoch') AND category = OLD.category AND count <= 0;
+  INSERT INTO expense_daily_totals (user_id, day, category, total, count)
+  VALUES (NEW.user_id, date(NEW.date_epoch, 'unixepoch'), NEW.category, NEW.amount_cents, 1)
+  ON CONFLICT (user_id, day, category) DO UPDATE SET total = total + excluded.total, count = count + 1;
+END;
+
+INSERT INTO expense_daily_totals (user_id, day, category, total, count)
+SELECT user_id, date(date_epoch, 'unixepoch'), category, SUM(amount_cents), COUNT(*) FROM expenses
+GROUP BY user_id, date(date_epoch, 'unixepoch'), category;
+
+CREATE TRIGGER expenses_version_insert AFTER INSERT ON expenses
+BEGIN
+  INSERT INTO user_data_versions (user_id, version) VALUES (NEW.user_id, 1)
+  ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER expenses_version_update AFTER UPDATE OF user_id, amount_cents, description, date, category, recurrence_flag ON expenses
+BEGIN
+  INSERT INTO user_data_versions (user_id, version) VALUES (OLD.user_id, 1)
+  ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+  INSERT INTO user_data_versions (user_id, version) VALUES (NEW.user_id, 1)
+  ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER expenses_version_delete AFTER DELETE ON expenses
+BEGIN
+  INSERT INTO user_data_versions (user_id, version) VALUES (OLD.user_id, 1)
+  ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER expenses_schedule_template AFTER INSERT ON expenses
+WHEN NEW.recurrence_flag IS NOT NULL AND NEW.template_id IS NULL AND NEW.next_due IS NULL
+BEGIN
+  UPDATE expenses SET next_due = strftime('%Y-%m-%dT%H:%M:%S+00:00', NEW.date_epoch, 'unixepoch') WHERE id = NEW.id;
+END;
@@ -0,0 +1,35 @@
+-- Full-text index over expense descriptions and categories for GET /expenses/search.
+-- It is an external-content FTS5 table: the text stays in expenses and the index only
+-- holds tokens.  user_id is indexed as a token too, so a search is the intersection of
+-- the user's doclist with the terms' instead of a scan over everyone's matches.
+CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(
+  user_id, description, category,
+  content = 'expenses', content_rowid = 'id',
+  tokenize = 'unicode61 remove_diacritics 2'
+);
+
+-- ORDER BY rank is bm25: description matches weigh twice as much as category
+-- matches, and the user_id column (the same for every result) not at all.
+INSERT INTO expenses_fts (expenses_fts, rank) VALUES ('rank', 'bm25(0.0, 10.0, 5.0)');
+
+INSERT INTO expenses_fts (expenses_fts) VALUES ('rebuild');
+
+-- External-content tables are not updated by SQLite itself; these triggers cover every
+-- write path.  A delete has to repeat the old values so FTS5 can remove their tokens.
+CREATE TRIGGER IF NOT EXISTS expenses_fts_insert AFTER INSERT ON expenses
+BEGIN
+  INSERT INTO expenses_fts (rowid, user_id, description, category) VALUES (NEW.id, NEW.user_id, NEW.description, NEW.category);
+END;
+
+CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses
+BEGIN
+  INSERT INTO expenses_fts (expenses_fts, rowid, user_id, description, category)
+  VALUES ('delete', OLD.id, OLD.user_id, OLD.description, OLD.category);
+END;
+
+CREATE TRIGGER IF NOT EXISTS expenses_fts_update AFTER UPDATE OF user_id, description, category ON expenses
+BEGIN
+  INSERT INTO expenses_fts (expenses_fts, rowid, user_id, description, category)
+  VALUES ('delete', OLD.id, OLD.user_id, OLD.description, OLD.category);
+  INSERT INTO expenses_fts (rowid, user_id, description, category) VALUES (NEW.id, NEW.user_id, NEW.description, NEW.category);
+END;
@@ -0,0 +1,3 @@
+-- Which DATABASE_SHARDS entry holds the user's expenses (see app/sharding.py).  Only
+-- the users directory, the DATABASE_URL database, uses it; unsharded, every user is 0.
+ALTER TABLE users ADD COLUMN shard INTEGER NOT NULL DEFAULT 0;
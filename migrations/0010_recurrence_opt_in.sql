@@ -0,0 +1,38 @@
+-- Recurrence becomes opt-in.  recurrence_flag is mandatory in the API, so it only says
+-- how often an expense would repeat; an expense is a template (scheduled by the
+-- scheduler, expanded in virtual mode) only when it was created or updated with
+-- "recurring": true.
+--   recurring  1 for templates, 0 for one-off expenses and generated occurrences
+ALTER TABLE expenses ADD COLUMN recurring INTEGER NOT NULL DEFAULT 0;
+
+-- Nothing could opt in before this column existed, so every existing expense is one-off.
+-- 0006 scheduled all of them; take them off the schedule.  Occurrences that were already
+-- generated stay as ordinary expenses.
+UPDATE expenses SET next_due = NULL WHERE next_due IS NOT NULL;
+
+DROP TRIGGER IF EXISTS expenses_schedule_template;
+CREATE TRIGGER expenses_schedule_template AFTER INSERT ON expenses
+WHEN NEW.recurring = 1 AND NEW.recurrence_flag IS NOT NULL AND NEW.template_id IS NULL AND NEW.next_due IS NULL
+BEGIN
+  UPDATE expenses SET next_due = strftime('%Y-%m-%dT%H:%M:%S+00:00', NEW.date_epoch, 'unixepoch') WHERE id = NEW.id;
+END;
+
+-- Opting in (or out) later starts (or ends) the schedule.  A template resumes after the
+-- occurrences it already generated (recurrence_count).
+CREATE TRIGGER expenses_schedule_recurring AFTER UPDATE OF recurring ON expenses
+WHEN NEW.template_id IS NULL AND NEW.recurring IS NOT OLD.recurring
+BEGIN
+  UPDATE expenses SET next_due = CASE WHEN NEW.recurring = 1 AND NEW.recurrence_flag IS NOT NULL
+                                      THEN strftime('%Y-%m-%dT%H:%M:%S+00:00', NEW.date_epoch, 'unixepoch') END
+  WHERE id = NEW.id;
+END;
+
+-- Opting in changes what virtual mode lists, so cached responses must be invalidated.
+DROP TRIGGER IF EXISTS expenses_version_update;
+CREATE TRIGGER expenses_version_update AFTER UPDATE OF user_id, amount_cents, description, date, category, recurrence_flag, recurring ON expenses
+BEGIN
+  INSERT INTO user_data_versions (user_id, version) VALUES (OLD.user_id, 1)
+  ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+  INSERT INTO user_data_versions (user_id, version) VALUES (NEW.user_id, 1)
+  ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
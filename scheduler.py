@@ -0,0 +1,28 @@
+import argparse
+import logging
+import time
+from app import create_app
+from app.database import expense_databases
+from app.recurrence import generate_due_occurrences
+
+app = create_app()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate due occurrences of recurring expenses.')
+    parser.add_argument('--once', action='store_true', help='run a single pass and exit')
+    parser.add_argument('--interval', type=float, default=app.config['RECURRENCE_INTERVAL'], help='seconds between passes')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if app.config['RECURRENCE_MODE'] != 'materialized':
+        parser.exit(message='RECURRENCE_MODE is %r, occurrences are computed on read; nothing to generate.\n' % app.config['RECURRENCE_MODE'])
+
+    while True:
+        stats = {'occurrences': 0, 'templates': 0}
+        with app.app_context():
+            for db in expense_databases():
+                for key, value in generate_due_occurrences(db, batch_size=app.config['RECURRENCE_BATCH_SIZE']).items():
+                    stats[key] += value
+        logging.info('Generated %(occurrences)s occurrences from %(templates)s recurring expenses', stats)
+        if args.once:
+            break
+        time.sleep(args.interval)
@@ -2,6 +2,7 @@ import pytest
 import json
 from app import create_app
 from app.database import init_db, get_db, close_db
+from app.migrations import migrate
 from config import TestingConfig
 
 @pytest.fixture(scope='session')
@@ -12,6 +13,36 @@ def app():
         init_db(app)
         yield app
 
+@pytest.fixture
+def file_app(tmp_path):
+    """
+    Factory for apps on a file database in tmp_path, for features the shared
+    ':memory:' app cannot serve (pools, writer threads, replicas, shards).
+    Keyword arguments override TestingConfig; every app made is shut down after
+    the test.  Override `client` with one of these apps to point the
+    register_user, login_user, token and create_expense fixtures at it.
+    """
+    apps = []
+
+    def _file_app(**overrides):
+        config = type('FileConfig', (TestingConfig,), {'DATABASE_URL': str(tmp_path / 'expenses.db'), 'DATABASE_POOL_SIZE': 2, **overrides})
+        app = create_app(config)
+        apps.append(app)
+        return app
+    yield _file_app
+
+    for app in apps:
+        # Threads that write or copy first, then the connections they used.
+        for writer in app.extensions.get('group_commit_writers') or ():
+            writer.stop()
+        if app.extensions.get('db_snapshot_refresher') is not None:
+            app.extensions['db_snapshot_refresher'].stop()
+        if app.extensions.get('profiler') is not None:
+            app.extensions['profiler'].stop()
+        for name in ('db_replicas', 'db_shards', 'db_pool'):
+            if app.extensions.get(name) is not None:
+                app.extensions[name].close()
+
 @pytest.fixture(scope='function', autouse=True)
 def client(app):
     """A test client for the app."""
@@ -22,10 +53,8 @@ def db(app):
     """Provides a database connection and handles setup/teardown."""
     with app.app_context():
         db = get_db()
-        # Get the directory of the current file (conftest.py)
-        with app.open_resource('../schema.sql', mode='r') as f:
-          db.cursor().executescript(f.read())
-        db.commit()
+        # Build the schema through the same migrations the app runs on boot
+        migrate(db)
 
         yield db
 
@@ -62,4 +91,22 @@ def token(client, login_user, register_user):
     response = login_user('testuser', 'testpassword')
     assert response.status_code == 200
     data = json.loads(response.get_data(as_text=True))
-    return data['access_token']
\ No newline at end of file
+    return data['access_token']
+
+@pytest.fixture
+def create_expense(client):
+    # Posts an expense as the holder of token and returns the response.
+    def _create_expense(token, amount=100, description="Test Expense",
+                        date="2024-07-28T14:30:00Z", category="Test", recurrence_flag=None):
+        headers = {'Authorization': f'Bearer {token}'}
+        expense_data = {
+            'amount': amount,
+            'description': description,
+            'date': date,
+            'category': category
+        }
+        if recurrence_flag is not None:
+            expense_data['recurrence_flag'] = recurrence_flag
+        return client.post('/expenses', data=json.dumps(expense_data),
+                           content_type='application/json', headers=headers)
+    return _create_expense
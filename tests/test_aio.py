@@ -0,0 +1,54 @@
+import asyncio
+import json
+import pytest
+from app.aio import AsgiApp
+
+@pytest.fixture
+def flask_app(file_app):
+    return file_app(ASGI_WORKERS=2)
+
+@pytest.fixture
+def client(flask_app):
+    return flask_app.test_client()
+
+def asgi_request(asgi_app, method, path, body=b'', headers=(), query_string=b''):
+    # Drives one request through the ASGI callable, the way uvicorn would.
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query_string, 'root_path': '',
+             'headers': [(b'content-type', b'application/json')] + list(headers), 'http_version': '1.1',
+             'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 5000)}
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi_app(scope, receive, send))
+    start = sent[0]
+    return start['status'], dict(start['headers']), b''.join(m.get('body', b'') for m in sent[1:])
+
+def test_asgi_app_serves_routes(flask_app, token):
+    asgi_app = AsgiApp(flask_app)
+    auth = (b'authorization', f'Bearer {token}'.encode())
+
+    expense = json.dumps({'amount': 12.5, 'description': 'Lunch', 'date': '2024-07-28', 'category': 'Food', 'recurrence_flag': 'daily'}).encode()
+    assert asgi_request(asgi_app, 'POST', '/expenses', expense, [auth])[0] == 201
+    status, headers, body = asgi_request(asgi_app, 'GET', '/expenses', headers=[auth], query_string=b'category=Food')
+    assert status == 200
+    assert headers[b'content-type'] == b'application/json'
+    assert [e['amount'] for e in json.loads(body)] == [12.5]
+
+    status, headers, body = asgi_request(asgi_app, 'GET', '/expenses', headers=[auth, (b'accept', b'application/x-ndjson')])
+    assert headers[b'content-type'] == b'application/x-ndjson'
+    assert len(body.splitlines()) == 1
+    assert flask_app.extensions['db_pool'].stats()['in_use'] == 0
+    asgi_app.executor.shutdown()
+
+def test_asgi_app_rejects_large_bodies(file_app):
+    asgi_app = AsgiApp(file_app(ASGI_MAX_BODY=10))
+    # Too large by its declared length, or by the bytes actually sent.
+    status, _, body = asgi_request(asgi_app, 'POST', '/users/register', b'{}', [(b'content-length', b'11')])
+    assert status == 413 and 'error' in json.loads(body)
+    assert asgi_request(asgi_app, 'POST', '/users/register', b'x' * 11)[0] == 413
+    asgi_app.executor.shutdown()
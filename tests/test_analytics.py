@@ -0,0 +1,85 @@
+import statistics
+import pytest
+from app import analytics
+from app.models import User, Expense
+
+@pytest.fixture(params=['numpy', 'array'])
+def backend(request, monkeypatch):
+    if request.param == 'numpy' and analytics.numpy is None:
+        pytest.skip('numpy is not installed')
+    if request.param == 'array':
+        monkeypatch.setattr(analytics, 'numpy', None)
+    return request.param
+
+def add(user_id, rows):
+    Expense.save_all([Expense(user_id=user_id, amount=amount, description='Row', date=date, category=category, recurrence_flag=None)
+                      for date, category, amount in rows])
+
+def quantile(values, q):
+    values = sorted(values)
+    position = q * (len(values) - 1)
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+def test_percentiles(app, backend):
+    user = User(username='stats', password_hash='x').save()
+    food = [3.5, 12, 7.25, 40, 9.99, 15]
+    add(user.id, [(f'2024-01-{i + 1:02d}', 'Food', amount) for i, amount in enumerate(food)] + [('2024-01-10', 'Rent', 700)])
+    stats = analytics.percentiles(analytics.load_columns(user.id))
+    cents = [round(amount * 100) for amount in food]
+    assert stats == {
+        'Food': {'count': 6, 'median': round(statistics.median(cents)) / 100, 'p90': round(quantile(cents, 0.9)) / 100},
+        'Rent': {'count': 1, 'median': 700, 'p90': 700},
+    }
+    assert analytics.percentiles(analytics.load_columns(user.id, start_date='2025-01-01')) == {}
+
+def test_moving_average_reads_the_days_before_the_range(app, backend):
+    user = User(username='average', password_hash='x').save()
+    add(user.id, [('2024-03-01T10:00:00Z', 'Food', 3), ('2024-03-02T23:00:00Z', 'Food', 6), ('2024-03-03', 'Rent', 9), ('2024-03-06', 'Food', 1)])
+    days = analytics.daily_moving_average(user.id, '2024-03-03T15:00:00+00:00', '2024-03-05T00:00:00+00:00', window=3)
+    assert days == [
+        {'day': '2024-03-03', 'total': 9, 'average': 6},
+        {'day': '2024-03-04', 'total': 0, 'average': 5},
+        {'day': '2024-03-05', 'total': 0, 'average': 3},
+    ]
+    # Without bounds the series runs from the first expense's day to the last's.
+    days = analytics.daily_moving_average(user.id, window=2)
+    assert [(d['day'], d['average']) for d in days] == [('2024-03-01', 1.5), ('2024-03-02', 4.5), ('2024-03-03', 7.5),
+                                                         ('2024-03-04', 4.5), ('2024-03-05', 0), ('2024-03-06', 0.5)]
+    with pytest.raises(ValueError):
+        analytics.daily_moving_average(user.id, '2024-01-01', '2024-12-31', max_days=100)
+
+def test_anomalies_flag_large_amounts_per_category(app, backend):
+    user = User(username='outliers', password_hash='x').save()
+    normal = [10, 11, 9, 12, 10.5, 9.5, 11.5, 10]
+    add(user.id, [(f'2024-02-{i + 1:02d}', 'Food', amount) for i, amount in enumerate(normal)]
+        + [('2024-02-20', 'Food', 95), ('2024-02-21', 'Food', 0.5), ('2024-02-22', 'Rent', 700), ('2024-02-23', 'Rent', 700)])
+    columns = analytics.load_columns(user.id)
+    flagged = analytics.anomaly_dicts(columns, *analytics.anomalies(columns))
+    assert [(e['category'], e['amount'], e['date']) for e in flagged] == [('Food', 95, '2024-02-20T00:00:00+00:00')]
+    assert flagged[0]['category_median'] == 10.25
+    assert flagged[0]['score'] > analytics.DEFAULT_ANOMALY_THRESHOLD
+    assert isinstance(flagged[0]['id'], int)
+
+def test_analytics_routes(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    for day, amount in [(1, 10), (2, 12), (3, 11), (4, 200)]:
+        client.post('/expenses', headers=headers, json={'amount': amount, 'description': 'Lunch', 'date': f'2024-04-0{day}',
+                                                        'category': 'Food', 'recurrence_flag': 'monthly'})
+    response = client.get('/reports/percentiles', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json() == {'Food': {'count': 4, 'median': 11.5, 'p90': 143.6}}
+
+    body = client.get('/reports/moving-average?window=2&start_date=2024-04-02', headers=headers).get_json()
+    assert body['window'] == 2
+    assert [d['average'] for d in body['days']] == [11, 11.5, 105.5]
+
+    body = client.get('/reports/anomalies?threshold=3', headers=headers).get_json()
+    assert [e['amount'] for e in body['expenses']] == [200]
+
+@pytest.mark.parametrize('path', ['/reports/percentiles?start_date=bad', '/reports/moving-average?window=0',
+                                  '/reports/moving-average?start_date=1990-01-01&end_date=2024-01-01',
+                                  '/reports/anomalies?threshold=-1', '/reports/anomalies?threshold=nan'])
+def test_analytics_routes_reject_bad_input(client, token, path):
+    assert client.get(path, headers={'Authorization': f'Bearer {token}'}).status_code == 400
@@ -1,4 +1,5 @@
 import json
+from app.models import User
 
 def test_register_user_success(register_user):
     response = register_user('testuser', 'testpass')
@@ -51,6 +52,15 @@ def test_register_user_duplicate(client, register_user):
     data = json.loads(response.get_data(as_text=True))
     assert data['error'] == 'Username already exists'
 
+def test_register_user_race(client, register_user, monkeypatch):
+    # Both requests pass the lookup before either inserts; the UNIQUE constraint decides.
+    register_user('racer', 'password')
+    monkeypatch.setattr(User, 'get_by_username', staticmethod(lambda username: None))
+    response = register_user('racer', 'password')
+    assert response.status_code == 409
+    data = json.loads(response.get_data(as_text=True))
+    assert data['error'] == 'Username already exists'
+
 def test_register_user_missing_fields(client):
     response = client.post('/users/register',
                            data=json.dumps({'username': 'onlyuser'}),
@@ -94,4 +104,40 @@ def test_login_missing_fields(client):
     response = client.post('/users/login', data=json.dumps({'password': 'onlypassword'}), content_type='application/json')
     assert response.status_code == 400
     data = json.loads(response.get_data(as_text=True))
-    assert "Missing username or password" in data['error']
\ No newline at end of file
+    assert "Missing username or password" in data['error']
+
+
+def test_login_token_carries_user_id(client, app, token):
+    from flask_jwt_extended import decode_token
+    from app.models import User
+    with app.app_context():
+        claims = decode_token(token)
+    assert claims['sub'] == 'testuser'
+    assert claims['uid'] == User.get_by_username('testuser').id
+
+def test_protected_routes_skip_user_lookup(client, token, db):
+    headers = {'Authorization': f'Bearer {token}'}
+    expense = {'amount': 5, 'description': 'Coffee', 'date': '2024-07-28', 'category': 'Food', 'recurrence_flag': 'daily'}
+    statements = []
+    db.set_trace_callback(statements.append)
+    try:
+        response = client.post('/expenses', data=json.dumps(expense), content_type='application/json', headers=headers)
+        expense_id = json.loads(response.get_data(as_text=True))['id']
+        client.get('/expenses', headers=headers)
+        client.get(f'/expenses/{expense_id}', headers=headers)
+        client.get('/reports/expenses', headers=headers)
+        client.put(f'/expenses/{expense_id}', data=json.dumps({'amount': 6}), content_type='application/json', headers=headers)
+        client.delete(f'/expenses/{expense_id}', headers=headers)
+    finally:
+        db.set_trace_callback(None)
+
+    assert statements
+    assert not [s for s in statements if 'FROM users' in s]
+
+def test_token_without_user_id_claim_still_works(client, app, token):
+    # Tokens issued before the uid claim existed fall back to the username lookup.
+    from flask_jwt_extended import create_access_token
+    with app.app_context():
+        legacy_token = create_access_token(identity='testuser')
+    response = client.get('/expenses', headers={'Authorization': f'Bearer {legacy_token}'})
+    assert response.status_code == 200
@@ -0,0 +1,110 @@
+import json
+import pytest
+from app.cache import LRUCache, SQLiteCache, ResponseCache, create_response_cache
+
+@pytest.fixture
+def response_cache(app):
+    cache = ResponseCache(LRUCache(), ttl=60)
+    app.extensions['response_cache'] = cache
+    yield cache
+    app.extensions['response_cache'] = None
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set('a', b'1', 60)
+    cache.set('b', b'2', 60)
+    assert cache.get('a') == b'1'
+    cache.set('c', b'3', 60)
+    assert cache.get('b') is None
+    assert cache.get('a') == b'1'
+    assert len(cache) == 2
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache()
+    cache.set('a', b'1', 0)
+    assert cache.get('a') is None
+
+def test_sqlite_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first, second = SQLiteCache(path), SQLiteCache(path)
+    first.set('a', b'payload', 60)
+    assert second.get('a') == b'payload'
+    first.set('b', b'stale', -1)
+    assert second.get('b') is None
+
+def test_sqlite_cache_evicts_oldest_past_max_entries(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.db'), max_entries=3, trim_every=1)
+    for i, key in enumerate('abcde'):
+        cache.set(key, b'live', 60 + i)
+    assert len(cache) == 3
+    assert [cache.get(key) for key in 'abcde'] == [None, None, b'live', b'live', b'live']
+
+def test_response_cache_stats():
+    cache = ResponseCache(LRUCache(), ttl=60)
+    cache.get('missing')
+    cache.set('key', b'value')
+    cache.get('key')
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'hit_ratio': 0.5, 'entries': 1}
+
+def test_create_response_cache_rejects_unknown_backend():
+    config = {'RESPONSE_CACHE_BACKEND': 'nope', 'RESPONSE_CACHE_TTL': 1, 'RESPONSE_CACHE_MAX_ENTRIES': 1}
+    with pytest.raises(ValueError):
+        create_response_cache(config)
+
+def test_list_expenses_cached_until_write(client, token, response_cache, create_expense):
+    headers = {'Authorization': f'Bearer {token}'}
+    expense_id = create_expense(token, amount=10, category='Food', recurrence_flag='monthly').get_json()['id']
+
+    first = client.get('/expenses', headers=headers)
+    second = client.get('/expenses', headers=headers)
+    assert first.headers['X-Cache'] == 'MISS'
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.get_data() == first.get_data()
+
+    # Creating, updating and deleting each invalidate the cached list.
+    create_expense(token, amount=20, category='Food', recurrence_flag='monthly')
+    response = client.get('/expenses', headers=headers)
+    assert response.headers['X-Cache'] == 'MISS'
+    assert len(json.loads(response.get_data(as_text=True))) == 2
+
+    client.put(f'/expenses/{expense_id}', data=json.dumps({'amount': 99}), content_type='application/json', headers=headers)
+    response = client.get('/expenses', headers=headers)
+    assert response.headers['X-Cache'] == 'MISS'
+    assert 99 in [e['amount'] for e in json.loads(response.get_data(as_text=True))]
+
+    client.delete(f'/expenses/{expense_id}', headers=headers)
+    response = client.get('/expenses', headers=headers)
+    assert response.headers['X-Cache'] == 'MISS'
+    assert len(json.loads(response.get_data(as_text=True))) == 1
+    assert response_cache.stats()['hits'] == 1
+
+def test_report_cached_per_query(client, token, response_cache, create_expense):
+    headers = {'Authorization': f'Bearer {token}'}
+    create_expense(token, amount=10, category='Food', recurrence_flag='monthly')
+
+    assert client.get('/reports/expenses', headers=headers).headers['X-Cache'] == 'MISS'
+    assert client.get('/reports/expenses', headers=headers).headers['X-Cache'] == 'HIT'
+    assert client.get('/reports/expenses?start_date=2024-01-01', headers=headers).headers['X-Cache'] == 'MISS'
+
+    create_expense(token, amount=5, category='Food', recurrence_flag='monthly')
+    response = client.get('/reports/expenses', headers=headers)
+    assert response.headers['X-Cache'] == 'MISS'
+    assert json.loads(response.get_data(as_text=True)) == {'Food': 15}
+
+def test_cache_is_per_user(client, token, register_user, login_user, response_cache, create_expense):
+    headers = {'Authorization': f'Bearer {token}'}
+    create_expense(token, amount=10, category='Food', recurrence_flag='monthly')
+    client.get('/expenses', headers=headers)
+
+    register_user('other', 'password')
+    other_token = json.loads(login_user('other', 'password').get_data(as_text=True))['access_token']
+    response = client.get('/expenses', headers={'Authorization': f'Bearer {other_token}'})
+    assert response.headers['X-Cache'] == 'MISS'
+    assert json.loads(response.get_data(as_text=True)) == []
+
+def test_errors_are_not_cached(client, token, response_cache):
+    headers = {'Authorization': f'Bearer {token}'}
+    client.get('/expenses?start_date=invalid', headers=headers)
+    response = client.get('/expenses?start_date=invalid', headers=headers)
+    assert response.status_code == 400
+    assert response.headers['X-Cache'] == 'MISS'
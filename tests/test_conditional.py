@@ -0,0 +1,66 @@
+import json
+
+def test_list_expenses_not_modified(client, token, create_expense):
+    headers = {'Authorization': f'Bearer {token}'}
+    create_expense(token, amount=10, category='Food', recurrence_flag='monthly')
+
+    response = client.get('/expenses', headers=headers)
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    assert not etag.startswith('W/')
+
+    response = client.get('/expenses', headers=dict(headers, **{'If-None-Match': etag}))
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert response.get_data() == b''
+
+def test_etag_changes_after_write(client, token, create_expense):
+    headers = {'Authorization': f'Bearer {token}'}
+    expense_id = create_expense(token, amount=10, category='Food', recurrence_flag='monthly').get_json()['id']
+    etag = client.get('/expenses', headers=headers).headers['ETag']
+
+    client.put(f'/expenses/{expense_id}', data=json.dumps({'amount': 50}), content_type='application/json', headers=headers)
+    response = client.get('/expenses', headers=dict(headers, **{'If-None-Match': etag}))
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert json.loads(response.get_data(as_text=True))[0]['amount'] == 50
+
+def test_etag_differs_per_query_and_user(client, token, register_user, login_user, create_expense):
+    headers = {'Authorization': f'Bearer {token}'}
+    create_expense(token, amount=10, category='Food', recurrence_flag='monthly')
+    all_etag = client.get('/expenses', headers=headers).headers['ETag']
+    food_etag = client.get('/expenses?category=Food', headers=headers).headers['ETag']
+    assert all_etag != food_etag
+
+    register_user('other', 'password')
+    other_token = json.loads(login_user('other', 'password').get_data(as_text=True))['access_token']
+    response = client.get('/expenses', headers={'Authorization': f'Bearer {other_token}', 'If-None-Match': all_etag})
+    assert response.status_code == 200
+
+def test_report_not_modified_skips_query(client, token, db, create_expense):
+    headers = {'Authorization': f'Bearer {token}'}
+    create_expense(token, amount=10, category='Food', recurrence_flag='monthly')
+    etag = client.get('/reports/expenses', headers=headers).headers['ETag']
+
+    statements = []
+    db.set_trace_callback(statements.append)
+    response = client.get('/reports/expenses', headers=dict(headers, **{'If-None-Match': etag}))
+    db.set_trace_callback(None)
+    assert response.status_code == 304
+    assert not [s for s in statements if 'FROM expenses' in s or 'expense_daily_totals' in s]
+
+def test_get_expense_not_modified(client, token, create_expense):
+    headers = {'Authorization': f'Bearer {token}'}
+    expense_id = create_expense(token, amount=10, category='Food', recurrence_flag='monthly').get_json()['id']
+    other_id = create_expense(token, amount=10, category='Food', recurrence_flag='monthly').get_json()['id']
+
+    response = client.get(f'/expenses/{expense_id}', headers=headers)
+    etag = response.headers['ETag']
+    assert client.get(f'/expenses/{expense_id}', headers=dict(headers, **{'If-None-Match': etag})).status_code == 304
+    assert client.get(f'/expenses/{other_id}', headers=dict(headers, **{'If-None-Match': etag})).status_code == 200
+
+def test_missing_expense_has_no_etag(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    response = client.get('/expenses/9999', headers=headers)
+    assert response.status_code == 204
+    assert 'ETag' not in response.headers
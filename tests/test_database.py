@@ -0,0 +1,94 @@
+import threading
+import pytest
+from app import create_app
+from app.database import ConnectionPool, PoolTimeout, get_db, pool_stats
+from config import TestingConfig
+
+PRAGMAS = [('journal_mode', 'WAL'), ('synchronous', 'NORMAL'), ('busy_timeout', 1000)]
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), size=2, timeout=0.1, pragmas=PRAGMAS)
+    yield pool
+    pool.close()
+
+def test_pool_reuses_connections(pool):
+    first = pool.acquire()
+    pool.release(first)
+    second = pool.acquire()
+    assert second is first
+    pool.release(second)
+    assert pool.stats()['open'] == 1
+    assert pool.stats()['acquired'] == 2
+
+def test_pool_applies_pragmas(pool):
+    db = pool.acquire()
+    assert db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert db.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    assert db.execute('PRAGMA busy_timeout').fetchone()[0] == 1000
+    pool.release(db)
+
+def test_pool_times_out_when_exhausted(pool):
+    held = [pool.acquire(), pool.acquire()]
+    assert pool.stats()['in_use'] == 2
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.stats()['timeouts'] == 1
+    for db in held:
+        pool.release(db)
+    assert pool.stats()['idle'] == 2
+
+def test_pool_hands_over_released_connection_to_waiter(pool):
+    held = [pool.acquire(), pool.acquire()]
+    pool.timeout = 5
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    waiter.start()
+    pool.release(held[0])
+    waiter.join()
+    assert acquired == [held[0]]
+    assert pool.stats()['waits'] == 1
+    pool.release(held[1])
+    pool.release(acquired[0])
+
+def test_pool_rolls_back_on_release(pool):
+    db = pool.acquire()
+    db.execute('CREATE TABLE t (x INTEGER)')
+    db.commit()
+    db.execute('INSERT INTO t VALUES (1)')
+    pool.release(db)
+    db = pool.acquire()
+    assert db.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+    pool.release(db)
+
+def test_app_uses_pool_for_file_database(tmp_path):
+    class PooledConfig(TestingConfig):
+        DATABASE_URL = str(tmp_path / 'app.db')
+        DATABASE_POOL_SIZE = 3
+    app = create_app(PooledConfig)
+    client = app.test_client()
+    for _ in range(5):
+        response = client.post('/users/login', json={'username': 'nobody', 'password': 'x'})
+        assert response.status_code == 401
+    stats = pool_stats(app)
+    assert stats['open'] == 1
+    assert stats['in_use'] == 0
+    with app.app_context():
+        assert get_db().execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    app.extensions['db_pool'].close()
+
+def test_pool_timeout_returns_503(tmp_path):
+    class TinyPoolConfig(TestingConfig):
+        DATABASE_URL = str(tmp_path / 'app.db')
+        DATABASE_POOL_SIZE = 1
+        DATABASE_POOL_TIMEOUT = 0.05
+    app = create_app(TinyPoolConfig)
+    held = app.extensions['db_pool'].acquire()
+    response = app.test_client().post('/users/login', json={'username': 'nobody', 'password': 'x'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    app.extensions['db_pool'].release(held)
+    app.extensions['db_pool'].close()
+
+def test_testing_config_is_unpooled(app):
+    assert pool_stats(app) is None
@@ -1,21 +1,10 @@
 import json
+import pytest
+from app.utils import encode_cursor
 from datetime import datetime, timedelta, timezone
 
-# Helper function for creating expenses
-def create_expense(client, token, amount=100, description="Test Expense",
-                   date="2024-07-28T14:30:00Z", category="Test"):
-    headers = {'Authorization': f'Bearer {token}'}
-    expense_data = {
-        'amount': amount,
-        'description': description,
-        'date': date,
-        'category': category
-    }
-    return client.post('/expenses', data=json.dumps(expense_data),
-                       content_type='application/json', headers=headers)
-
-def test_create_expense_valid(client, token):
-    response = create_expense(client, token)
+def test_create_expense_valid(client, token, create_expense):
+    response = create_expense(token)
     assert response.status_code == 201
     created_expense = json.loads(response.get_data(as_text=True))
     assert created_expense['amount'] == 100
@@ -24,48 +13,48 @@ def test_create_expense_valid(client, token):
     assert created_expense['category'] == 'Test'
     assert created_expense['id'] is not None
 
-def test_create_expense_missing_fields(client, token):
+def test_create_expense_missing_fields(client, token, create_expense):
     # Missing description
-    response = create_expense(client, token, description=None)
+    response = create_expense(token, description=None)
     assert response.status_code == 400
 
     # Missing amount
-    response = create_expense(client, token, amount=None)
+    response = create_expense(token, amount=None)
     assert response.status_code == 400
 
     # Missing date
-    response = create_expense(client, token, date=None)
+    response = create_expense(token, date=None)
     assert response.status_code == 400
 
     # Missing category
-    response = create_expense(client, token, category=None)
+    response = create_expense(token, category=None)
     assert response.status_code == 400
 
-def test_create_expense_invalid_amount(client, token):
-    response = create_expense(client, token, amount="invalid")
+def test_create_expense_invalid_amount(client, token, create_expense):
+    response = create_expense(token, amount="invalid")
     assert response.status_code == 400
 
-def test_create_expense_invalid_date(client, token):
-    response = create_expense(client, token, date="invalid-date")
+def test_create_expense_invalid_date(client, token, create_expense):
+    response = create_expense(token, date="invalid-date")
     assert response.status_code == 400
 
 def test_create_expense_unauthorized(client):
     response = client.post('/expenses', data=json.dumps({}), content_type='application/json')
     assert response.status_code == 401
 
-def test_list_expenses_no_filters(client, token):
-    create_expense(client, token)  # Create at least one expense
+def test_list_expenses_no_filters(client, token, create_expense):
+    create_expense(token)  # Create at least one expense
     headers = {'Authorization': f'Bearer {token}'}
     response = client.get('/expenses', headers=headers)
     assert response.status_code == 200
     expenses = json.loads(response.get_data(as_text=True))
     assert len(expenses) > 0 # Check that the list is not empty
 
-def test_list_expenses_filter_by_start_date(client, token):
+def test_list_expenses_filter_by_start_date(client, token, create_expense):
     today = datetime.now(timezone.utc).date().isoformat()
     yesterday = (datetime.now(timezone.utc) - timedelta(days=1)).date().isoformat()
-    create_expense(client, token, date=today)
-    create_expense(client, token, date=yesterday)
+    create_expense(token, date=today)
+    create_expense(token, date=yesterday)
 
     headers = {'Authorization': f'Bearer {token}'}
     response = client.get(f'/expenses?start_date={yesterday}', headers=headers)
@@ -78,10 +67,10 @@ def test_list_expenses_filter_by_start_date(client, token):
     expenses = json.loads(response.get_data(as_text=True))
     assert len(expenses) == 1
 
-def test_list_expenses_filter_by_end_date(client, token):
+def test_list_expenses_filter_by_end_date(client, token, create_expense):
     today = datetime.now(timezone.utc).date().isoformat()
     tomorrow = (datetime.now(timezone.utc) + timedelta(days=1)).date().isoformat()
-    create_expense(client, token, date=today)
+    create_expense(token, date=today)
 
     headers = {'Authorization': f'Bearer {token}'}
     response = client.get(f'/expenses?end_date={tomorrow}', headers=headers)
@@ -89,9 +78,9 @@ def test_list_expenses_filter_by_end_date(client, token):
     expenses = json.loads(response.get_data(as_text=True))
     assert len(expenses) == 1
 
-def test_list_expenses_filter_by_category(client, token):
-    create_expense(client, token, category="Food")
-    create_expense(client, token, category="Travel")
+def test_list_expenses_filter_by_category(client, token, create_expense):
+    create_expense(token, category="Food")
+    create_expense(token, category="Travel")
 
     headers = {'Authorization': f'Bearer {token}'}
     response = client.get('/expenses?category=Food', headers=headers)
@@ -109,8 +98,8 @@ def test_list_expenses_unauthorized(client):
     response = client.get('/expenses')
     assert response.status_code == 401
 
-def test_get_expense_valid(client, token):
-    response = create_expense(client, token)
+def test_get_expense_valid(client, token, create_expense):
+    response = create_expense(token)
     expense_id = json.loads(response.get_data(as_text=True))['id']
     headers = {'Authorization': f'Bearer {token}'}
     response = client.get(f'/expenses/{expense_id}', headers=headers)
@@ -127,8 +116,8 @@ def test_get_expense_unauthorized(client):
     response = client.get('/expenses/1')
     assert response.status_code == 401
 
-def test_update_expense_valid(client, token):
-    response = create_expense(client, token)
+def test_update_expense_valid(client, token, create_expense):
+    response = create_expense(token)
     expense_id = json.loads(response.get_data(as_text=True))['id']
     headers = {'Authorization': f'Bearer {token}'}
     updated_data = {'amount': 150, 'description': 'Updated Expense'}
@@ -139,8 +128,8 @@ def test_update_expense_valid(client, token):
     assert updated_expense['amount'] == 150
     assert updated_expense['description'] == 'Updated Expense'
 
-def test_update_expense_partial(client, token):
-    response = create_expense(client, token)
+def test_update_expense_partial(client, token, create_expense):
+    response = create_expense(token)
     expense_id = json.loads(response.get_data(as_text=True))['id']
     headers = {'Authorization': f'Bearer {token}'}
      # Update only the description
@@ -156,8 +145,8 @@ def test_update_expense_partial(client, token):
     assert updated_expense['date'] == '2024-07-28T14:30:00+00:00'
     assert updated_expense['category'] == 'Test'
 
-def test_update_expense_invalid_data(client, token):
-    response = create_expense(client, token)
+def test_update_expense_invalid_data(client, token, create_expense):
+    response = create_expense(token)
     expense_id = json.loads(response.get_data(as_text=True))['id']
     headers = {'Authorization': f'Bearer {token}'}
     response = client.put(f'/expenses/{expense_id}', data=json.dumps({'amount': 'invalid'}),
@@ -173,8 +162,8 @@ def test_update_expense_unauthorized(client):
     response = client.put('/expenses/1', data=json.dumps({}), content_type='application/json')
     assert response.status_code == 401
 
-def test_delete_expense_valid(client, token):
-    response = create_expense(client, token)
+def test_delete_expense_valid(client, token, create_expense):
+    response = create_expense(token)
     expense_id = json.loads(response.get_data(as_text=True))['id']
     headers = {'Authorization': f'Bearer {token}'}
     response = client.delete(f'/expenses/{expense_id}', headers=headers)
@@ -192,12 +181,12 @@ def test_delete_expense_unauthorized(client):
     response = client.delete('/expenses/1')
     assert response.status_code == 401
 
-def test_expense_cross_user_access(client, token, register_user, login_user):
+def test_expense_cross_user_access(client, token, register_user, login_user, create_expense):
     # Create expense for user 1
     register_user('user1', 'password')
     login_response1 = login_user('user1', 'password')
     token1 = json.loads(login_response1.get_data(as_text=True))['access_token']
-    response = create_expense(client, token1)
+    response = create_expense(token1)
     expense_id = json.loads(response.get_data(as_text=True))['id']
     headers1 = {'Authorization': f'Bearer {token1}'}
 
@@ -218,4 +207,176 @@ def test_expense_cross_user_access(client, token, register_user, login_user):
 
     # User 2 attempts to delete user 1's expense
     response = client.delete(f'/expenses/{expense_id}', headers=headers2)
-    assert response.status_code == 204
\ No newline at end of file
+    assert response.status_code == 204
+
+def test_list_expenses_paginated(client, token, create_expense):
+    for day in range(1, 6):
+        create_expense(token, date=f'2024-07-0{day}', recurrence_flag='monthly')
+    headers = {'Authorization': f'Bearer {token}'}
+
+    response = client.get('/expenses?limit=2', headers=headers)
+    assert response.status_code == 200
+    page = json.loads(response.get_data(as_text=True))
+    assert [e['date'][:10] for e in page['expenses']] == ['2024-07-05', '2024-07-04']
+    assert page['next_cursor'] is not None
+
+    seen = [e['id'] for e in page['expenses']]
+    while page['next_cursor']:
+        response = client.get(f"/expenses?limit=2&cursor={page['next_cursor']}", headers=headers)
+        assert response.status_code == 200
+        page = json.loads(response.get_data(as_text=True))
+        seen.extend(e['id'] for e in page['expenses'])
+    assert len(seen) == 5
+    assert len(set(seen)) == 5
+
+def test_list_expenses_paginated_same_date(client, token, create_expense):
+    # Expenses sharing a date are split across pages by id without duplicates.
+    for _ in range(3):
+        create_expense(token, recurrence_flag='daily')
+    headers = {'Authorization': f'Bearer {token}'}
+
+    first = json.loads(client.get('/expenses?limit=2', headers=headers).get_data(as_text=True))
+    second = json.loads(client.get(f"/expenses?limit=2&cursor={first['next_cursor']}", headers=headers).get_data(as_text=True))
+    ids = [e['id'] for e in first['expenses'] + second['expenses']]
+    assert ids == sorted(ids, reverse=True)
+    assert len(set(ids)) == 3
+    assert second['next_cursor'] is None
+
+def test_list_expenses_paginated_with_filters(client, token, create_expense):
+    create_expense(token, category='Food', recurrence_flag='weekly')
+    create_expense(token, category='Travel', recurrence_flag='weekly')
+    create_expense(token, category='Food', recurrence_flag='weekly')
+    headers = {'Authorization': f'Bearer {token}'}
+
+    page = json.loads(client.get('/expenses?category=Food&limit=10', headers=headers).get_data(as_text=True))
+    assert len(page['expenses']) == 2
+    assert page['next_cursor'] is None
+
+def test_list_expenses_invalid_pagination(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.get('/expenses?limit=0', headers=headers).status_code == 400
+    assert client.get('/expenses?limit=abc', headers=headers).status_code == 400
+    assert client.get('/expenses?limit=100000', headers=headers).status_code == 400
+    assert client.get('/expenses?cursor=not-a-cursor', headers=headers).status_code == 400
+    cursor = encode_cursor(1704067200, 10 ** 30)
+    assert client.get(f'/expenses?limit=10&cursor={cursor}', headers=headers).status_code == 400
+
+def test_list_expenses_ndjson(client, token, create_expense):
+    create_expense(token, date='2024-07-01', category='Food', recurrence_flag='monthly')
+    create_expense(token, date='2024-07-02', category='Travel', recurrence_flag='monthly')
+    headers = {'Authorization': f'Bearer {token}', 'Accept': 'application/x-ndjson'}
+
+    response = client.get('/expenses', headers=headers)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    expenses = [json.loads(line) for line in lines]
+    assert [e['category'] for e in expenses] == ['Travel', 'Food']
+
+    response = client.get('/expenses?category=Food', headers=headers)
+    assert len(response.get_data(as_text=True).splitlines()) == 1
+
+def test_list_expenses_ndjson_memory_is_bounded(client, token, db):
+    import tracemalloc
+    user_id = db.execute("SELECT id FROM users WHERE username = 'testuser'").fetchone()['id']
+    rows = 20000
+    db.executemany('INSERT INTO expenses (user_id, amount_cents, description, date, date_epoch, category, recurrence_flag) VALUES (?,?,?,?,?,?,?)',
+                   ((user_id, 150, 'Exported expense ' * 4, f'2024-01-01T00:00:{i % 60:02d}+00:00', 1704067200 + i % 60, 'Export', 'daily') for i in range(rows)))
+    db.commit()
+    headers = {'Authorization': f'Bearer {token}', 'Accept': 'application/x-ndjson'}
+
+    tracemalloc.start()
+    response = client.get('/expenses', headers=headers, buffered=False)
+    size = count = 0
+    for chunk in response.response:
+        size += len(chunk)
+        count += 1
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    response.close()
+
+    assert count == rows
+    # The export itself is several MiB (compact JSON); streaming must never hold more than a small fraction of it.
+    assert size > 3 * 1024 * 1024
+    assert peak < 1024 * 1024
+
+def bulk_expense(**overrides):
+    expense = {'amount': 10, 'description': 'Imported', 'date': '2024-07-28', 'category': 'Import', 'recurrence_flag': 'monthly'}
+    expense.update(overrides)
+    return expense
+
+def test_create_expenses_bulk(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    payload = {'expenses': [bulk_expense(amount=i) for i in range(1, 51)]}
+    response = client.post('/expenses/bulk', data=json.dumps(payload), content_type='application/json', headers=headers)
+    assert response.status_code == 201
+    result = json.loads(response.get_data(as_text=True))
+    assert result['created'] == 50
+    assert result['errors'] == []
+    assert len(set(result['ids'])) == 50
+
+    # The returned ids map back to the submitted rows in order.
+    response = client.get(f"/expenses/{result['ids'][9]}", headers=headers)
+    created = json.loads(response.get_data(as_text=True))
+    assert created['amount'] == 10
+    assert created['date'] == '2024-07-28T00:00:00+00:00'
+
+def test_create_expenses_bulk_reports_row_errors(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    payload = {'expenses': [bulk_expense(), bulk_expense(amount='ten'), bulk_expense(date='yesterday'), {'amount': 1}, bulk_expense()]}
+    response = client.post('/expenses/bulk', data=json.dumps(payload), content_type='application/json', headers=headers)
+    assert response.status_code == 201
+    result = json.loads(response.get_data(as_text=True))
+    assert result['created'] == 2
+    assert [e['index'] for e in result['errors']] == [1, 2, 3]
+    assert result['errors'][0]['error'] == 'Amount must be a number'
+
+    response = client.get('/expenses', headers=headers)
+    assert len(json.loads(response.get_data(as_text=True))) == 2
+
+@pytest.mark.parametrize('amount, error', [
+    (True, 'Amount must be a number'),
+    (float('nan'), 'Amount is out of range'),
+    (float('inf'), 'Amount is out of range'),
+    (1e20, 'Amount is out of range'),
+    (-(2 ** 63), 'Amount is out of range'),
+])
+def test_unstorable_amounts_are_rejected(client, token, amount, error):
+    headers = {'Authorization': f'Bearer {token}'}
+    response = client.post('/expenses', data=json.dumps(bulk_expense(amount=amount)), content_type='application/json', headers=headers)
+    assert response.status_code == 400
+    assert json.loads(response.get_data(as_text=True))['error'] == error
+
+    payload = {'expenses': [bulk_expense(), bulk_expense(amount=amount)]}
+    response = client.post('/expenses/bulk', data=json.dumps(payload), content_type='application/json', headers=headers)
+    assert response.status_code == 201
+    result = json.loads(response.get_data(as_text=True))
+    assert result['created'] == 1
+    assert result['errors'] == [{'error': error, 'index': 1}]
+
+    expense_id = result['ids'][0]
+    response = client.put(f'/expenses/{expense_id}', data=json.dumps({'amount': amount}), content_type='application/json', headers=headers)
+    assert response.status_code == 400
+    assert json.loads(response.get_data(as_text=True))['error'] == error
+    assert json.loads(client.get(f'/expenses/{expense_id}', headers=headers).get_data(as_text=True))['amount'] == 10
+
+def test_create_expenses_bulk_invalid(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    response = client.post('/expenses/bulk', data=json.dumps({'expenses': [bulk_expense(recurrence_flag='yearly')]}),
+                           content_type='application/json', headers=headers)
+    assert response.status_code == 400
+    assert json.loads(response.get_data(as_text=True))['created'] == 0
+
+    response = client.post('/expenses/bulk', data=json.dumps({'expenses': []}), content_type='application/json', headers=headers)
+    assert response.status_code == 400
+
+    response = client.post('/expenses/bulk', data=json.dumps([bulk_expense()]), content_type='application/json', headers=headers)
+    assert response.status_code == 400
+
+    payload = {'expenses': [bulk_expense()] * 5001}
+    response = client.post('/expenses/bulk', data=json.dumps(payload), content_type='application/json', headers=headers)
+    assert response.status_code == 413
+
+def test_create_expenses_bulk_unauthorized(client):
+    response = client.post('/expenses/bulk', data=json.dumps({'expenses': [bulk_expense()]}), content_type='application/json')
+    assert response.status_code == 401
@@ -0,0 +1,60 @@
+import sqlite3
+import threading
+import pytest
+from app.group_commit import GroupCommitWriter
+
+@pytest.fixture
+def group_commit_app(file_app):
+    return file_app(DATABASE_POOL_SIZE=4, GROUP_COMMIT_ENABLED=True)
+
+@pytest.fixture
+def client(group_commit_app):
+    return group_commit_app.test_client()
+
+def test_concurrent_posts_commit_in_groups(group_commit_app, client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    expense = {'amount': 2.5, 'description': 'Coffee', 'date': '2024-05-01', 'category': 'Food', 'recurrence_flag': 'monthly'}
+
+    ids = []
+    def post(count):
+        thread_client = group_commit_app.test_client()
+        for _ in range(count):
+            response = thread_client.post('/expenses', headers=headers, json=expense)
+            assert response.status_code == 201
+            ids.append(response.get_json()['id'])
+    threads = [threading.Thread(target=post, args=(10,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(ids) == list(range(1, 41))
+    # Each response came after its row was committed, so the API reads every one back.
+    listed = client.get('/expenses', headers=headers).get_json()
+    assert sorted(e['id'] for e in listed) == sorted(ids)
+    assert client.get(f'/expenses/{ids[0]}', headers=headers).get_json()['amount'] == 2.5
+    stats = group_commit_app.extensions['group_commit_writers'][0].stats()
+    assert stats['statements'] == 40 and 1 <= stats['batches'] <= 40 and stats['queued'] == 0
+
+def test_failing_statement_does_not_fail_its_group(tmp_path):
+    path = str(tmp_path / 'writer.db')
+    db = sqlite3.connect(path)
+    db.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT NOT NULL)')
+    db.commit()
+    writer = GroupCommitWriter(lambda: sqlite3.connect(path), max_batch=10, max_delay=0.05)
+    writer.start()
+    futures = [writer.submit('INSERT INTO t (v) VALUES (?)', (v,)) for v in ('a', None, 'b')]
+    writer.stop()
+
+    assert futures[0].result() == 1 and futures[2].result() == 2
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[1].result()
+    assert db.execute('SELECT v FROM t ORDER BY id').fetchall() == [('a',), ('b',)]
+    assert writer.stats()['batches'] == 1
+    with pytest.raises(RuntimeError):
+        writer.submit('INSERT INTO t (v) VALUES (?)', ('c',))
+    db.close()
+
+def test_group_commit_needs_a_file_database(file_app):
+    with pytest.raises(ValueError):
+        file_app(DATABASE_URL=':memory:', DATABASE_POOL_SIZE=0, GROUP_COMMIT_ENABLED=True)
@@ -0,0 +1,60 @@
+import pytest
+from app import create_app
+from app.hashing import HashingBusy, PasswordHasher, get_password_hasher
+from config import TestingConfig
+
+CHEAP = 'pbkdf2:sha256:1000'
+
+def test_testing_config_hashes_inline(app):
+    hasher = get_password_hasher(app)
+    assert hasher.workers == 0
+    password_hash = hasher.hash('secret')
+    assert password_hash.startswith('pbkdf2:sha256:1000$')
+    assert hasher.verify(password_hash, 'secret')
+    assert not hasher.verify(password_hash, 'wrong')
+
+def test_hasher_runs_on_process_pool():
+    hasher = PasswordHasher(CHEAP, workers=1, timeout=30)
+    try:
+        password_hash = hasher.hash('secret')
+        assert hasher.verify(password_hash, 'secret')
+        stats = hasher.stats()
+        assert stats['hashed'] == 2
+        assert stats['average_seconds'] > 0
+    finally:
+        hasher.shutdown()
+
+def test_hasher_rejects_when_saturated():
+    hasher = PasswordHasher(CHEAP, workers=1, timeout=0.05)
+    hasher._slots.acquire()  # a hash already in progress
+    with pytest.raises(HashingBusy) as excinfo:
+        hasher.hash('secret')
+    assert excinfo.value.retry_after == 1
+    assert hasher.stats()['rejected'] == 1
+
+def test_hasher_rejects_early_when_queue_is_too_long():
+    hasher = PasswordHasher(CHEAP, workers=1, timeout=1.0)
+    hasher._average = 0.4
+    hasher._waiting = 2  # two hashes queued ahead: about 1.2s before this one could finish
+    with pytest.raises(HashingBusy) as excinfo:
+        hasher.hash('secret')
+    assert excinfo.value.retry_after == 2
+
+def test_login_returns_503_when_hashing_is_saturated(tmp_path):
+    class BusyConfig(TestingConfig):
+        DATABASE_URL = str(tmp_path / 'busy.db')
+        DATABASE_POOL_SIZE = 1
+        PASSWORD_HASH_WORKERS = 1
+        PASSWORD_HASH_TIMEOUT = 0.05
+    app = create_app(BusyConfig)
+    get_password_hasher(app)._slots.acquire()
+    client = app.test_client()
+
+    response = client.post('/users/login', json={'username': 'someone', 'password': 'secret'})
+    assert response.status_code == 401  # unknown users never reach the hasher
+    response = client.post('/users/register', json={'username': 'someone', 'password': 'secret'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    # The pooled connection went back before waiting on the hasher.
+    assert app.extensions['db_pool'].stats()['in_use'] == 0
+    app.extensions['db_pool'].close()
@@ -0,0 +1,86 @@
+import re
+import sqlite3
+import threading
+import pytest
+from app.instrumentation import BUCKETS_MS, RequestTimings, SamplingProfiler, TimedConnection
+
+@pytest.fixture
+def instrumented_app(file_app):
+    return file_app(DATABASE_POOL_SIZE=1, INSTRUMENTATION_ENABLED=True, METRICS_ENABLED=True)
+
+@pytest.fixture
+def client(instrumented_app):
+    return instrumented_app.test_client()
+
+def test_timed_connection_counts_statements_and_fetches():
+    timings = RequestTimings()
+    db = TimedConnection(sqlite3.connect(':memory:'), timings)
+    with db:
+        db.execute('CREATE TABLE t (x INTEGER)')
+        db.executemany('INSERT INTO t VALUES (?)', [(i,) for i in range(10)])
+    cursor = db.execute('SELECT x FROM t ORDER BY x')
+    assert cursor.fetchone() == (0,)
+    assert [row[0] for row in cursor] == list(range(1, 10))
+    assert timings.queries == 3
+    assert timings.sql > 0
+    assert db.in_transaction is False  # everything else passes through
+
+def test_server_timing_header(client, token, create_expense):
+    headers = {'Authorization': f'Bearer {token}'}
+    create_expense(token, amount=5, description='Tea', date='2024-01-02', category='Food', recurrence_flag='monthly')
+    response = client.get('/expenses?limit=10', headers=headers)
+    assert response.status_code == 200
+    timing = dict(re.findall(r'(\w+);dur=([\d.]+)', response.headers['Server-Timing']))
+    assert set(timing) == {'sql', 'serialize', 'app', 'total'}
+    assert float(timing['total']) >= float(timing['sql'])
+    queries = int(re.search(r'desc="(\d+) queries"', response.headers['Server-Timing']).group(1))
+    assert queries >= 2  # the data version lookup and the page query
+
+def test_timings_endpoint_aggregates_per_route(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    for _ in range(3):
+        client.get('/reports/expenses', headers=headers)
+    body = client.get('/metrics/timings').get_json()
+    assert len(body['buckets_ms']) == len(BUCKETS_MS)
+    route = body['routes']['GET /reports/expenses']
+    assert route['count'] == 3
+    assert sum(route['phases']['total']['buckets']) == 3
+    assert route['phases']['sql']['sum_ms'] > 0
+
+def test_instrumentation_is_off_by_default(file_app, token):
+    client = file_app().test_client()
+    response = client.get('/expenses', headers={'Authorization': f'Bearer {token}'})
+    assert 'Server-Timing' not in response.headers
+    assert client.get('/metrics/timings').status_code == 404
+
+def test_timing_endpoints_need_metrics_enabled(file_app):
+    client = file_app(INSTRUMENTATION_ENABLED=True, PROFILER_INTERVAL=0.01).test_client()
+    assert 'Server-Timing' in client.get('/users/login').headers
+    assert client.get('/metrics/timings').status_code == 404
+    assert client.get('/metrics/profile').status_code == 404
+
+def test_sampling_profiler_collapses_request_stacks():
+    profiler = SamplingProfiler(interval=0.001)
+    ready, done = threading.Event(), threading.Event()
+
+    def handler():
+        profiler.enter('GET /slow')
+        ready.set()
+        done.wait()
+        profiler.exit()
+
+    thread = threading.Thread(target=handler)
+    thread.start()
+    ready.wait()
+    profiler.sample()
+    profiler.sample()
+    done.set()
+    thread.join()
+    profiler.sample()  # the thread has left the request, so nothing is counted
+
+    lines = profiler.collapsed().splitlines()
+    assert len(lines) == 1
+    stack, count = lines[0].rsplit(' ', 1)
+    assert count == '2'
+    assert stack.startswith('GET /slow;')
+    assert 'handler (test_instrumentation.py:' in stack
@@ -0,0 +1,73 @@
+import threading
+import pytest
+from app.metrics import RequestMetrics, get_request_metrics
+
+@pytest.fixture
+def metrics_app(file_app):
+    return file_app(RESPONSE_CACHE_BACKEND='memory', METRICS_ENABLED=True)
+
+@pytest.fixture
+def client(metrics_app):
+    return metrics_app.test_client()
+
+def samples(text):
+    return dict(line.rsplit(' ', 1) for line in text.splitlines() if line and not line.startswith('#'))
+
+def test_request_metrics_add_up_threads():
+    metrics = RequestMetrics()
+
+    def serve(count):
+        for _ in range(count):
+            metrics.start('GET', '/expenses')
+            metrics.set_status(200)
+            metrics.finish()
+
+    threads = [threading.Thread(target=serve, args=(100,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    metrics.start('GET', '/expenses')  # one request still running on this thread
+
+    totals = metrics.collect()
+    assert totals.requests == {('GET', '/expenses', 200): 400}
+    histogram = totals.durations[('GET', '/expenses')]
+    assert sum(histogram[:-1]) == 400
+    assert totals.started - totals.finished == 1
+    # The exited threads were folded into the retired totals, and still count.
+    assert len(metrics._threads) == 1
+    assert metrics.collect().requests == {('GET', '/expenses', 200): 400}
+
+def test_metrics_endpoint_exposes_prometheus_text(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    for _ in range(3):
+        client.get('/reports/expenses', headers=headers)
+    client.get('/no/such/route')
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    text = response.get_data(as_text=True)
+    assert '# TYPE http_request_duration_seconds histogram' in text
+    values = samples(text)
+    assert values['http_requests_total{method="GET",route="/reports/expenses",status="200"}'] == '3'
+    assert values['http_requests_total{method="POST",route="/users/register",status="201"}'] == '1'
+    assert values['http_requests_total{method="GET",route="<unmatched>",status="404"}'] == '1'
+    assert values['http_request_duration_seconds_count{method="GET",route="/reports/expenses"}'] == '3'
+    assert values['http_request_duration_seconds_bucket{method="GET",route="/reports/expenses",le="+Inf"}'] == '3'
+    assert values['http_requests_in_flight'] == '1'  # the scrape itself
+    assert values['db_pool_connections{state="in_use"}'] == '0'
+    assert values['response_cache_hits_total'] == '2'
+    assert values['response_cache_misses_total'] == '1'
+
+def test_metrics_can_be_disabled(file_app):
+    app = file_app(METRICS_ENABLED=False)
+    assert get_request_metrics(app) is None
+    assert app.test_client().get('/metrics').status_code == 404
+
+def test_metrics_token_is_required_when_set(file_app):
+    client = file_app(METRICS_ENABLED=True, METRICS_TOKEN='scrape-secret', INSTRUMENTATION_ENABLED=True).test_client()
+    for path in ('/metrics', '/metrics/timings'):
+        assert client.get(path).status_code == 401
+        assert client.get(path, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+        assert client.get(path, headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
@@ -0,0 +1,104 @@
+import sqlite3
+import threading
+from app.migrations import migrate, get_version, list_migrations, SCHEMA_PATH
+
+def latest_version():
+    return list_migrations()[-1][0]
+
+def query_plan(db, query, params):
+    return ' '.join(row[3] for row in db.execute('EXPLAIN QUERY PLAN ' + query, params))
+
+def test_migrate_fresh_database():
+    db = sqlite3.connect(':memory:')
+    applied = migrate(db)
+    assert applied == [version for version, _ in list_migrations()]
+    assert get_version(db) == latest_version()
+
+    tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {'users', 'expenses'} <= tables
+
+def test_migrate_is_idempotent():
+    db = sqlite3.connect(':memory:')
+    migrate(db)
+    assert migrate(db) == []
+    assert get_version(db) == latest_version()
+
+def test_migrate_adopts_existing_database():
+    # A database created by the old executescript boot path has tables but no version.
+    db = sqlite3.connect(':memory:')
+    with open(SCHEMA_PATH) as f:
+        db.executescript(f.read())
+    db.execute("INSERT INTO users (username, password_hash) VALUES ('legacy', 'hash')")
+    db.commit()
+
+    migrate(db)
+    assert get_version(db) == latest_version()
+    assert db.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 1
+
+def test_concurrent_migrations_apply_each_step_once(tmp_path):
+    # Workers booting together each migrate the same file; every step must run exactly once.
+    path = str(tmp_path / 'expenses.db')
+    results, errors = [], []
+    start = threading.Barrier(4)
+
+    def boot():
+        db = sqlite3.connect(path, timeout=30)
+        try:
+            start.wait()
+            results.append(migrate(db))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+    threads = [threading.Thread(target=boot) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(number for applied in results for number in applied) == [number for number, _ in list_migrations()]
+    db = sqlite3.connect(path)
+    assert get_version(db) == latest_version()
+    db.close()
+
+def test_expense_listing_uses_indexes(db):
+    plan = query_plan(db, 'SELECT * FROM expenses WHERE user_id = ? AND date_epoch >= ? ORDER BY date_epoch DESC, id DESC', (1, 1704067200))
+    assert 'idx_expenses_user_date_id' in plan
+    assert 'TEMP B-TREE' not in plan
+
+    plan = query_plan(db, 'SELECT * FROM expenses WHERE user_id = ? AND category = ? ORDER BY date_epoch DESC, id DESC', (1, 'Food'))
+    assert 'idx_expenses_user_category_date' in plan
+    assert 'TEMP B-TREE' not in plan
+
+def test_keyset_page_uses_index(db):
+    plan = query_plan(db, 'SELECT * FROM expenses WHERE user_id = ? AND (date_epoch, id) < (?, ?) ORDER BY date_epoch DESC, id DESC LIMIT 50',
+                      (1, 1704067200, 10))
+    assert 'idx_expenses_user_date_id (user_id=? AND date_epoch<?)' in plan
+    assert 'TEMP B-TREE' not in plan
+
+def test_migrate_converts_amounts_and_dates():
+    db = sqlite3.connect(':memory:')
+    db.row_factory = sqlite3.Row
+    migrate(db, target=6)
+    db.execute("INSERT INTO users (username, password_hash) VALUES ('legacy', 'hash')")
+    db.executemany('INSERT INTO expenses (user_id, amount, description, date, category, recurrence_flag) VALUES (1, ?, ?, ?, ?, NULL)', [
+        (0.1, 'a', '2024-03-01T23:30:00-02:00', 'Food'),
+        (0.2, 'b', '2024-03-02T00:15:00Z', 'Food'),
+        (19.99, 'c', '2024-03-02', 'Rent'),
+    ])
+    db.commit()
+
+    assert migrate(db, target=7) == [7]
+    rows = db.execute('SELECT amount_cents, date, date_epoch FROM expenses ORDER BY id').fetchall()
+    assert [tuple(r) for r in rows] == [(10, '2024-03-01T23:30:00-02:00', 1709343000),
+                                        (20, '2024-03-02T00:15:00Z', 1709338500),
+                                        (1999, '2024-03-02', 1709337600)]
+    # All three fall on the same UTC day, whatever offset they were written with.
+    totals = {(r['day'], r['category']): (r['total'], r['count']) for r in db.execute('SELECT * FROM expense_daily_totals')}
+    assert totals == {('2024-03-02', 'Food'): (30, 2), ('2024-03-02', 'Rent'): (1999, 1)}
+
+    # Ids keep counting from where they were.
+    db.execute('DELETE FROM expenses WHERE id = 3')
+    db.execute("INSERT INTO expenses (user_id, amount_cents, description, date, date_epoch, category) VALUES (1, 1, 'd', '2024-03-03', 1709424000, 'Food')")
+    assert db.execute('SELECT MAX(id) FROM expenses').fetchone()[0] == 4
@@ -65,4 +65,47 @@ def test_expense_update():
     expense.amount = 150.0
     expense.save()
     retrieved_expense = Expense.get_by_id(expense.id)
-    assert retrieved_expense.amount == 150.0
\ No newline at end of file
+    assert retrieved_expense.amount == 150.0
+
+
+def test_expense_total_by_category():
+    user = User(username='totalsuser', password_hash='hashed')
+    user.save()
+    Expense(user_id=user.id, amount=10.0, description='Lunch', date='2024-07-01', category='Food', recurrence_flag='daily').save()
+    Expense(user_id=user.id, amount=5.5, description='Dinner', date='2024-07-15', category='Food', recurrence_flag='daily').save()
+    Expense(user_id=user.id, amount=700.0, description='Rent', date='2024-08-01', category='Rent', recurrence_flag='monthly').save()
+
+    assert Expense.total_by_category(user.id) == {'Food': 15.5, 'Rent': 700.0}
+    assert Expense.total_by_category(user.id, start_date='2024-07-10', end_date='2024-07-31') == {'Food': 5.5}
+    assert Expense.total_by_category(user.id + 1) == {}
+
+def test_expense_save_all():
+    user = User(username='bulkuser', password_hash='hashed')
+    user.save()
+    expenses = [Expense(user_id=user.id, amount=float(i), description=f'Row {i}', date='2024-07-27', category='Bulk', recurrence_flag='weekly') for i in range(10)]
+    Expense.save_all(expenses)
+
+    for expense in expenses:
+        retrieved = Expense.get_by_id(expense.id)
+        assert retrieved.description == expense.description
+        assert retrieved.amount == expense.amount
+    assert len(Expense.get_all_by_user_id(user.id)) == 10
+
+def test_expense_amounts_are_exact_cents():
+    user = User(username='centsuser', password_hash='hashed')
+    user.save()
+    Expense.save_all([Expense(user_id=user.id, amount=0.1, description='Dime', date='2024-07-01', category='Coins', recurrence_flag='daily') for _ in range(3)])
+    odd = Expense(user_id=user.id, amount=1.005, description='Odd', date='2024-07-02', category='Odd', recurrence_flag='daily').save()
+
+    assert Expense.total_by_category(user.id) == {'Coins': 0.3, 'Odd': 1.0}
+    assert odd.amount == Expense.get_by_id(odd.id).amount == 1.0
+
+def test_expense_dates_order_by_instant():
+    # Offsets differ, so string order would put these the wrong way round.
+    user = User(username='offsetuser', password_hash='hashed')
+    user.save()
+    later = Expense(user_id=user.id, amount=1.0, description='Later', date='2024-07-01T01:00:00+00:00', category='Food', recurrence_flag='daily').save()
+    earlier = Expense(user_id=user.id, amount=1.0, description='Earlier', date='2024-07-01T02:00:00+05:00', category='Food', recurrence_flag='daily').save()
+
+    assert [e.id for e in Expense.get_all_by_user_id(user.id)] == [later.id, earlier.id]
+    assert [e.id for e in Expense.get_all_by_user_id(user.id, end_date='2024-07-01T00:00:00+00:00')] == [earlier.id]
@@ -0,0 +1,177 @@
+import sqlite3
+from datetime import date, datetime, timezone
+from app.migrations import migrate
+from app.models import User, Expense
+from app.recurrence import add_months, occurrence_at, generate_due_occurrences, to_utc_string, iter_virtual_occurrences
+from app.utils import to_epoch
+
+NOW = datetime(2024, 4, 15, 12, 0, tzinfo=timezone.utc)
+
+def make_template(date_str, recurrence_flag, amount=10.0):
+    user = User.get_by_username('recurring') or User(username='recurring', password_hash='hashed').save()
+    return Expense(user_id=user.id, amount=amount, description=f'{recurrence_flag} bill', date=date_str, category='Bills', recurrence_flag=recurrence_flag, recurring=True).save()
+
+def occurrence_dates(db, template_id):
+    return [r['date'] for r in db.execute('SELECT date FROM expenses WHERE template_id = ? ORDER BY date', (template_id,))]
+
+def test_add_months_clamps_to_month_end():
+    assert add_months(date(2024, 1, 31), 1) == date(2024, 2, 29)
+    assert add_months(date(2023, 1, 31), 1) == date(2023, 2, 28)
+    assert add_months(date(2024, 11, 30), 3) == date(2025, 2, 28)
+    assert add_months(date(2024, 5, 15), 12) == date(2025, 5, 15)
+
+def test_monthly_occurrences_do_not_drift():
+    anchor = date(2024, 1, 31)
+    assert [occurrence_at(anchor, 'monthly', n) for n in range(4)] == [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)]
+    assert occurrence_at(anchor, 'weekly', 2) == date(2024, 2, 14)
+    assert occurrence_at(anchor, 'daily', 1) == date(2024, 2, 1)
+
+def test_new_template_is_scheduled(db):
+    template = make_template('2024-04-10T09:00:00+02:00', 'daily')
+    row = db.execute('SELECT next_due, recurrence_count, template_id FROM expenses WHERE id = ?', (template.id,)).fetchone()
+    assert row['next_due'] == '2024-04-10T07:00:00+00:00'
+    assert row['recurrence_count'] == 0
+    assert row['template_id'] is None
+
+def test_recurrence_is_opt_in(db):
+    one_off = Expense(user_id=make_template('2024-04-01', 'daily').user_id, amount=5.0, description='Taxi', date='2024-04-01',
+                      category='Travel', recurrence_flag='daily').save()
+    assert db.execute('SELECT next_due FROM expenses WHERE id = ?', (one_off.id,)).fetchone()['next_due'] is None
+    generate_due_occurrences(db, now=NOW)
+    assert occurrence_dates(db, one_off.id) == []
+
+    # Opting in later schedules it from its own date; opting out takes it off the schedule.
+    one_off.recurring = True
+    one_off.save()
+    assert db.execute('SELECT next_due FROM expenses WHERE id = ?', (one_off.id,)).fetchone()['next_due'] == '2024-04-01T00:00:00+00:00'
+    one_off.recurring = False
+    one_off.save()
+    assert db.execute('SELECT next_due FROM expenses WHERE id = ?', (one_off.id,)).fetchone()['next_due'] is None
+
+def test_migration_unschedules_existing_expenses():
+    # 0006 scheduled every expense with a flag; nothing had opted in, so 0010 unschedules them all.
+    db = sqlite3.connect(':memory:')
+    migrate(db, target=9)
+    db.execute("INSERT INTO users (username, password_hash) VALUES ('old', 'x')")
+    db.execute('''INSERT INTO expenses (user_id, amount_cents, description, date, date_epoch, category, recurrence_flag)
+                  VALUES (1, 100, 'Rent', '2020-01-01', 1577836800, 'Home', 'monthly')''')
+    db.commit()
+    assert db.execute('SELECT next_due FROM expenses').fetchone()[0] is not None
+    migrate(db)
+    assert db.execute('SELECT next_due, recurring FROM expenses').fetchone() == (None, 0)
+
+def test_generate_missed_occurrences(db):
+    monthly = make_template('2024-01-31', 'monthly')
+    weekly = make_template('2024-03-25T08:00:00+00:00', 'weekly')
+    daily = make_template('2024-04-12T13:00:00+00:00', 'daily')
+
+    stats = generate_due_occurrences(db, now=NOW)
+    assert stats == {'templates': 3, 'occurrences': 2 + 3 + 2}
+    assert occurrence_dates(db, monthly.id) == ['2024-02-29', '2024-03-31']
+    assert occurrence_dates(db, weekly.id) == ['2024-04-01T08:00:00+00:00', '2024-04-08T08:00:00+00:00', '2024-04-15T08:00:00+00:00']
+    assert occurrence_dates(db, daily.id) == ['2024-04-13T13:00:00+00:00', '2024-04-14T13:00:00+00:00']
+
+    row = db.execute('SELECT next_due, recurrence_count FROM expenses WHERE id = ?', (monthly.id,)).fetchone()
+    assert row['next_due'] == '2024-04-30T00:00:00+00:00'
+    assert row['recurrence_count'] == 2
+
+    # Occurrences copy the template but are not templates themselves.
+    occurrence = db.execute('SELECT * FROM expenses WHERE template_id = ?', (weekly.id,)).fetchone()
+    assert occurrence['category'] == 'Bills'
+    assert occurrence['amount_cents'] == 1000
+    assert occurrence['recurrence_flag'] is None
+    assert occurrence['next_due'] is None
+
+def test_generate_is_idempotent(db):
+    template = make_template('2024-04-01', 'daily')
+    generate_due_occurrences(db, now=NOW)
+    assert generate_due_occurrences(db, now=NOW) == {'templates': 0, 'occurrences': 0}
+
+    # A worker that crashed before saving the schedule redoes the batch without duplicates.
+    db.execute("UPDATE expenses SET next_due = '2024-04-01T00:00:00+00:00', recurrence_count = 0 WHERE id = ?", (template.id,))
+    db.commit()
+    stats = generate_due_occurrences(db, now=NOW)
+    assert stats == {'templates': 1, 'occurrences': 0}
+    assert len(occurrence_dates(db, template.id)) == 14
+
+def test_generate_in_batches(db):
+    templates = [make_template(f'2024-04-{day:02d}', 'weekly') for day in range(1, 9)]
+    stats = generate_due_occurrences(db, now=NOW, batch_size=3)
+    assert stats['templates'] == 8
+    assert all(occurrence_dates(db, t.id) for t in templates)
+
+def test_occurrences_feed_reports(db):
+    template = make_template('2024-04-01T10:00:00+00:00', 'weekly', amount=25.0)
+    generate_due_occurrences(db, now=NOW)
+    assert Expense.total_by_category(template.user_id) == {'Bills': 25.0 * 3}
+
+def test_create_recurring_expense(db):
+    template = make_template('2024-01-31T10:00:00+00:00', 'monthly')
+    first = template.create_recurring_expense()
+    second = template.create_recurring_expense()
+    assert first.date == '2024-02-29T10:00:00+00:00'
+    assert second.date == '2024-03-31T10:00:00+00:00'
+    assert Expense.get_by_id(second.id).category == 'Bills'
+    row = db.execute('SELECT next_due, recurrence_count FROM expenses WHERE id = ?', (template.id,)).fetchone()
+    assert row['recurrence_count'] == 2
+    assert row['next_due'] == to_utc_string(datetime(2024, 4, 30, 10, tzinfo=timezone.utc))
+
+def virtual_dates(template, **kwargs):
+    row = {'id': template.id, 'date': template.date, 'recurrence_flag': template.recurrence_flag, 'recurrence_count': 0}
+    return list(iter_virtual_occurrences(row, now=NOW, **kwargs))
+
+def test_virtual_occurrences_match_materialized(db):
+    for date_str, flag in [('2024-01-31', 'monthly'), ('2024-03-25T08:00:00+00:00', 'weekly'), ('2024-04-12T13:00:00+00:00', 'daily')]:
+        template = make_template(date_str, flag)
+        virtual = virtual_dates(template)
+        generate_due_occurrences(db, now=NOW)
+        assert virtual == occurrence_dates(db, template.id)[::-1]
+
+def test_virtual_occurrences_respect_window(db):
+    template = make_template('2024-01-01', 'daily')
+    assert virtual_dates(template, start_date='2024-04-10', end_date='2024-04-12') == ['2024-04-12', '2024-04-11', '2024-04-10']
+    assert virtual_dates(template, start_date='2024-04-14') == ['2024-04-15', '2024-04-14']
+    assert virtual_dates(template, start_date='2024-04-14', before=(to_epoch('2024-04-15'), -template.id)) == ['2024-04-14']
+    assert virtual_dates(template, start_date='2024-04-14', before=(to_epoch('2024-04-15'), 0)) == ['2024-04-15', '2024-04-14']
+
+def test_expand_recurring_merges_with_stored_rows(db):
+    template = make_template('2024-04-12', 'daily', amount=3.0)
+    Expense(user_id=template.user_id, amount=7.0, description='Lunch', date='2024-04-13', category='Food', recurrence_flag=None).save()
+
+    expenses = Expense.get_all_by_user_id(template.user_id, expand_recurring=True, now=NOW)
+    assert [(e.date, e.id, e.template_id) for e in expenses] == [
+        ('2024-04-15', None, template.id), ('2024-04-14', None, template.id),
+        ('2024-04-13', template.id + 1, None), ('2024-04-13', None, template.id), ('2024-04-12', template.id, None)]
+    assert [row[-2:] for row in Expense.iter_api_rows(template.user_id, batch_size=2, expand_recurring=True, now=NOW)] == [e.sort_key() for e in expenses]
+
+    # Keyset pages walk the merged order without gaps or repeats.
+    page = Expense.get_all_by_user_id(template.user_id, limit=2, expand_recurring=True, now=NOW)
+    rest = Expense.get_all_by_user_id(template.user_id, after=page[-1].sort_key(), expand_recurring=True, now=NOW)
+    assert [e.sort_key() for e in page + rest] == [e.sort_key() for e in expenses]
+
+    assert Expense.total_by_category(template.user_id, expand_recurring=True, now=NOW) == {'Bills': 3.0 * 4, 'Food': 7.0}
+    assert Expense.total_by_category(template.user_id, '2024-04-14', '2024-04-14', expand_recurring=True, now=NOW) == {'Bills': 3.0}
+
+def test_virtual_mode_stores_no_occurrences(client, db, token, monkeypatch):
+    monkeypatch.setitem(client.application.config, 'RECURRENCE_MODE', 'virtual')
+    headers = {'Authorization': f'Bearer {token}'}
+    client.post('/expenses', json={'amount': 2.0, 'description': 'Coffee', 'date': '2020-01-01', 'category': 'Food', 'recurrence_flag': 'weekly', 'recurring': True}, headers=headers)
+
+    listed = client.get('/expenses', headers=headers).get_json()
+    assert len(listed) > 52 * 4
+    assert listed[-1]['date'] == '2020-01-01T00:00:00+00:00'
+    assert db.execute('SELECT COUNT(*) FROM expenses').fetchone()[0] == 1
+
+    report = client.get('/reports/expenses', headers=headers).get_json()
+    assert report == {'Food': 2.0 * len(listed)}
+
+    # One-off expenses are listed once, whatever their recurrence_flag.
+    client.post('/expenses', json={'amount': 5.0, 'description': 'Taxi', 'date': '2020-01-01', 'category': 'Travel', 'recurrence_flag': 'daily'}, headers=headers)
+    assert len(client.get('/expenses', headers=headers).get_json()) == len(listed) + 1
+
+def test_recurring_must_be_a_boolean(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    expense = {'amount': 2.0, 'description': 'Coffee', 'date': '2024-01-01', 'category': 'Food', 'recurrence_flag': 'weekly', 'recurring': 'yes'}
+    response = client.post('/expenses', json=expense, headers=headers)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Recurring must be a boolean'
@@ -0,0 +1,62 @@
+import sqlite3
+import pytest
+from app.database import get_db
+
+@pytest.fixture
+def replica_app(file_app, request):
+    # Unparametrized tests still get one through the autouse client; it reads the primary.
+    mode = getattr(request, 'param', None)
+    return file_app(DATABASE_READ_MODE=mode, DATABASE_READ_REFRESH=3600)  # the tests refresh by hand
+
+@pytest.fixture
+def client(replica_app):
+    return replica_app.test_client()
+
+def descriptions(client, headers):
+    return sorted(e['description'] for e in client.get('/expenses', headers=headers).get_json())
+
+@pytest.mark.parametrize('replica_app', ['readonly', 'snapshot'], indirect=True)
+def test_reads_use_a_read_only_connection(replica_app):
+    with replica_app.test_request_context('/expenses', method='GET'):
+        replica_app.preprocess_request()
+        with pytest.raises(sqlite3.OperationalError, match='readonly'):
+            get_db().execute("INSERT INTO users (username, password_hash) VALUES ('x', 'y')")
+    with replica_app.test_request_context('/expenses', method='POST'):
+        replica_app.preprocess_request()
+        assert get_db().execute('PRAGMA query_only').fetchone()[0] == 0
+        get_db().execute("INSERT INTO users (username, password_hash) VALUES ('x', 'y')")
+
+@pytest.mark.parametrize('replica_app', ['readonly'], indirect=True)
+def test_read_only_replica_sees_every_commit(replica_app, client, token, create_expense):
+    alice = {'Authorization': f'Bearer {token}'}
+    assert create_expense(token, 5, description='Lunch', category='Food', recurrence_flag='monthly').status_code == 201
+    assert descriptions(client, alice) == ['Lunch']
+    assert replica_app.extensions['db_replicas'].stats() == {'replica_reads': 1, 'sticky_reads': 0, 'sticky_users': 0}
+
+@pytest.mark.parametrize('replica_app', ['snapshot'], indirect=True)
+def test_snapshot_reads_your_own_writes(replica_app, client, token, register_user, login_user, create_expense):
+    replicas = replica_app.extensions['db_replicas']
+    register_user('bob', 'secret')  # user ids 1 (testuser) and 2
+    alice = {'Authorization': f'Bearer {token}'}
+    bob = {'Authorization': f"Bearer {login_user('bob', 'secret').get_json()['access_token']}"}
+    assert create_expense(token, 5, description='Lunch', category='Food', recurrence_flag='monthly').status_code == 201
+    # Alice wrote after the snapshot, so she reads the primary until the next refresh.
+    assert descriptions(client, alice) == ['Lunch']
+    assert replicas.stats()['sticky_reads'] == 1
+
+    # A write by someone else (here the scheduler's own connection) waits for the refresh.
+    db = sqlite3.connect(replica_app.config['DATABASE_URL'])
+    db.execute('''INSERT INTO expenses (user_id, amount_cents, description, date, date_epoch, category, recurrence_flag)
+                  VALUES (2, 100, 'Taxi', '2024-05-01', 1714521600, 'Travel', 'monthly')''')
+    db.commit()
+    db.close()
+    assert descriptions(client, bob) == []
+
+    replicas.refresh()
+    assert descriptions(client, bob) == ['Taxi']
+    assert descriptions(client, alice) == ['Lunch']
+    assert replicas.stats() == {'replica_reads': 3, 'sticky_reads': 1, 'sticky_users': 0}
+
+def test_read_mode_is_validated(file_app):
+    with pytest.raises(ValueError):
+        file_app(DATABASE_READ_MODE='mirror')
@@ -0,0 +1,112 @@
+import json
+import pytest
+
+def get_report(client, token, query=''):
+    headers = {'Authorization': f'Bearer {token}'}
+    return client.get(f'/reports/expenses{query}', headers=headers)
+
+def test_report_totals_per_category(client, token, create_expense):
+    create_expense(token, 10.5, category='Food', recurrence_flag='monthly')
+    create_expense(token, 4.5, category='Food', recurrence_flag='monthly')
+    create_expense(token, 100, category='Rent', recurrence_flag='monthly')
+
+    response = get_report(client, token)
+    assert response.status_code == 200
+    assert json.loads(response.get_data(as_text=True)) == {'Food': 15.0, 'Rent': 100}
+
+def test_report_date_range(client, token, create_expense):
+    create_expense(token, 10, category='Food', date='2024-01-15', recurrence_flag='monthly')
+    create_expense(token, 20, category='Food', date='2024-02-15', recurrence_flag='monthly')
+    create_expense(token, 30, category='Travel', date='2024-03-15', recurrence_flag='monthly')
+
+    response = get_report(client, token, '?start_date=2024-02-01&end_date=2024-03-01')
+    assert response.status_code == 200
+    assert json.loads(response.get_data(as_text=True)) == {'Food': 20}
+
+def test_report_empty(client, token):
+    response = get_report(client, token)
+    assert response.status_code == 200
+    assert json.loads(response.get_data(as_text=True)) == {}
+
+def test_report_only_includes_own_expenses(client, token, register_user, login_user, create_expense):
+    create_expense(token, 10, category='Food', recurrence_flag='monthly')
+    register_user('other', 'password')
+    other_token = json.loads(login_user('other', 'password').get_data(as_text=True))['access_token']
+    create_expense(other_token, 99, category='Food', recurrence_flag='monthly')
+
+    response = get_report(client, token)
+    assert json.loads(response.get_data(as_text=True)) == {'Food': 10}
+
+def test_report_invalid_date(client, token):
+    response = get_report(client, token, '?start_date=invalid')
+    assert response.status_code == 400
+
+def test_report_unauthorized(client):
+    response = client.get('/reports/expenses')
+    assert response.status_code == 401
+
+def get_trend(client, token, query=''):
+    headers = {'Authorization': f'Bearer {token}'}
+    return client.get(f'/reports/trend{query}', headers=headers)
+
+def test_trend_fills_empty_buckets(client, token, create_expense):
+    create_expense(token, 10, category='Food', date='2024-01-15', recurrence_flag='monthly')
+    create_expense(token, 2.5, category='Food', date='2024-01-31T23:59:59Z', recurrence_flag='monthly')
+    create_expense(token, 30, category='Travel', date='2024-03-01', recurrence_flag='monthly')
+
+    response = get_trend(client, token)
+    assert response.status_code == 200
+    assert response.get_json() == {
+        'granularity': 'month',
+        'categories': ['Food', 'Travel'],
+        'buckets': [
+            {'start': '2024-01-01', 'total': 12.5, 'totals': {'Food': 12.5, 'Travel': 0}},
+            {'start': '2024-02-01', 'total': 0, 'totals': {'Food': 0, 'Travel': 0}},
+            {'start': '2024-03-01', 'total': 30, 'totals': {'Food': 0, 'Travel': 30}},
+        ],
+    }
+
+def test_trend_weeks_start_on_monday_and_cover_the_requested_range(client, token, create_expense):
+    create_expense(token, 5, category='Food', date='2024-05-05', recurrence_flag='monthly')  # a Sunday
+    create_expense(token, 7, category='Food', date='2024-05-06T08:00:00Z', recurrence_flag='monthly')  # the next Monday
+    create_expense(token, 1, category='Food', date='2024-05-06T20:00:00Z', recurrence_flag='monthly')  # after end_date
+
+    body = get_trend(client, token, '?granularity=week&start_date=2024-04-25&end_date=2024-05-20T12:00:00Z').get_json()
+    assert [(b['start'], b['total']) for b in body['buckets']] == [
+        ('2024-04-22', 0), ('2024-04-29', 5), ('2024-05-06', 8), ('2024-05-13', 0), ('2024-05-20', 0)]
+
+    body = get_trend(client, token, '?granularity=day&start_date=2024-05-05&end_date=2024-05-06T12:00:00Z').get_json()
+    assert [(b['start'], b['total']) for b in body['buckets']] == [('2024-05-05', 5), ('2024-05-06', 7)]
+
+def test_trend_matches_the_category_report(client, token, create_expense):
+    for day, amount, category in [(1, 10.1, 'Food'), (9, 0.2, 'Rent'), (17, 3, 'Food'), (28, 4.05, 'Travel')]:
+        create_expense(token, amount, category=category, date=f'2024-02-{day:02d}T12:00:00Z', recurrence_flag='monthly')
+    query = '?start_date=2024-02-01T13:00:00Z&end_date=2024-02-28T11:00:00Z'
+    report = get_report(client, token, query).get_json()
+    buckets = get_trend(client, token, query + '&granularity=day').get_json()['buckets']
+    assert len(buckets) == 28
+    summed = {}
+    for bucket in buckets:
+        for category, total in bucket['totals'].items():
+            if total:
+                summed[category] = round(summed.get(category, 0) + total, 2)
+    assert summed == report == {'Food': 3, 'Rent': 0.2}
+
+def test_trend_rejects_bad_input(client, token):
+    assert get_trend(client, token, '?granularity=year').status_code == 400
+    assert get_trend(client, token, '?start_date=invalid').status_code == 400
+    response = get_trend(client, token, '?granularity=day&start_date=2020-01-01&end_date=2024-01-01')
+    assert response.status_code == 400
+    assert 'buckets' in response.get_json()['error']
+
+def test_trend_empty(client, token):
+    assert get_trend(client, token).get_json() == {'granularity': 'month', 'categories': [], 'buckets': []}
+
+@pytest.mark.parametrize('path', ['/expenses', '/reports/expenses', '/reports/trend', '/reports/percentiles'])
+def test_date_range_errors_are_worded_alike(client, token, path):
+    headers = {'Authorization': f'Bearer {token}'}
+    start = client.get(f'{path}?start_date=bad', headers=headers)
+    end = client.get(f'{path}?end_date=bad', headers=headers)
+    assert start.status_code == end.status_code == 400
+    assert start.get_json()['error'].startswith('Invalid start date format.')
+    assert end.get_json()['error'].startswith('Invalid end date format.')
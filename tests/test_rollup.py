@@ -0,0 +1,100 @@
+import random
+from app.models import User, Expense
+from app.rollup import check_rollup, rebuild_rollup
+
+def make_user(username='rollupuser'):
+    user = User(username=username, password_hash='hashed')
+    user.save()
+    return user
+
+def rollup_rows(db, user_id):
+    return {(r['day'], r['category']): (r['total'], r['count'])
+            for r in db.execute('SELECT day, category, total, count FROM expense_daily_totals WHERE user_id = ?', (user_id,))}
+
+def raw_totals(user_id, start_date=None, end_date=None):
+    totals = {}
+    for expense in Expense.get_all_by_user_id(user_id, start_date, end_date):
+        totals[expense.category] = totals.get(expense.category, 0) + expense.amount
+    return totals
+
+def test_rollup_follows_insert_update_delete(db):
+    user = make_user()
+    lunch = Expense(user_id=user.id, amount=10.0, description='Lunch', date='2024-07-01T12:00:00+00:00', category='Food', recurrence_flag='daily').save()
+    Expense(user_id=user.id, amount=5.0, description='Snack', date='2024-07-01T16:00:00+00:00', category='Food', recurrence_flag='daily').save()
+    assert rollup_rows(db, user.id) == {('2024-07-01', 'Food'): (1500, 2)}
+
+    lunch.amount = 12.0
+    lunch.date = '2024-07-02T12:00:00+00:00'
+    lunch.save()
+    assert rollup_rows(db, user.id) == {('2024-07-01', 'Food'): (500, 1), ('2024-07-02', 'Food'): (1200, 1)}
+
+    lunch.delete()
+    assert rollup_rows(db, user.id) == {('2024-07-01', 'Food'): (500, 1)}
+
+def test_rollup_follows_bulk_insert(db):
+    user = make_user()
+    Expense.save_all([Expense(user_id=user.id, amount=1.0, description='Row', date='2024-07-01', category='Bulk', recurrence_flag='weekly') for _ in range(25)])
+    assert rollup_rows(db, user.id) == {('2024-07-01', 'Bulk'): (2500, 25)}
+    assert check_rollup(db) == []
+
+def test_total_by_category_matches_raw_rows(db):
+    user = make_user()
+    rng = random.Random(1)
+    expenses = []
+    for _ in range(300):
+        day = rng.randint(1, 28)
+        expenses.append(Expense(user_id=user.id, amount=float(rng.randint(1, 100)), description='Random',
+                                date=f'2024-02-{day:02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00+00:00',
+                                category=rng.choice(['Food', 'Rent', 'Travel']), recurrence_flag='monthly'))
+    Expense.save_all(expenses)
+
+    ranges = [
+        (None, None),
+        ('2024-02-05T13:30:00+00:00', None),
+        (None, '2024-02-20T08:15:00+00:00'),
+        ('2024-02-05T13:30:00+00:00', '2024-02-20T08:15:00+00:00'),
+        ('2024-02-10T06:00:00+00:00', '2024-02-10T18:00:00+00:00'),
+        ('2024-02-10T06:00:00+00:00', '2024-02-11T18:00:00+00:00'),
+        ('2024-02-01T00:00:00+00:00', '2024-02-28T00:00:00+00:00'),
+        ('2024-02-20T00:00:00+00:00', '2024-02-10T00:00:00+00:00'),
+    ]
+    for start_date, end_date in ranges:
+        expected = raw_totals(user.id, start_date, end_date)
+        actual = Expense.total_by_category(user.id, start_date, end_date)
+        assert actual.keys() == expected.keys()
+        for category in expected:
+            assert abs(actual[category] - expected[category]) < 1e-6
+
+def test_total_by_category_reads_rollup_for_whole_days(db):
+    user = make_user()
+    Expense.save_all([Expense(user_id=user.id, amount=1.0, description='Row', date=f'2024-03-{d:02d}T10:00:00+00:00', category='Food', recurrence_flag='daily') for d in range(1, 31)])
+    statements = []
+    db.set_trace_callback(statements.append)
+    Expense.total_by_category(user.id, '2024-03-01T12:00:00+00:00', '2024-03-30T12:00:00+00:00')
+    db.set_trace_callback(None)
+    assert any('expense_daily_totals' in s for s in statements)
+
+def test_check_and_rebuild_rollup(db):
+    user = make_user()
+    Expense(user_id=user.id, amount=10.0, description='Lunch', date='2024-07-01', category='Food', recurrence_flag='daily').save()
+    Expense(user_id=user.id, amount=20.0, description='Train', date='2024-07-02', category='Travel', recurrence_flag='daily').save()
+    assert check_rollup(db) == []
+
+    db.execute("UPDATE expense_daily_totals SET total = 99 WHERE category = 'Food'")
+    db.execute("DELETE FROM expense_daily_totals WHERE category = 'Travel'")
+    db.execute("INSERT INTO expense_daily_totals VALUES (?, '2024-01-01', 'Ghost', 1, 1)", (user.id,))
+    db.commit()
+    mismatches = check_rollup(db)
+    assert {m['category'] for m in mismatches} == {'Food', 'Travel', 'Ghost'}
+
+    assert rebuild_rollup(db) == 2
+    assert check_rollup(db) == []
+
+def test_rollup_cli(app, db):
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['rollup', 'check'])
+    assert result.exit_code == 0
+    assert 'consistent' in result.output
+
+    result = runner.invoke(args=['rollup', 'rebuild'])
+    assert result.exit_code == 0
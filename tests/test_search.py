@@ -0,0 +1,83 @@
+import sqlite3
+from app.migrations import migrate
+from app.utils import search_terms, encode_search_cursor, decode_search_cursor
+
+def add(client, headers, description, category='Travel', date='2024-05-01'):
+    response = client.post('/expenses', headers=headers, json={'amount': 10, 'description': description, 'date': date,
+                                                               'category': category, 'recurrence_flag': 'monthly'})
+    return response.get_json()['id']
+
+def search(client, headers, q, **params):
+    return client.get('/expenses/search', headers=headers, query_string={'q': q, **params})
+
+def fts_ids(db, match):
+    return [row[0] for row in db.execute('SELECT rowid FROM expenses_fts WHERE expenses_fts MATCH ? ORDER BY rowid', (match,))]
+
+def test_search_terms():
+    assert search_terms('uber  Airport') == '"uber"* "Airport"*'
+    assert search_terms('say "hi" OR NEAR(') == '"say"* """hi"""* "OR"* "NEAR("*'
+    assert search_terms(' - * ') is None
+
+def test_search_cursor_round_trip():
+    assert decode_search_cursor(encode_search_cursor(-1.25, 7)) == (-1.25, 7)
+
+def test_migration_indexes_existing_rows_and_triggers_keep_it_in_sync():
+    db = sqlite3.connect(':memory:')
+    migrate(db, target=7)
+    db.execute("INSERT INTO users (username, password_hash) VALUES ('old', 'x')")
+    db.execute("INSERT INTO expenses (user_id, amount_cents, description, date, date_epoch, category) VALUES (1, 100, 'Uber home', '2024-01-01', 1704067200, 'Travel')")
+    db.commit()
+    migrate(db)
+    assert fts_ids(db, 'uber') == [1]
+
+    db.execute("INSERT INTO expenses (user_id, amount_cents, description, date, date_epoch, category) VALUES (1, 100, 'Rent', '2024-01-01', 1704067200, 'Housing')")
+    db.execute("UPDATE expenses SET description = 'Taxi home' WHERE id = 1")
+    assert fts_ids(db, 'uber') == []
+    assert fts_ids(db, 'taxi') == [1]
+    assert fts_ids(db, 'housing') == [2]
+    db.execute('DELETE FROM expenses WHERE id = 2')
+    assert fts_ids(db, 'housing') == []
+    db.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('integrity-check')")
+
+def test_search_ranks_matches_of_the_user_only(client, token, register_user, login_user):
+    headers = {'Authorization': f'Bearer {token}'}
+    uber_twice = add(client, headers, 'Uber uber to the airport')
+    uber_once = add(client, headers, 'Dinner then uber ride with a long description of the evening', category='Food')
+    add(client, headers, 'Monthly rent', category='Rent')
+    register_user('other', 'secret')
+    other = {'Authorization': f"Bearer {login_user('other', 'secret').get_json()['access_token']}"}
+    add(client, other, 'Uber for someone else')
+
+    response = search(client, headers, 'ub')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [e['id'] for e in body['expenses']] == [uber_twice, uber_once]
+    assert body['next_cursor'] is None
+    assert body['expenses'][0]['description'] == 'Uber uber to the airport'
+
+    # Categories are searched too, and every word has to match.
+    assert [e['description'] for e in search(client, headers, 'rent').get_json()['expenses']] == ['Monthly rent']
+    assert search(client, headers, 'uber rent').get_json()['expenses'] == []
+
+def test_search_pages_with_a_cursor(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    ids = {add(client, headers, f'Coffee {i}') for i in range(5)}
+    seen = []
+    cursor = None
+    while True:
+        params = {'limit': 2, **({'cursor': cursor} if cursor else {})}
+        body = search(client, headers, 'coffee', **params).get_json()
+        seen += [e['id'] for e in body['expenses']]
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(ids)
+
+def test_search_rejects_bad_input(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    assert search(client, headers, '  ').status_code == 400
+    assert search(client, headers, 'coffee', limit=0).status_code == 400
+    assert search(client, headers, 'coffee', cursor='bogus').status_code == 400
+    # Positions SQLite cannot bind or compare are rejected rather than failing the query.
+    for cursor in (encode_search_cursor(-1.5, 2 ** 63), encode_search_cursor(10 ** 400, 1), encode_search_cursor(float('nan'), 1)):
+        assert search(client, headers, 'coffee', cursor=cursor).status_code == 400
@@ -0,0 +1,58 @@
+import json
+import pytest
+from app.models import User, Expense
+from app.serialization import expense_dicts, get_encoder, orjson
+
+def add_expenses(user_id):
+    Expense.save_all([Expense(user_id=user_id, amount=amount, description=f'Row {i} €', date=f'2024-03-0{i + 1}T10:00:00Z',
+                              category='Food', recurrence_flag=None) for i, amount in enumerate([0.1, 12.34, 5, 1999.99])])
+
+def test_expense_is_slotted():
+    expense = Expense(user_id=1, amount=1.5, description='Tea', date='2024-01-01', category='Food', recurrence_flag=None)
+    assert not hasattr(expense, '__dict__')
+    assert list(expense.to_dict()) == list(Expense.FIELDS)
+
+def test_api_rows_match_model_objects():
+    user = User(username='rows', password_hash='x').save()
+    add_expenses(user.id)
+    rows = list(Expense.iter_api_rows(user.id))
+    expenses = Expense.get_all_by_user_id(user.id)
+    assert rows == [expense.api_row() for expense in expenses]
+    assert expense_dicts(rows) == [expense.to_dict() for expense in expenses]
+    assert list(Expense.iter_api_rows(user.id, batch_size=3)) == rows
+
+@pytest.mark.parametrize('name', ['json', 'orjson'])
+def test_encoders_agree(name):
+    if name == 'orjson' and orjson is None:
+        pytest.skip('orjson is not installed')
+    payload = {'expenses': [{'id': 1, 'amount': 0.1, 'description': 'Café "quoted"', 'recurrence_flag': None}], 'next_cursor': None}
+    encoded = get_encoder(name)(payload)
+    assert isinstance(encoded, bytes)
+    assert json.loads(encoded) == payload
+
+def test_unknown_encoder_is_rejected():
+    with pytest.raises(ValueError):
+        get_encoder('yaml')
+
+def test_list_response_is_the_same_with_either_encoder(app, client, token, monkeypatch):
+    headers = {'Authorization': f'Bearer {token}'}
+    for i in range(3):
+        client.post('/expenses', headers=headers, json={'amount': 10.05 * (i + 1), 'description': f'Item {i}', 'date': f'2024-05-0{i + 1}',
+                                                        'category': 'Food', 'recurrence_flag': 'monthly'})
+    bodies = []
+    for name in ('json', 'auto'):  # auto is orjson when installed
+        monkeypatch.setitem(app.extensions, 'json_encoder', get_encoder(name))
+        response = client.get('/expenses?limit=2', headers=headers)
+        assert response.status_code == 200
+        bodies.append(response.get_json())
+    assert bodies[0] == bodies[1]
+    assert [e['amount'] for e in bodies[0]['expenses']] == [30.15, 20.1]
+    assert bodies[0]['next_cursor']
+
+def test_get_expense_includes_every_field(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    created = client.post('/expenses', headers=headers, json={'amount': 7, 'description': 'Lunch', 'date': '2024-05-01',
+                                                              'category': 'Food', 'recurrence_flag': 'weekly'}).get_json()
+    response = client.get(f"/expenses/{created['id']}", headers=headers)
+    assert response.get_json() == created
+    assert list(created) == list(Expense.FIELDS)
@@ -0,0 +1,113 @@
+import sqlite3
+import pytest
+from app.sharding import SHARD_ID_SPAN, move_user, plan_rebalance
+
+@pytest.fixture
+def sharded_app(file_app, tmp_path):
+    return file_app(DATABASE_URL=str(tmp_path / 'users.db'), DATABASE_SHARDS=[str(tmp_path / 'shard0.db'), str(tmp_path / 'shard1.db')],
+                    RESPONSE_CACHE_BACKEND='memory')
+
+@pytest.fixture
+def client(sharded_app):
+    return sharded_app.test_client()
+
+def rows(path, query, *params):
+    db = sqlite3.connect(path)
+    try:
+        return db.execute(query, params).fetchall()
+    finally:
+        db.close()
+
+def test_users_are_routed_to_their_shard(sharded_app, client, token, register_user, login_user, create_expense):
+    shards = sharded_app.config['DATABASE_SHARDS']
+    register_user('bob', 'secret')  # user ids 1 (testuser) and 2
+    bob_token = login_user('bob', 'secret').get_json()['access_token']
+    alice, bob = {'Authorization': f'Bearer {token}'}, {'Authorization': f'Bearer {bob_token}'}
+    alice_id = create_expense(token, 10, description='Lunch', category='Food', recurrence_flag='monthly').get_json()['id']
+    bob_id = create_expense(bob_token, 20, description='Lunch', category='Food', recurrence_flag='monthly').get_json()['id']
+
+    assert rows(sharded_app.config['DATABASE_URL'], 'SELECT id, shard FROM users') == [(1, 1), (2, 0)]
+    assert rows(shards[1], 'SELECT id, user_id FROM expenses') == [(alice_id, 1)]
+    assert rows(shards[0], 'SELECT id, user_id FROM expenses') == [(bob_id, 2)]
+    assert rows(sharded_app.config['DATABASE_URL'], 'SELECT COUNT(*) FROM expenses') == [(0,)]
+    # Each shard hands out ids from its own range.
+    assert SHARD_ID_SPAN < alice_id < 2 * SHARD_ID_SPAN and bob_id < SHARD_ID_SPAN
+
+    assert [e['amount'] for e in client.get('/expenses', headers=alice).get_json()] == [10]
+    assert client.get('/reports/expenses', headers=bob).get_json() == {'Food': 20}
+    assert client.get(f'/expenses/{alice_id}', headers=alice).get_json()['amount'] == 10
+    assert client.get(f'/expenses/{alice_id}', headers=bob).status_code == 204
+    assert client.get('/expenses/search?q=lunch', headers=alice).get_json()['expenses'][0]['id'] == alice_id
+
+def test_shard_lookups_are_cached(sharded_app, client, token, create_expense):
+    router = sharded_app.extensions['db_shards']
+    alice = {'Authorization': f'Bearer {token}'}
+    create_expense(token, 10, recurrence_flag='monthly')
+    assert router.cached_shard(1) == 1
+
+    # Requests use the cached shard without asking the directory, until the entry goes.
+    db = sqlite3.connect(sharded_app.config['DATABASE_URL'])
+    db.execute('UPDATE users SET shard = 0 WHERE id = 1')
+    db.commit()
+    db.close()
+    assert len(client.get('/expenses', headers=alice).get_json()) == 1
+    router.forget_shard(1)
+    assert client.get('/expenses', headers=alice).get_json() == []
+    assert router.cached_shard(1) == 0
+
+def test_move_user_renumbers_and_rebuilds_derived_tables(sharded_app, client, token, create_expense):
+    shards = sharded_app.config['DATABASE_SHARDS']
+    alice = {'Authorization': f'Bearer {token}'}
+    ids = [create_expense(token, amount, description='Lunch', date=f'2024-05-0{day}', recurrence_flag='monthly').get_json()['id']
+           for day, amount in ((1, 10), (2, 2.5))]
+    sharded_app.extensions['db_shards'].connect(1).execute('UPDATE expenses SET template_id = ? WHERE id = ?', ids).connection.commit()
+    before = client.get('/expenses', headers=alice)
+
+    assert move_user(sharded_app.config['DATABASE_URL'], sharded_app.extensions['db_shards'], 1, 0) == 2
+    assert rows(shards[1], 'SELECT COUNT(*) FROM expenses') == [(0,)]
+    assert rows(shards[1], 'SELECT COUNT(*) FROM expense_daily_totals') == [(0,)]
+    new_ids = [row[0] for row in rows(shards[0], 'SELECT id FROM expenses ORDER BY id')]
+    assert new_ids == [1, 2]
+    assert rows(shards[0], 'SELECT template_id FROM expenses WHERE id = 2') == [(1,)]
+    assert rows(shards[0], 'SELECT day, total FROM expense_daily_totals ORDER BY day') == [('2024-05-01', 1000), ('2024-05-02', 250)]
+    assert rows(sharded_app.config['DATABASE_URL'], 'SELECT shard FROM users WHERE id = 1') == [(0,)]
+
+    # Same data under new ids and a new version, so the ETag and cache key change.
+    after = client.get('/expenses', headers=alice)
+    assert [{**e, 'id': None} for e in after.get_json()] == [{**e, 'id': None} for e in before.get_json()]
+    assert [e['id'] for e in after.get_json()] == [2, 1]
+    assert after.headers['ETag'] != before.headers['ETag']
+    assert client.get('/expenses/search?q=lunch', headers=alice).get_json()['expenses'][0]['id'] in new_ids
+    # New expenses keep coming from the new shard's range.
+    assert create_expense(token, 1, recurrence_flag='monthly').get_json()['id'] == 3
+
+def test_plan_rebalance_fills_a_new_shard():
+    loads = [{1: 50, 2: 30, 3: 20}, {4: 40, 5: 10}, {}]
+    moves = plan_rebalance(loads)
+    totals = [sum(shard.values()) for shard in loads]
+    for user_id, source, target in moves:
+        count = loads[source].pop(user_id)
+        loads[target][user_id] = count
+        totals[source] -= count
+        totals[target] += count
+    assert moves[0] == (1, 0, 2)
+    assert max(totals) - min(totals) <= 10
+    assert plan_rebalance(loads) == []
+
+def test_shards_cli(sharded_app, register_user, login_user, create_expense):
+    for name, count in (('alice', 5), ('bob', 1), ('carol', 1)):  # shards 1, 0, 1
+        register_user(name, 'secret')
+        user_token = login_user(name, 'secret').get_json()['access_token']
+        for _ in range(count):
+            assert create_expense(user_token, 1, recurrence_flag='monthly').status_code == 201
+    runner = sharded_app.test_cli_runner()
+    with sharded_app.app_context():  # the CLI would otherwise reuse the session app's context
+        result = runner.invoke(args=['shards', 'status'])
+        assert 'users=1  expenses=1' in result.output and 'users=2  expenses=6' in result.output
+
+        result = runner.invoke(args=['shards', 'rebalance'])
+        assert result.exit_code == 0, result.output
+        assert '1 users moved.' in result.output
+        status = runner.invoke(args=['shards', 'status']).output
+    # Carol joins bob; alice alone is too big to move without making things worse.
+    assert 'users=2  expenses=2' in status and 'users=1  expenses=5' in status
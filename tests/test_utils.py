@@ -1,5 +1,5 @@
 import pytest
-from app.utils import validate_date_format, convert_to_iso
+from app.utils import validate_date_format, convert_to_iso, encode_cursor, decode_cursor
 
 # Tests for validate_date_format
 def test_validate_date_format_valid_datetime():
@@ -33,4 +33,23 @@ def test_convert_to_iso_invalid_input():
     with pytest.raises(ValueError):  # Expect a ValueError
         convert_to_iso('invalid-date')
     with pytest.raises(ValueError):
-        convert_to_iso('2024-13-01')  # Invalid month
\ No newline at end of file
+        convert_to_iso('2024-13-01')  # Invalid month
+
+
+# Tests for encode_cursor / decode_cursor
+def test_cursor_round_trip():
+    cursor = encode_cursor(1704112496, 42)
+    assert decode_cursor(cursor) == (1704112496, 42)
+
+def test_decode_cursor_invalid_input():
+    with pytest.raises(ValueError):
+        decode_cursor('not-a-cursor')
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(1704067200, 1)[:-3])
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor('2024-01-01', 1))
+    # Positions beyond SQLite's 64-bit integers could not be bound to the query.
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(2 ** 63, 1))
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(1704067200, -2 ** 63 - 1))